@@ -0,0 +1,80 @@
+"""Alert traffic under a fleet-wide fault storm: one alert per reading vs alert episodes.
+
+Simulates --machines machines reporting at 1 Hz for --seconds, healthy
+except for a storm in the middle third: every machine's risk hovers
+around the alert threshold (so it keeps crossing it) with frequent
+anomalies. The same readings go through
+  per_reading  the old behaviour, one JSON alert per reading with an
+               anomaly or risk > 0.6
+  episodes     twin/alerts.py AlertManager with twin_engine's settings,
+               on a simulated clock
+and the messages and bytes each would publish are counted.
+
+    python benchmarks/bench_alerts.py --machines 1000 --seconds 900
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "twin"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--machines", type=int, default=1000)
+    parser.add_argument("--seconds", type=int, default=900)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from alerts import AlertManager
+    rng = np.random.default_rng(args.seed)
+    clock = [0.0]
+    manager = AlertManager(0.6, 0.4, 5, 60.0, 5.0, clock=lambda: clock[0])
+    machine_ids = [f"machine{i + 1}" for i in range(args.machines)]
+    start = datetime(2026, 1, 1)
+    old = {"messages": 0, "bytes": 0}
+    new = {"messages": 0, "bytes": 0, "largest_bytes": 0}
+
+    def publish(topic, payload):
+        new["messages"] += 1
+        new["bytes"] += len(payload)
+        new["largest_bytes"] = max(new["largest_bytes"], len(payload))
+
+    cpu = 0.0
+    for t in range(args.seconds):
+        clock[0] = float(t)
+        storm = args.seconds // 3 <= t < 2 * args.seconds // 3
+        risk = rng.normal(0.6, 0.12, args.machines) if storm else rng.uniform(0, 0.3, args.machines)
+        anomaly = rng.random(args.machines) < (0.3 if storm else 0.001)
+        timestamp = (start + timedelta(seconds=t)).isoformat()
+        rows = [{"timestamp": timestamp, "machine_id": m, "anomaly": bool(a), "risk_score": float(r)}
+                for m, a, r in zip(machine_ids, anomaly, risk)]
+        for row in rows:
+            if row["anomaly"] or row["risk_score"] > 0.6:
+                old["messages"] += 1
+                old["bytes"] += len(json.dumps(row))
+        began = time.process_time()
+        manager.observe(rows)
+        manager.flush(publish)
+        cpu += time.process_time() - began
+    clock[0] += 60
+    manager.flush(publish, force=True)
+
+    print(json.dumps({
+        "machines": args.machines,
+        "seconds": args.seconds,
+        "per_reading": old,
+        "episodes": dict(new, counts=manager.counts, cpu_us_per_reading=cpu / (args.machines * args.seconds) * 1e6),
+        "message_reduction": old["messages"] / max(1, new["messages"]),
+        "byte_reduction": old["bytes"] / max(1, new["bytes"]),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
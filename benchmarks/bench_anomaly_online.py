@@ -0,0 +1,79 @@
+"""Per-reading latency of the online anomaly detector against the IsolationForest path.
+
+Streams synthetic readings one at a time (the engine's per-message case)
+through:
+  sklearn   IsolationForest.predict, the original is_anomaly path
+  flat      AnomalyDetector.is_anomaly on the flattened forest
+  online    AnomalyDetector(mode="online").is_anomaly, score + update
+
+and reports p50/p99 latency plus the share of normal and of injected
+fault readings flagged.
+
+    python benchmarks/bench_anomaly_online.py --readings 20000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "twin"))
+
+import numpy as np
+
+import anomaly_detector
+
+MEAN = np.array([60.0, 3.0, 1400.0, 9.0, 75.0])
+STD = np.array([4.0, 0.8, 80.0, 1.0, 8.0])
+
+
+def readings(n, fault_rate, rng):
+    X = MEAN + STD * rng.standard_normal((n, len(MEAN)))
+    faults = rng.random(n) < fault_rate
+    # faults: a few signals pushed 4-8 sigma off
+    shift = rng.uniform(4, 8, (n, len(MEAN))) * STD * (rng.random((n, len(MEAN))) < 0.4)
+    X[faults] += shift[faults]
+    return X, faults
+
+
+def timed(fn, X):
+    times = np.empty(len(X))
+    flags = np.empty(len(X), dtype=bool)
+    for i, x in enumerate(X):
+        start = time.perf_counter()
+        flags[i] = fn(x)
+        times[i] = time.perf_counter() - start
+    return times, flags
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readings", type=int, default=20000)
+    parser.add_argument("--train", type=int, default=5000)
+    parser.add_argument("--fault-rate", type=float, default=0.01)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    train, _ = readings(args.train, 0.0, rng)
+    X, faults = readings(args.readings, args.fault_rate, rng)
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        anomaly_detector.MODEL_DIR = model_dir
+        batch = anomaly_detector.AnomalyDetector()
+        batch.fit(train)
+        online = anomaly_detector.AnomalyDetector("machine1", mode="online")
+        online.fit(train)
+
+        candidates = [
+            ("sklearn", lambda x: batch.model.predict(x[None, :])[0] == -1),
+            ("flat", lambda x: batch.is_anomaly(x[None, :])[0]),
+            ("online", lambda x: online.is_anomaly(x[None, :])[0]),
+        ]
+        for name, fn in candidates:
+            times, flags = timed(fn, X)
+            print(f"{name:8s} p50 {np.percentile(times, 50) * 1e6:8.1f} us   p99 {np.percentile(times, 99) * 1e6:8.1f} us   "
+                  f"flagged: normal {flags[~faults].mean():6.2%}  faults {flags[faults].mean():6.2%}")
+
+
+if __name__ == "__main__":
+    main()
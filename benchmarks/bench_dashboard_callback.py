@@ -0,0 +1,94 @@
+"""CPU time and serialized response size of the dashboard's live callback (update_dashboard).
+
+Loads a temporary copy of dashboard/app.py with a live ring
+(twin/live_buffer.py) standing in for the engine and ticks --sessions
+browsers --ticks times in each scenario:
+  new_reading   one new row of LIVE_MACHINE_ID with new values per tick
+  same_reading  one new row per tick repeating the previous values
+  idle          no new rows
+First loads (a session's first tick) are reported separately. Response
+bytes are what Dash would send: outputs left as no_update are dropped.
+
+    python benchmarks/bench_dashboard_callback.py --sessions 4 --ticks 200
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bench_pipeline import build_tree, response_bytes
+
+
+def load_app(root):
+    import importlib.util
+    spec = importlib.util.spec_from_file_location("dashboard_app", os.path.join(root, "dashboard", "app.py"))
+    app = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = app
+    spec.loader.exec_module(app)
+    return app
+
+
+def summary(cpu, sizes):
+    return {"n": len(cpu), "cpu_us_p50": statistics.median(cpu) * 1e6, "cpu_us_mean": statistics.mean(cpu) * 1e6,
+            "bytes_mean": statistics.mean(sizes), "bytes_p50": statistics.median(sizes)}
+
+
+def run(root, args):
+    from dash import no_update
+    sys.path.insert(0, os.path.join(root, "twin"))
+    from live_buffer import LiveRing
+    os.chdir(root)
+    ring = LiveRing(os.path.join(root, "data", "live.ring"), 4096, create=True)
+    app = load_app(root)
+    rng = np.random.default_rng(0)
+    reading = {"machine_id": "machine1", "temperature": 70.0, "vibration": 3.0, "rpm": 1500.0, "current": 12.0,
+               "load": 50.0, "risk_score": 0.1}
+    stores = [None] * args.sessions
+    first = ([], [])
+    results = {}
+
+    def tick(session, out):
+        start = time.process_time()
+        outputs = app.update_dashboard(0, stores[session])
+        cpu = time.process_time() - start
+        target = first if stores[session] is None else out
+        target[0].append(cpu)
+        target[1].append(response_bytes(outputs))
+        if outputs[-1] is not no_update:
+            stores[session] = outputs[-1]
+
+    ring.write([reading] * 20)  # history for the first load
+    for scenario in ("new_reading", "same_reading", "idle"):
+        out = ([], [])
+        for _ in range(args.ticks):
+            if scenario == "new_reading":
+                reading = dict(reading, temperature=70 + rng.normal(), vibration=3 + rng.normal(0, 0.1),
+                               rpm=1500 + rng.normal(0, 20), current=12 + rng.normal(0, 0.2),
+                               risk_score=float(rng.uniform(0, 0.5)))
+            if scenario != "idle":
+                ring.write([reading])
+            for session in range(args.sessions):
+                tick(session, out)
+        results[scenario] = summary(*out)
+    results["first_load"] = summary(*first)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--ticks", type=int, default=200)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as root:
+        build_tree(root)
+        results = run(root, args)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
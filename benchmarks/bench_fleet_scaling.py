@@ -0,0 +1,116 @@
+"""Throughput of the sharded scorer pool from 1 to N worker processes.
+
+Trains a fleet model into a temporary model directory, then pushes
+batches of readings from many machines through ScorerPool and reports
+rows/second per worker count (0 = score in the calling process).
+
+    python benchmarks/bench_fleet_scaling.py --machines 500 --rows 200000 --max-workers 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "twin"))
+
+import numpy as np
+import pandas as pd
+
+import anomaly_detector
+import fleet
+import predictive_maintenance
+
+
+def synthetic_frame(n, rng):
+    return pd.DataFrame({
+        "temperature": rng.uniform(50, 85, n),
+        "vibration": rng.uniform(1, 8, n),
+        "rpm": rng.integers(1000, 2000, n),
+        "current": rng.uniform(5, 15, n),
+        "load": rng.integers(50, 100, n),
+    })
+
+
+def train_fleet_models(rng):
+    df = synthetic_frame(5000, rng)
+    predictor = predictive_maintenance.PredictiveMaintenance()
+    predictor.train(df)
+    detector = anomaly_detector.AnomalyDetector()
+    detector.fit(df[predictive_maintenance.FEATURES].values)
+    detector.save()
+
+
+def make_batches(n_rows, n_machines, batch_size, rng):
+    df = synthetic_frame(n_rows, rng)
+    X = df[predictive_maintenance.FEATURES].values.astype(float)
+    machines = [f"machine{i}" for i in rng.integers(0, n_machines, n_rows)]
+    batches = []
+    for start in range(0, n_rows, batch_size):
+        rows = [{"machine_id": m} for m in machines[start:start + batch_size]]
+        batches.append((rows, X[start:start + batch_size]))
+    return batches
+
+
+def run_in_process(batches):
+    models = fleet.MachineModels(reload_seconds=3600)
+    start = time.perf_counter()
+    for rows, X in batches:
+        fleet.score_rows(models, [r["machine_id"] for r in rows], X)
+    return time.perf_counter() - start
+
+
+def run_pool(batches, n_workers):
+    done = threading.Event()
+    progress = {"seen": 0, "target": 0}
+
+    def on_result(rows, anomalies, risks, versions, estimates):
+        progress["seen"] += len(rows)
+        if progress["seen"] >= progress["target"]:
+            done.set()
+
+    def run(work):
+        progress["seen"], progress["target"] = 0, sum(len(rows) for rows, _ in work)
+        done.clear()
+        start = time.perf_counter()
+        for rows, X in work:
+            pool.submit(rows, X)
+        done.wait()
+        return time.perf_counter() - start
+
+    pool = fleet.ScorerPool(n_workers, on_result, reload_seconds=3600)
+    # warm-up: every worker loads its models before timing starts
+    run([([{"machine_id": f"warm{i}"} for i in range(n_workers * 20)], np.zeros((n_workers * 20, 5)))])
+    elapsed = run(batches)
+    pool.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--machines", type=int, default=500)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as model_dir:
+        for module in (anomaly_detector, predictive_maintenance, fleet):
+            module.MODEL_DIR = model_dir
+        train_fleet_models(rng)
+        batches = make_batches(args.rows, args.machines, args.batch_size, rng)
+
+        elapsed = run_in_process(batches)
+        print(f"workers=0  {args.rows / elapsed:12,.0f} rows/s")
+        baseline = None
+        for n_workers in range(1, args.max_workers + 1):
+            elapsed = run_pool(batches, n_workers)
+            rate = args.rows / elapsed
+            baseline = baseline or rate
+            print(f"workers={n_workers}  {rate:12,.0f} rows/s  ({rate / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
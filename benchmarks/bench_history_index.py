@@ -0,0 +1,90 @@
+"""Query cost of the history index (twin/history_index.py) against history size.
+
+Writes CSV histories of each size through CsvStorage (so the index is
+built as the engine builds it: one block per flush of 256 rows), then
+times, per size:
+  latest     the newest row of one machine (what GET /latest serves)
+  last_n     the latest --last rows of one machine
+  window     one machine's rows in a 10 minute window mid-history
+  full_scan  pd.read_csv of the whole file, what every consumer did before
+and the bytes the 3D view transfers per poll (one row of JSON vs the CSV).
+
+    python benchmarks/bench_history_index.py --sizes 50000 200000 800000 --machines 10
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "twin"))
+
+
+def best_ms(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def write_history(path, rows, machines):
+    from datetime import datetime
+    from storage import CsvStorage
+    storage = CsvStorage(path, flush_rows=256, flush_seconds=3600)
+    start = time.time() - rows // machines
+    for i in range(0, rows, 256):
+        storage.append_many([{
+            "timestamp": datetime.utcfromtimestamp(start + j // machines).isoformat(), "temperature": 70.0,
+            "vibration": 3.0, "rpm": 1500, "current": 12.0, "load": 50, "anomaly": False, "risk_score": 0.1,
+            "machine_id": f"machine{j % machines + 1}", "model_version": 1,
+        } for j in range(i, min(rows, i + 256))])
+    storage.close()
+    return start
+
+
+def bench_size(directory, rows, args):
+    import pandas as pd
+    from history_index import HistoryIndex
+    path = os.path.join(directory, f"history-{rows}.csv")
+    start = time.perf_counter()
+    t_first = write_history(path, rows, args.machines)
+    write_s = time.perf_counter() - start
+    start = time.perf_counter()
+    index = HistoryIndex(path)
+    index.refresh()
+    load_ms = (time.perf_counter() - start) * 1000
+    middle = t_first + rows // args.machines / 2
+    latest = index.last(1, "machine1")
+    return {
+        "rows": rows,
+        "csv_bytes": os.path.getsize(path),
+        "index_bytes": os.path.getsize(path + ".idx"),
+        "write_s": write_s,
+        "index_load_ms": load_ms,
+        "latest_ms": best_ms(lambda: index.last(1, "machine1"), args.repeats),
+        "last_n_ms": best_ms(lambda: index.last(args.last, "machine1"), args.repeats),
+        "window_ms": best_ms(lambda: index.between(middle, middle + 600, "machine1"), args.repeats),
+        "full_scan_ms": best_ms(lambda: pd.read_csv(path), 1),
+        "latest_response_bytes": len(latest.to_json(orient="records")[1:-1]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50000, 200000, 800000])
+    parser.add_argument("--machines", type=int, default=10)
+    parser.add_argument("--last", type=int, default=1000)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = [bench_size(directory, rows, args) for rows in args.sizes]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
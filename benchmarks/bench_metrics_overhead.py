@@ -0,0 +1,152 @@
+"""Cost of the engine's instrumentation (twin/metrics.py) and of per-message printing.
+
+Micro: nanoseconds per Counter.inc, Histogram.observe, a suppressed
+RateLimitedLog.log and a printed status line (to /dev/null, so a lower
+bound for a terminal).
+
+Pipeline: pushes the same messages through twin_engine's real stages as
+fast as they drain, interleaving three variants:
+  baseline   Pipeline without a metrics registry, rate-limited status lines
+  metrics    Pipeline exporting to a registry (stage histograms, per-row
+             end-to-end latency) - the overhead that must stay small
+  print_all  the old behaviour, one printed status line per message
+The engine's own score timings and alert counter are on in all variants.
+Throughput is the best of the repeats; metrics_expected_pct is the
+overhead predicted from the micro numbers, a check on noisy machines.
+Runs in a temporary copy of the tree like bench_pipeline.py.
+
+    python benchmarks/bench_metrics_overhead.py --messages 20000 --repeats 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_pipeline import ROOT, FakeBroker, FakeMqttClient, build_tree, train_models
+
+
+def per_call_ns(fn, n=200000):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e9
+
+
+def micro(te):
+    from metrics import Counter, Histogram, RateLimitedLog
+    counter, histogram, log = Counter("c", ""), Histogram("h", ""), RateLimitedLog(3600)
+    log.log(lambda: "first line")
+    row = {"machine_id": "machine1", "temperature": 71.2, "vibration": 3.1, "rpm": 1500, "risk_score": 0.12}
+    return {
+        "counter_inc_ns": per_call_ns(counter.inc),
+        "histogram_observe_ns": per_call_ns(lambda: histogram.observe(0.0042)),
+        "rate_limited_log_suppressed_ns": per_call_ns(lambda: log.log(lambda: te.status_line(row))),
+        "print_status_line_ns": per_call_ns(lambda: print(te.status_line(row)), 50000),
+    }
+
+
+def drain(te, messages, metrics, alert):
+    import asyncio
+    import threading
+
+    def feed():
+        while te.pipeline.loop is None:
+            time.sleep(0.001)
+        done["start"] = time.perf_counter()
+        for topic, payload in messages:
+            client.on_message(client, None, FakeMessage(topic, payload))
+        while te.pipeline.latency.items < len(messages):
+            time.sleep(0.001)
+        done["end"] = time.perf_counter()
+        te.pipeline.stop()
+
+    class FakeMessage:
+        def __init__(self, topic, payload):
+            self.topic, self.payload = topic, payload
+
+    done = {}
+    client = FakeMqttClient(FakeBroker())
+    client.on_message = te.on_message
+    te.pipeline = te.Pipeline(te.parse_message, te.score_batch, te.persist_rows, lambda rows: alert(client, rows),
+                              len(messages) + 1, te.BATCH_MAX_ROWS, te.BATCH_MAX_WAIT_MS, metrics=metrics)
+    threading.Thread(target=feed, daemon=True).start()
+    asyncio.run(te.pipeline.run())
+    return len(messages) / (done["end"] - done["start"])
+
+
+def print_all(te):
+    def alert(client, rows):
+        for data_row in rows:
+            status = te.status_line(data_row)
+            if data_row["anomaly"]:
+                status += "  ⚠️ ANOMALY"
+            print(status)
+        te.publish_alerts(client, rows)
+    return alert
+
+
+def child(args):
+    root = args.child
+    sys.path.insert(0, os.path.join(root, "twin"))
+    sys.path.insert(0, os.path.join(ROOT, "sensors"))
+    from fleet_load_generator import FleetSimulator
+    sim = FleetSimulator(args.machines, seed=0)
+    train_models(sim, 5000)
+    import twin_engine as te
+    from metrics import MetricsRegistry
+
+    messages = []
+    while len(messages) < args.messages:
+        X, _ = sim.step()
+        messages += [(f"factory/{m}/sensors", p.encode()) for m, p in zip(sim.machine_ids, sim.payloads(X))]
+    messages = messages[:args.messages]
+
+    variants = {
+        "baseline": lambda: drain(te, messages, None, te.publish_alerts),
+        "metrics": lambda: drain(te, messages, MetricsRegistry(), te.publish_alerts),
+        "print_all": lambda: drain(te, messages, None, print_all(te)),
+    }
+    variants["baseline"]()  # warm up models, feature state and the storage file
+    rates = {name: [] for name in variants}
+    for _ in range(args.repeats):
+        for name, run in variants.items():
+            rates[name].append(run())
+    # best of the repeats: scheduling noise only ever makes a run slower
+    results = {"micro": micro(te), "pipeline_msgs_s": {name: max(r) for name, r in rates.items()},
+               "pipeline_msgs_s_median": {name: statistics.median(r) for name, r in rates.items()}}
+    base = results["pipeline_msgs_s"]["baseline"]
+    results["overhead_pct"] = {name: 100 * (base / rate - 1) for name, rate in results["pipeline_msgs_s"].items()
+                               if name != "baseline"}
+    # per message the metrics variant adds a parse and an end-to-end observation, plus 3 per batch
+    observations = 2 + 3 / te.BATCH_MAX_ROWS
+    results["metrics_expected_pct"] = 100 * observations * results["micro"]["histogram_observe_ns"] * 1e-9 * base
+    with open(os.path.join(root, "results.json"), "w") as f:
+        json.dump(results, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--machines", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+    with tempfile.TemporaryDirectory() as root:
+        build_tree(root)
+        subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--child", root], check=True,
+                       stdout=subprocess.DEVNULL)
+        with open(os.path.join(root, "results.json")) as f:
+            results = json.load(f)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
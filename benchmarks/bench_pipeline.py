@@ -0,0 +1,402 @@
+"""End-to-end benchmark of the twin pipeline against an in-process MQTT stand-in.
+
+Copies the engine and dashboard into a temporary tree, trains starting
+models there on simulated fleet history, and runs everything in a child
+process so no data or models are left in the repository. No broker is
+needed: FakeMqttClient routes publishes to matching subscribers in-process,
+so the fleet simulator (sensors/fleet_load_generator.py) publishes straight
+into twin_engine.on_message and the engine's alert publishes land back in
+the fake broker.
+
+Reported, as JSON:
+  components  p50/p99 per call of parse_message, is_anomaly (1 and 64 rows),
+              predict_single, score_batch (64 rows) and append_row
+  end_to_end  receive-to-alert latency p50/p99, throughput, drops and RSS
+              growth at the target rate
+  retrain     retrain_full and the incremental trainer's cycles (what
+              retrain_loop runs) at each history size
+  dashboard   update_dashboard callback p50/p99 and response size per tick
+              for several open sessions, motor stopped and running
+
+Save a run with --output and compare a later commit with --baseline:
+
+    python benchmarks/bench_pipeline.py --output before.json
+    python benchmarks/bench_pipeline.py --baseline before.json --rate 10000 --history 1000,10000,50000
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def percentiles(seconds):
+    import numpy as np
+    ms = np.asarray(seconds, dtype=float) * 1000
+    if not len(ms):
+        return {"n": 0}
+    return {"n": len(ms), "p50_ms": float(np.percentile(ms, 50)), "p99_ms": float(np.percentile(ms, 99)),
+            "max_ms": float(ms.max())}
+
+
+def rss_mb():
+    # current resident set size; peak (ru_maxrss) where /proc is unavailable
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def timed(fn, args_list):
+    times = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    return percentiles(times)
+
+
+class FakeBroker:
+    def __init__(self):
+        self.subscriptions = []
+        self.published = 0
+
+    def deliver(self, topic, payload):
+        from paho.mqtt.client import topic_matches_sub
+        self.published += 1
+        if isinstance(payload, str):
+            payload = payload.encode()
+        for pattern, client in self.subscriptions:
+            if client.on_message is not None and topic_matches_sub(pattern, topic):
+                client.on_message(client, None, _Message(topic, payload))
+
+
+class _Message:
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+class FakeMqttClient:
+    """The part of paho's Client the engine and simulator use, delivering synchronously."""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.on_connect = None
+        self.on_message = None
+
+    def connect(self, host, port=1883, keepalive=60):
+        if self.on_connect is not None:
+            self.on_connect(self, None, {}, 0)
+
+    def subscribe(self, topic):
+        self.broker.subscriptions.append((topic, self))
+
+    def publish(self, topic, payload, retain=False):
+        self.broker.deliver(topic, payload)
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+
+class FakeSink:
+    # fleet_load_generator sink publishing through a FakeMqttClient
+    def __init__(self, client):
+        self.client = client
+        self.sent = 0
+
+    def send(self, machine_ids, payloads):
+        self.sent += len(payloads)
+        for machine_id, payload in zip(machine_ids, payloads):
+            self.client.publish(f"factory/{machine_id}/sensors", payload)
+
+    def send_batch(self, batch):
+        import wire
+        self.sent += len(batch)
+        self.client.publish(wire.BATCH_TOPIC, wire.encode(batch))
+
+    def close(self):
+        pass
+
+
+def history_frame(sim, n):
+    import pandas as pd
+    from fleet_load_generator import SIGNALS
+    frames, done = [], 0
+    while done < n:
+        X, _ = sim.step()
+        frame = pd.DataFrame(X[:n - done], columns=list(SIGNALS))
+        frame["machine_id"] = sim.machine_ids[:n - done]
+        frames.append(frame)
+        done += len(frame)
+    df = pd.concat(frames, ignore_index=True)
+    df["timestamp"] = pd.Timestamp.now("UTC").tz_localize(None).isoformat()
+    df["rpm"] = df["rpm"].round().astype(int)
+    df["load"] = df["load"].round().astype(int)
+    df["anomaly"] = False
+    df["risk_score"] = 0.0
+    df["model_version"] = 0
+    return df
+
+
+def train_models(sim, n):
+    from anomaly_detector import AnomalyDetector
+    from features import ALL_FEATURES, MachineFeatures
+    from predictive_maintenance import FEATURES, PredictiveMaintenance
+    df = history_frame(sim, n)
+    PredictiveMaintenance(feature_names=ALL_FEATURES).train(MachineFeatures().transform_frame(df, "machine1"))
+    detector = AnomalyDetector()
+    detector.fit(df[FEATURES].values)
+    detector.save()
+
+
+def bench_components(te, sim, n):
+    import numpy as np
+    from features import ALL_FEATURES, MachineFeatures
+    X = np.vstack([sim.step()[0] for _ in range(-(-n // sim.n))])[:n]
+    payloads = [p.encode() for first in range(0, n, sim.n) for p in sim.payloads(X[first:first + sim.n])]
+    topics = [f"factory/{sim.machine_ids[i % sim.n]}/sensors" for i in range(n)]
+    rows = [te.parse_message(t, p, time.monotonic()) for t, p in zip(topics, payloads)]
+    samples = [dict(zip(ALL_FEATURES, x)) for x in
+               MachineFeatures().transform([r["machine_id"] for r in rows], X).tolist()]
+    predictor = te.registry.current().model
+    scored = [dict(r, anomaly=False, risk_score=0.0, model_version=0) for r in rows]
+    batches = [rows[i:i + 64] for i in range(0, n - 63, 64)]
+    return {
+        "parse_message": timed(te.parse_message, [(t, p, 0.0) for t, p in zip(topics, payloads)]),
+        "is_anomaly": timed(te.anomaly_detector.is_anomaly, [(X[i:i + 1],) for i in range(n)]),
+        "is_anomaly_64": timed(te.anomaly_detector.is_anomaly, [(X[i:i + 64],) for i in range(0, n - 63, 64)]),
+        "predict_single": timed(predictor.predict_single, [(s,) for s in samples]),
+        "score_batch_64": timed(te.score_batch, [([dict(r) for r in b],) for b in batches]),
+        "append_row": timed(te.append_row, [(r,) for r in scored]),
+    }
+
+
+def bench_end_to_end(te, sim, rate, duration, fmt="json"):
+    import asyncio
+    import threading
+    from fleet_load_generator import run
+
+    broker = FakeBroker()
+    engine_client = FakeMqttClient(broker)
+    alerts = FakeMqttClient(broker)
+    alert_count = [0]
+    alerts.on_message = lambda client, userdata, msg: alert_count.__setitem__(0, alert_count[0] + 1)
+    alerts.subscribe("factory/+/alerts")
+
+    latencies = []
+    done = {}
+
+    def alert(rows):
+        te.publish_alerts(engine_client, rows)
+        now = time.monotonic()
+        latencies.extend(now - row["received_at"] for row in rows)
+        done["last"] = time.perf_counter()
+
+    def feed():
+        while te.pipeline.loop is None:
+            time.sleep(0.001)
+        sink = FakeSink(FakeMqttClient(broker))
+        done["first"] = time.perf_counter()
+        run(sim, sink, rate, duration, chunk=100, report_seconds=duration + 1, fmt=fmt)
+        done["sent"] = sent = sink.sent
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            snap = te.pipeline.snapshot()
+            if len(latencies) + snap["receive"]["dropped"] + sum(s["errors"] for s in snap.values()) >= sent:
+                break
+            time.sleep(0.01)
+        te.pipeline.stop()
+
+    te.pipeline = te.Pipeline(te.parse_message, te.score_batch, te.persist_rows, alert,
+                              te.PIPELINE_QUEUE_SIZE, te.BATCH_MAX_ROWS, te.BATCH_MAX_WAIT_MS)
+    rss_before = rss_mb()
+    threading.Thread(target=feed, daemon=True).start()
+    asyncio.run(te.run_engine(engine_client))
+    snap = te.pipeline.snapshot()
+    elapsed = done.get("last", done["first"]) - done["first"]
+    result = percentiles(latencies)
+    result.update({
+        "target_rate": rate,
+        "sent": done["sent"],
+        "processed": len(latencies),
+        "dropped": snap["receive"]["dropped"],
+        "errors": sum(s["errors"] for s in snap.values()),
+        "alerts_published": alert_count[0],
+        "throughput_msgs_s": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "rss_mb_before": rss_before,
+        "rss_mb_after": rss_mb(),
+        "rss_mb_growth": rss_mb() - rss_before,
+        "stages_avg_ms": {name: s["avg_ms"] for name, s in snap.items() if name in ("parse", "score", "persist", "alert")},
+    })
+    return result
+
+
+def bench_retrain(te, sim, sizes, cycle_rows):
+    from incremental_training import IncrementalTrainer
+    results = []
+    have = len(te.storage.read())
+    for size in sizes:
+        if size > have:
+            te.storage.append_many(history_frame(sim, size - have).to_dict("records"))
+            te.storage.flush()
+            have = size
+        full = te.retrain_full()
+        trainer = IncrementalTrainer(te.registry, te.storage.tail(), te.RETRAIN_WINDOW_ROWS, te.RETRAIN_TREES_PER_UPDATE)
+        first = trainer.step()
+        te.storage.append_many(history_frame(sim, cycle_rows).to_dict("records"))
+        te.storage.flush()
+        have += cycle_rows
+        cycle = trainer.step()
+        results.append({
+            "history_rows": full["rows_consumed"],
+            "full_s": full["seconds"],
+            "incremental_first_s": first["seconds"],
+            "incremental_cycle_s": cycle["seconds"],
+            "cycle_rows": cycle["rows_consumed"],
+            "trees": cycle["trees"],
+        })
+    return results
+
+
+def response_bytes(outputs):
+    # what Dash would send: outputs left as no_update are not serialized
+    import plotly.utils
+    from dash import no_update
+    return len(json.dumps([o for o in outputs if o is not no_update], cls=plotly.utils.PlotlyJSONEncoder))
+
+
+def bench_dashboard(te, sim, root, calls, sessions):
+    """update_dashboard ticks for `sessions` open browsers, one fleet step of new rows between ticks."""
+    import importlib.util
+    from dash import no_update
+    spec = importlib.util.spec_from_file_location("dashboard_app", os.path.join(root, "dashboard", "app.py"))
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+    columns = ("temperature", "vibration", "rpm", "current", "load")
+    out = {}
+    for running in (False, True):
+        app.motor.update(running=running)
+        seqs = [None] * sessions
+        first, ticks, sizes = [], [], []
+        for i in range(calls + 1):
+            X, _ = sim.step()
+            te.live.write([dict(zip(columns, x), machine_id=m, risk_score=0.1) for m, x in zip(sim.machine_ids, X.tolist())])
+            for s in range(sessions):
+                start = time.perf_counter()
+                outputs = app.update_dashboard(i, seqs[s])
+                (first if seqs[s] is None else ticks).append(time.perf_counter() - start)
+                sizes.append(response_bytes(outputs))
+                if outputs[-1] is not no_update:
+                    seqs[s] = outputs[-1]
+        out["running" if running else "stopped"] = dict(percentiles(ticks), first_load=percentiles(first),
+                                                        response_bytes_p50=sorted(sizes)[len(sizes) // 2])
+    return out
+
+
+def child(args):
+    root = args.child
+    sys.path.insert(0, os.path.join(root, "twin"))
+    sys.path.insert(0, os.path.join(ROOT, "sensors"))
+    from fleet_load_generator import FleetSimulator
+
+    sim = FleetSimulator(args.machines, seed=0)
+    train_models(sim, args.train_rows)
+    import twin_engine as te  # loads the models trained above
+    results = {}
+    if args.history:  # first, while the history holds only the rows written here
+        results["retrain"] = bench_retrain(te, sim, [int(n) for n in args.history.split(",")], args.cycle_rows)
+    results["components"] = bench_components(te, sim, args.calls)
+    results["end_to_end"] = bench_end_to_end(te, sim, args.rate, args.duration, args.format)
+    try:
+        results["dashboard"] = bench_dashboard(te, sim, root, args.dashboard_calls, args.dashboard_sessions)
+    except ImportError as e:
+        results["dashboard"] = {"skipped": str(e)}
+    with open(os.path.join(root, "results.json"), "w") as f:
+        json.dump(results, f)
+
+
+def build_tree(root):
+    for name in ("twin", "dashboard"):
+        shutil.copytree(os.path.join(ROOT, name), os.path.join(root, name),
+                        ignore=shutil.ignore_patterns("__pycache__"))
+
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    rows = [("end_to_end", "p50_ms"), ("end_to_end", "p99_ms"), ("end_to_end", "throughput_msgs_s")]
+    rows += [("components", name) for name in results["components"]]
+    for section, key in rows:
+        new, old = results[section][key], baseline.get(section, {}).get(key)
+        if isinstance(new, dict):
+            new, old = new["p50_ms"], (old or {}).get("p50_ms")
+            key += " p50_ms"
+        if old:
+            print(f"{section:11s} {key:28s} {old:12.3f} -> {new:12.3f}  ({new / old:5.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--machines", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=2000, help="end-to-end target msgs/s")
+    parser.add_argument("--duration", type=float, default=10, help="end-to-end seconds")
+    parser.add_argument("--format", choices=("json", "binary"), default="json",
+                        help="end-to-end payloads: one JSON message per reading or binary batches of 100")
+    parser.add_argument("--calls", type=int, default=2000, help="calls per component")
+    parser.add_argument("--train-rows", type=int, default=5000, help="history for the starting models")
+    parser.add_argument("--history", default="1000,10000,30000", help="history sizes for retrain timing ('' to skip)")
+    parser.add_argument("--cycle-rows", type=int, default=2000, help="new rows per incremental cycle")
+    parser.add_argument("--dashboard-calls", type=int, default=50, help="ticks per dashboard session")
+    parser.add_argument("--dashboard-sessions", type=int, default=4, help="open dashboards sharing the engine's ring")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="earlier results JSON to compare with")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    with tempfile.TemporaryDirectory() as root:
+        build_tree(root)
+        # the engine prints every message: keep that cost, but not on this terminal
+        subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--child", root], check=True,
+                       stdout=subprocess.DEVNULL)
+        with open(os.path.join(root, "results.json")) as f:
+            results = json.load(f)
+    results = {"commit": commit(), "python": sys.version.split()[0], "args": {
+        k: v for k, v in vars(args).items() if k not in ("output", "baseline", "child")}, **results}
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
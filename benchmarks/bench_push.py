@@ -0,0 +1,171 @@
+"""What the 3D view costs the dashboard per motor control event and per telemetry update.
+
+Serves a temporary copy of dashboard/app.py over HTTP, with a live ring
+(twin/live_buffer.py) standing in for the engine, and replays slider
+moves through Dash's own callback endpoint while new telemetry rows land.
+Counts the 3D iframe reloads the control callback triggers (each one
+refetches assets/3d.html and rebuilds the three.js scene; the three.js
+scripts themselves come from a CDN and are not counted) and, if the app
+has a push stream, the events and bytes one subscribed 3D view receives.
+With --workers N the clicks are spread over N dashboard processes and
+every worker is asked for the motor status at the end: they must agree.
+
+    python benchmarks/bench_push.py --events 40 --seconds 10 --workers 2
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+from bench_pipeline import build_tree
+
+
+def load_app(root):
+    import importlib.util
+    spec = importlib.util.spec_from_file_location("dashboard_app", os.path.join(root, "dashboard", "app.py"))
+    app = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = app  # Dash finds assets/ next to the module it is created in
+    spec.loader.exec_module(app)
+    return app
+
+
+def control_callback(base):
+    with urllib.request.urlopen(base + "/_dash-dependencies") as r:
+        dependencies = json.load(r)
+    for dep in dependencies:
+        if any(i["id"] == "rpm-slider" for i in dep["inputs"]):
+            return dep
+    raise RuntimeError("no callback takes the rpm slider")
+
+
+def post_control(base, dep, rpm, changed=("rpm-slider.value",)):
+    output = dep["output"]
+    outputs = [dict(zip(("id", "property"), o.rsplit(".", 1))) for o in output.strip(".").split("...")]
+    values = {"start-btn": 1, "stop-btn": None, "rpm-slider": rpm}
+    body = json.dumps({
+        "output": output,
+        "outputs": outputs if output.startswith("..") else outputs[0],
+        "inputs": [dict(i, value=values.get(i["id"])) for i in dep["inputs"]],
+        "changedPropIds": list(changed),
+        "state": [],
+    }).encode()
+    request = urllib.request.Request(base + "/_dash-update-component", body, {"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as r:
+        raw = r.read()
+    return len(raw), json.loads(raw).get("response", {})
+
+
+class StreamReader(threading.Thread):
+    """Subscribes to an event stream and counts what arrives."""
+
+    def __init__(self, url):
+        super().__init__(daemon=True)
+        self.url = url
+        self.bytes = 0
+        self.events = {}
+        self.counting = False
+
+    def run(self):
+        with urllib.request.urlopen(self.url) as r:
+            for line in r:
+                if self.counting:
+                    self.bytes += len(line)
+                    if line.startswith(b"event:"):
+                        name = line[6:].strip().decode()
+                        self.events[name] = self.events.get(name, 0) + 1
+
+
+def serve(root):
+    """Worker process: one copy of the dashboard app on an ephemeral port (printed)."""
+    import logging
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # no access log line per request
+    os.chdir(root)
+    app = load_app(root)
+    server = make_server("127.0.0.1", 0, app.server, threaded=True)
+    print(server.server_port, getattr(app, "PUSH_PATH", ""), flush=True)
+    server.serve_forever()
+
+
+def run(root, bases, push_path, args):
+    sys.path.insert(0, os.path.join(root, "twin"))
+    from live_buffer import LiveRing
+    ring = LiveRing(os.path.join(root, "data", "live.ring"), 4096, create=True)
+    dep = control_callback(bases[0])
+
+    stream = None
+    if push_path:  # apps from before the push channel have none
+        stream = StreamReader(bases[0] + push_path)
+        stream.start()
+        time.sleep(1.0)  # connected, initial snapshot received
+        stream.counting = True
+
+    reloads = reload_bytes = response_bytes = 0
+    pages = {}
+    interval = args.seconds / args.events
+    for i in range(args.events):
+        ring.write([{"machine_id": "machine1", "temperature": 70 + i % 5, "vibration": 3.0, "rpm": 1400 + 10 * i,
+                     "current": 12.0, "load": 50, "risk_score": 0.1}])
+        base = bases[i % len(bases)]  # clicks land on the workers in turn
+        size, response = post_control(base, dep, 1000 + 10 * i)
+        response_bytes += size
+        src = response.get("3d-iframe", {}).get("src")
+        if src is not None:
+            reloads += 1
+            if src not in pages:
+                with urllib.request.urlopen(base + src) as r:
+                    pages[src] = len(r.read())
+            reload_bytes += pages[src]
+        time.sleep(interval)
+    time.sleep(1.0)  # let the last pushes arrive
+    # what each worker reports now (a callback call with nothing triggered)
+    statuses = [post_control(base, dep, None, changed=())[1]["motor-status"]["children"] for base in bases]
+
+    return {
+        "workers": len(bases),
+        "control_events": args.events,
+        "seconds": args.seconds,
+        "iframe_reloads": reloads,
+        "reload_bytes": reload_bytes,
+        "control_response_bytes": response_bytes,
+        "push_events": dict(stream.events) if stream else None,
+        "push_bytes": stream.bytes if stream else 0,
+        "bytes_per_control_event": (reload_bytes + (stream.bytes if stream else 0)) / args.events,
+        "expected_status_rpm": 1000 + 10 * (args.events - 1),
+        "worker_statuses": statuses,
+        "workers_agree": len(set(statuses)) == 1,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=40)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--workers", type=int, default=1, help="dashboard processes, clicks spread over them")
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve)
+        return
+    with tempfile.TemporaryDirectory() as root:
+        build_tree(root)
+        workers = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", root],
+                                    stdout=subprocess.PIPE, text=True) for _ in range(args.workers)]
+        try:
+            started = [w.stdout.readline().split() for w in workers]
+            bases = [f"http://127.0.0.1:{line[0]}" for line in started]
+            results = run(root, bases, started[0][1] if len(started[0]) > 1 else None, args)
+        finally:
+            for w in workers:
+                w.terminate()
+                w.wait()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
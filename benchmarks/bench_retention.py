@@ -0,0 +1,130 @@
+"""Retention compaction (twin/retention.py): disk, compaction cost and read cost with and without it.
+
+Writes --days of history for --machines machines (one reading every
+--interval seconds each) through CsvStorage into a temporary directory,
+then runs one Compactor pass with the given retention windows and reports:
+  sizes       history bytes before and after (raw CSV, rollup tiers, indexes)
+  compaction  rows folded, buckets written, seconds and rows/s; with
+              --trace-memory the peak Python/NumPy memory of the pass
+              instead (tracing slows it down several times)
+  reads       a 1 h range, the whole history and a retrain-style full
+              read, through History vs pandas over the uncompacted CSV
+Run with a larger --days and --trace-memory to see compaction memory stay flat.
+
+    python benchmarks/bench_retention.py --machines 20 --days 7 --interval 10
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "twin"))
+
+
+def write_history(path, machines, seconds, interval, start):
+    from storage import CsvStorage
+    storage = CsvStorage(path, flush_rows=4096)
+    rng = np.random.default_rng(0)
+    ids = [f"machine{i}" for i in range(machines)]
+    for t in np.arange(start, start + seconds, interval):
+        timestamp = datetime.fromtimestamp(t, timezone.utc).replace(tzinfo=None).isoformat()
+        values = rng.normal([70, 3, 1500, 10, 60], [3, 0.5, 30, 0.5, 5], (machines, 5))
+        storage.append_many([
+            {"timestamp": timestamp, "machine_id": m, "temperature": round(v[0], 2), "vibration": round(v[1], 2),
+             "rpm": int(v[2]), "current": round(v[3], 2), "load": int(v[4]), "anomaly": bool(v[1] > 4.2),
+             "risk_score": round(float(rng.random()), 4), "model_version": 1}
+            for m, v in zip(ids, values.tolist())])
+    storage.flush()
+    return storage
+
+
+def sizes(directory):
+    out = {}
+    for name in sorted(os.listdir(directory)):
+        out[name] = os.path.getsize(os.path.join(directory, name))
+    out["total"] = sum(out.values())
+    return out
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--machines", type=int, default=20)
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument("--interval", type=float, default=10, help="seconds between readings per machine")
+    parser.add_argument("--raw-hours", type=float, default=24, help="raw retention")
+    parser.add_argument("--minute-days", type=float, default=3, help="minute rollup retention")
+    parser.add_argument("--trace-memory", action="store_true")
+    args = parser.parse_args()
+
+    import pandas as pd
+    from retention import Compactor, History
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "machine_live.csv")
+        start = 1_700_000_000.0 // 3600 * 3600
+        seconds = args.days * 86400
+        storage = write_history(path, args.machines, seconds, args.interval, start)
+        now = start + seconds
+        before = sizes(directory)
+        shutil.copy(path, path + ".full")  # uncompacted copy for the "before" reads
+
+        compactor = Compactor(storage, args.raw_hours * 3600, args.minute_days * 86400)
+        if args.trace_memory:
+            tracemalloc.start()
+        stats = compactor.run(now)
+        if args.trace_memory:
+            stats["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        compactor.close()
+        storage.close()
+        after = sizes(directory)
+        after.pop("machine_live.csv.full")
+        after["total"] -= before["machine_live.csv"]
+
+        history = History(path)
+        machine = "machine1"
+        reads = {}
+
+        def read_full(t0, t1):
+            df = pd.read_csv(path + ".full")
+            seconds = pd.to_datetime(df["timestamp"], format="ISO8601").values.astype("datetime64[ns]").astype(np.int64) / 1e9
+            return df[(df["machine_id"] == machine) & (seconds >= t0) & (seconds <= t1)]
+
+        for name, t0, t1 in (("last_hour", now - 3600, now), ("all", -np.inf, np.inf)):
+            full_s, full = timed(lambda: read_full(t0, t1))
+            tiered_s, tiered = timed(lambda: history.between(t0, t1, machine))
+            reads[name] = {"before_s": full_s, "after_s": tiered_s, "before_rows": len(full),
+                           "after_rows": len(tiered), "after_readings": int(tiered["count"].sum()),
+                           "resolutions": sorted(int(r) for r in tiered["resolution"].unique())}
+        full_s, full = timed(lambda: pd.read_csv(path + ".full"))
+        tiered_s, tiered = timed(lambda: history.between(-np.inf, np.inf))
+        reads["retrain_full"] = {"before_s": full_s, "after_s": tiered_s, "before_rows": len(full),
+                                 "after_rows": len(tiered)}
+
+        rows = stats["rows"]
+        print(json.dumps({
+            "rows_written": int(args.machines * seconds / args.interval),
+            "sizes": {"before": before, "after": after},
+            "compaction": dict(stats, rows_per_s=rows / stats["seconds"] if stats["seconds"] else 0.0),
+            "reads": reads,
+        }, indent=2))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Engine cold start: process start to first scored message.
+
+Copies the engine into a temporary tree with trained models, then starts
+fresh interpreters that import twin_engine, push one message through the
+pipeline and exit once it has been scored and persisted. Compares models
+saved as flat memory-mapped files with the joblib pickle fallback (the
+flat files removed), and reports which heavy modules were imported.
+
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+TWIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "twin")
+
+CHILD = r"""
+import sys, time
+sys.path.insert(0, sys.argv[1])
+import asyncio, json, threading, types
+import twin_engine as te
+imported_at = time.time()
+done = {}
+
+def alert(rows):
+    done["at"] = time.time()
+    done["risk"] = rows[0]["risk_score"]
+    te.pipeline.stop()
+
+def feed():
+    while te.pipeline.loop is None:
+        time.sleep(0.001)
+    payload = json.dumps({"temperature": 80.0, "vibration": 7.5, "rpm": 1800, "current": 12.0, "load": 90}).encode()
+    te.on_message(None, None, types.SimpleNamespace(topic="factory/machine1/sensors", payload=payload))
+
+te.pipeline = te.Pipeline(te.parse_message, te.score_batch, te.persist_rows, alert, batch_wait_ms=0)
+threading.Thread(target=feed, daemon=True).start()
+asyncio.run(te.pipeline.run())
+print(json.dumps({
+    "imported_at": imported_at,
+    "scored_at": done["at"],
+    "risk": done["risk"],
+    "modules": [m for m in ("pandas", "sklearn", "joblib", "scipy") if m in sys.modules],
+}))
+"""
+
+
+def build_tree(root, rng_seed=0):
+    """Copy the engine sources to root/twin and train models into root/models."""
+    twin = os.path.join(root, "twin")
+    os.makedirs(twin)
+    for path in glob.glob(os.path.join(TWIN_DIR, "*.py")):
+        shutil.copy(path, twin)
+    code = f"""
+import sys; sys.path.insert(0, {twin!r})
+import numpy as np, pandas as pd
+from anomaly_detector import AnomalyDetector
+from predictive_maintenance import FEATURES, PredictiveMaintenance
+rng = np.random.default_rng({rng_seed})
+df = pd.DataFrame({{"temperature": rng.uniform(50, 85, 5000), "vibration": rng.uniform(1, 8, 5000),
+                    "rpm": rng.integers(1000, 2000, 5000), "current": rng.uniform(5, 15, 5000),
+                    "load": rng.integers(50, 100, 5000)}})
+PredictiveMaintenance().train(df)
+detector = AnomalyDetector()
+detector.fit(df[FEATURES].values)
+detector.save()
+"""
+    subprocess.run([sys.executable, "-c", code], check=True)
+    return twin
+
+
+def run_once(twin):
+    start = time.time()
+    out = subprocess.run([sys.executable, "-c", CHILD, twin], check=True, capture_output=True, text=True)
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["import_s"] = result["imported_at"] - start
+    result["first_score_s"] = result["scored_at"] - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        mmap_twin = build_tree(os.path.join(root, "mmap"))
+        pickle_root = os.path.join(root, "pickle")
+        shutil.copytree(os.path.join(root, "mmap"), pickle_root)
+        for path in glob.glob(os.path.join(pickle_root, "models", "*.flat")):
+            os.remove(path)
+        pickle_twin = os.path.join(pickle_root, "twin")
+
+        for name, twin in (("pickle", pickle_twin), ("mmap", mmap_twin)):
+            run_once(twin)  # warm the page cache and __pycache__
+            results = [run_once(twin) for _ in range(args.runs)]
+            print(f"{name:7s} import {statistics.median(r['import_s'] for r in results) * 1000:7.1f} ms   "
+                  f"first scored message {statistics.median(r['first_score_s'] for r in results) * 1000:7.1f} ms   "
+                  f"risk {results[0]['risk']:.2f}   heavy modules: {', '.join(results[0]['modules']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Fleet Kalman filter (twin/state_estimation.py): step time vs fleet size, and accuracy against the truth.
+
+For each --machines size, feeds --ticks batches of one reading per machine
+(as score_rows does, machines in random order) to:
+  fleet   FleetKalman.step on the whole batch, stacked arrays
+  loop    the same filter stepped one machine at a time (a Python loop
+          per machine, what the fleet step replaces); only up to
+          --loop-max machines, it is slow
+and reports ms per batch and us per reading (noise model of the fleet
+load generator, which the readings follow).
+
+Then runs FleetSimulator (sensors/fleet_load_generator.py) for --accuracy-ticks
+ticks of --accuracy-machines machines and compares raw and filtered readings
+with the simulated true level (operating point + drift + wear + fault
+offset): RMSE per signal relative to the sensor noise, over all readings
+and over the readings not gated (a fault starting or ending, or a machine
+maintained, is a step the filter holds its prediction through for up to
+MAX_GATED readings), and the share of readings gated and of readings the
+filter marks as anomalies, in and out of fault episodes.
+
+Last, readings like sensors/machine_sensor_sim.py's (independent uniform
+values) are filtered with each noise model, and the shares gated and marked
+anomalous reported: the gate is only meaningful with the noise model of the
+data source.
+
+    python benchmarks/bench_state_estimation.py --machines 100 1000 10000 100000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "twin"))
+sys.path.insert(0, os.path.join(ROOT, "sensors"))
+
+from state_estimation import NOISE_MODELS, SIGNALS, FleetKalman
+
+
+def readings(n, ticks, rng):
+    levels = rng.uniform([55, 2, 1200, 7], [70, 4, 1600, 10], (n, len(SIGNALS)))
+    for _ in range(ticks):
+        yield levels + rng.standard_normal(levels.shape) * [0.8, 0.25, 15.0, 0.3]
+
+
+def step_times(n, ticks, loop):
+    rng = np.random.default_rng(0)
+    ids = np.array([f"machine{i}" for i in range(n)], dtype=object)
+    kalman = FleetKalman("fleet_load_generator")
+    times = []
+    for tick, Z in enumerate(readings(n, ticks + 1, rng)):
+        order = rng.permutation(n)
+        t = np.full(n, float(tick))
+        start = time.perf_counter()
+        if loop:
+            for i in order:
+                kalman.step(ids[i:i + 1], t[i:i + 1], Z[i:i + 1])
+        else:
+            kalman.step(ids[order], t, Z[order])
+        if tick:  # the first batch only starts the machines
+            times.append(time.perf_counter() - start)
+    times = np.array(times)
+    return {"ms_per_batch_p50": float(np.median(times) * 1e3), "ms_per_batch_max": float(times.max() * 1e3),
+            "us_per_reading": float(np.median(times) / n * 1e6)}
+
+
+def accuracy(n, ticks, fault_probability):
+    from fleet_load_generator import FAULT_OFFSETS, NOISE, WEAR, FleetSimulator
+    d = len(SIGNALS)
+    sim = FleetSimulator(n, seed=1, fault_probability=fault_probability)
+    kalman = FleetKalman("fleet_load_generator")
+    raw_err, kf_err, gated, anomaly, faulty = [], [], [], [], []
+    for tick in range(ticks):
+        X, fault = sim.step()
+        truth = sim.nominal + sim.drift + sim.wear[:, None] * WEAR
+        truth[fault >= 0] += FAULT_OFFSETS[fault[fault >= 0]]
+        out = kalman.step(sim.machine_ids, np.full(n, float(tick)), X[:, :d])
+        if tick >= 50:  # past the start-up transient
+            raw_err.append(X[:, :d] - truth[:, :d])
+            kf_err.append(out["filtered"] - truth[:, :d])
+            gated.append(out["gated"])
+            anomaly.append(out["anomaly"])
+            faulty.append(fault >= 0)
+    raw_err, kf_err = np.concatenate(raw_err), np.concatenate(kf_err)
+    gated, anomaly, faulty = np.concatenate(gated), np.concatenate(anomaly), np.concatenate(faulty)
+    rmse = lambda e: np.sqrt((e ** 2).mean(axis=0)) / NOISE[:d]
+    return {"readings": len(gated), "fault_readings": int(faulty.sum()),
+            "raw_rmse_over_noise": dict(zip(SIGNALS, rmse(raw_err).round(3).tolist())),
+            "filtered_rmse_over_noise": dict(zip(SIGNALS, rmse(kf_err).round(3).tolist())),
+            "filtered_rmse_over_noise_not_gated": dict(zip(SIGNALS, rmse(kf_err[~gated]).round(3).tolist())),
+            "gated_share_no_fault": float(gated[~faulty].mean()),
+            "gated_share_fault": float(gated[faulty].mean()) if faulty.any() else None,
+            "anomaly_share_no_fault": float(anomaly[~faulty].mean()),
+            "anomaly_share_fault": float(anomaly[faulty].mean()) if faulty.any() else None}
+
+
+def uniform_gating(n, ticks):
+    rng = np.random.default_rng(2)
+    ids = [f"machine{i}" for i in range(n)]
+    shares = {}
+    for name in NOISE_MODELS:
+        kalman = FleetKalman(name)
+        gated = anomaly = 0
+        for tick in range(ticks):
+            Z = rng.uniform([50, 1, 1000, 5], [85, 8, 2000, 15], (n, len(SIGNALS)))
+            out = kalman.step(ids, np.full(n, float(tick)), Z)
+            gated += int(out["gated"].sum())
+            anomaly += int(out["anomaly"].sum())
+        shares[name] = {"gated": gated / (n * ticks), "anomaly": anomaly / (n * ticks)}
+    return shares
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--machines", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--ticks", type=int, default=20, help="batches timed per fleet size")
+    parser.add_argument("--loop-max", type=int, default=10000, help="largest fleet for the per-machine loop")
+    parser.add_argument("--accuracy-machines", type=int, default=200)
+    parser.add_argument("--accuracy-ticks", type=int, default=2000)
+    parser.add_argument("--fault-probability", type=float, default=1e-3, help="per machine and tick")
+    args = parser.parse_args()
+
+    results = {"step": {}}
+    for n in args.machines:
+        results["step"][n] = {"fleet": step_times(n, args.ticks, loop=False)}
+        if n <= args.loop_max:
+            results["step"][n]["loop"] = step_times(n, max(2, args.ticks // 10), loop=True)
+            results["step"][n]["speedup"] = (results["step"][n]["loop"]["ms_per_batch_p50"]
+                                             / results["step"][n]["fleet"]["ms_per_batch_p50"])
+        print(f"{n} machines: {json.dumps(results['step'][n])}", file=sys.stderr)
+    if args.accuracy_ticks:
+        results["accuracy"] = accuracy(args.accuracy_machines, args.accuracy_ticks, args.fault_probability)
+        results["uniform_shares"] = uniform_gating(args.accuracy_machines, args.accuracy_ticks)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
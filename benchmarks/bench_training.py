@@ -0,0 +1,97 @@
+"""Offline training (twin/train.py) vs the engine's full retrain: time, memory and held-out scores.
+
+Writes --rows readings of --machines machines through CsvStorage into a
+temporary directory, then trains on it:
+  engine    retrain_full as twin_engine.py does it: the whole history as
+            one DataFrame, rolling features, PredictiveMaintenance.train
+            (one default forest on one core, evaluated on its own split)
+  offline   train.train with the default candidate only, then with every
+            CANDIDATES entry under --budget, --n-jobs processes each;
+            nothing is published
+Reported per run: seconds (stream/fit for offline), held-out metrics and,
+with --trace-memory, the peak traced memory of the training process
+(tracing slows it down, and fits in pool workers are not traced).
+
+    python benchmarks/bench_training.py --rows 200000 --n-jobs 4 --budget 300
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "twin"))
+
+
+def write_history(path, rows, machines):
+    from storage import CsvStorage
+    storage = CsvStorage(path, flush_rows=4096)
+    rng = np.random.default_rng(0)
+    start = 1_700_000_000
+    for first in range(0, rows, 4096):
+        n = min(4096, rows - first)
+        values = rng.normal([70, 3, 1500, 10, 60], [4, 1.2, 90, 0.6, 5], (n, 5)).tolist()
+        storage.append_many([
+            {"timestamp": datetime.utcfromtimestamp(start + first + k).isoformat(),
+             "machine_id": f"machine{(first + k) % machines}", "temperature": round(v[0], 2),
+             "vibration": round(v[1], 2), "rpm": int(v[2]), "current": round(v[3], 2), "load": int(v[4]),
+             "anomaly": False, "risk_score": 0.0, "model_version": 0}
+            for k, v in enumerate(values)])
+    storage.close()
+
+
+def engine_retrain(path):
+    import pandas as pd
+    from features import ALL_FEATURES, MachineFeatures
+    from predictive_maintenance import PredictiveMaintenance
+    df = MachineFeatures().transform_frame(pd.read_csv(path), "machine1")
+    predictor = PredictiveMaintenance(feature_names=ALL_FEATURES)
+    predictor.train(df, save=False)
+    return {"evaluation": predictor.evaluation}
+
+
+def measured(fn, trace):
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    result["seconds"] = time.perf_counter() - start
+    if trace:
+        result["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--machines", type=int, default=10)
+    parser.add_argument("--n-jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--budget", type=float, default=300)
+    parser.add_argument("--trace-memory", action="store_true")
+    args = parser.parse_args()
+
+    import train
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "machine_live.csv")
+        write_history(path, args.rows, args.machines)
+        results = {"rows": args.rows, "n_jobs": args.n_jobs}
+        results["engine"] = measured(lambda: engine_retrain(path), args.trace_memory)
+        for name, candidates in (("offline_default", train.CANDIDATES[:1]), ("offline_search", train.CANDIDATES)):
+            results[name] = measured(lambda: train.train(path, candidates, args.n_jobs, args.budget, publish=False),
+                                     args.trace_memory)
+        print(json.dumps(results, indent=2))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
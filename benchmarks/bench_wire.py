@@ -0,0 +1,98 @@
+"""Parse throughput of sensor payloads: one JSON message per reading vs binary batches (twin/wire.py).
+
+Readings come from the fleet simulator (sensors/fleet_load_generator.py).
+For each format the sender-side encode and the engine-side parse are
+timed over --readings readings:
+  json          PAYLOAD messages parsed as twin_engine.parse_message does
+                (json.loads, then one row dict per reading)
+  binary_<n>    batches of n readings; "decode" is the structured array
+                view alone, "rows" also builds the engine's row dicts
+Reported per format: wire bytes per reading, messages, and readings/s.
+
+    python benchmarks/bench_wire.py --readings 200000 --batch 1,100,500
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "twin"))
+sys.path.insert(0, os.path.join(ROOT, "sensors"))
+
+
+def parse_json(topic, payload, received_at):
+    # the JSON branch of twin_engine.parse_message
+    from fleet import machine_id_from_topic
+    data = json.loads(payload.decode())
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "received_at": received_at,
+        "machine_id": machine_id_from_topic(topic),
+        "temperature": float(data.get("temperature", None)),
+        "vibration": float(data.get("vibration", None)),
+        "rpm": int(data.get("rpm", 0)),
+        "current": float(data.get("current", None)),
+        "load": int(data.get("load", 0)),
+    }
+
+
+def rate(n, seconds):
+    return n / seconds if seconds > 0 else float("inf")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--machines", type=int, default=1000)
+    parser.add_argument("--readings", type=int, default=200000)
+    parser.add_argument("--batch", default="1,100,500", help="readings per binary message")
+    args = parser.parse_args()
+
+    import wire
+    from fleet import machine_id_from_topic
+    from fleet_load_generator import FleetSimulator
+    sim = FleetSimulator(args.machines, seed=0)
+    ticks = [sim.step()[0] for _ in range(-(-args.readings // sim.n))]
+    n = len(ticks) * sim.n
+    results = {"readings": n}
+
+    start = time.perf_counter()
+    payloads = [p.encode() for X in ticks for p in sim.payloads(X)]
+    encode = time.perf_counter() - start
+    topics = [f"factory/{machine_id}/sensors" for machine_id in sim.machine_ids] * len(ticks)
+    start = time.perf_counter()
+    for topic, payload in zip(topics, payloads):
+        parse_json(topic, payload, 0.0)
+    parse = time.perf_counter() - start
+    results["json"] = {"bytes_per_reading": sum(map(len, payloads)) / n, "messages": n,
+                       "encode_readings_s": rate(n, encode), "parse_readings_s": rate(n, parse)}
+
+    for size in [int(b) for b in args.batch.split(",")]:
+        start = time.perf_counter()
+        messages = []
+        for X in ticks:
+            batch = sim.records(X)
+            messages.extend(wire.encode(batch[first:first + size]) for first in range(0, sim.n, size))
+        encode = time.perf_counter() - start
+        start = time.perf_counter()
+        for payload in messages:
+            wire.decode(payload)
+        decode = time.perf_counter() - start
+        start = time.perf_counter()
+        for payload in messages:
+            if wire.is_batch(payload):
+                wire.to_rows(wire.decode(payload), machine_id_from_topic(wire.BATCH_TOPIC),
+                             timestamp=datetime.utcnow().isoformat(), received_at=0.0)
+        rows = time.perf_counter() - start
+        results[f"binary_{size}"] = {
+            "bytes_per_reading": sum(map(len, messages)) / n, "messages": len(messages),
+            "encode_readings_s": rate(n, encode), "decode_readings_s": rate(n, decode),
+            "parse_readings_s": rate(n, rows), "parse_speedup_vs_json": parse / rows,
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
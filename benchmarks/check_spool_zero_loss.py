@@ -0,0 +1,94 @@
+"""Spool ingestion latency (twin/spool.py), with inotify and with polling.
+
+Drives the file simulator's SpoolWriter at a high rate with small segments
+(many rotations) while a SpoolReader woken by DirectoryWatcher consumes
+the spool, restarting the reader from its committed offset halfway
+through, and reports write-to-read latency, throughput, and readings
+lost or duplicated (delivery is at least once). That no reading is lost
+through the engine itself (twin_engine_file.py, crash included) is
+tested by tests/test_spool_ingestion.py.
+
+    python benchmarks/check_spool_zero_loss.py --readings 200000 --rate 50000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "twin"))
+sys.path.insert(0, os.path.join(ROOT, "sensors"))
+
+import numpy as np
+
+from machine_sensor_sim_file import SpoolWriter, generate_sensor_data
+from spool import DirectoryWatcher, SpoolReader
+
+
+def write(directory, n, rate, burst, segment_bytes):
+    writer = SpoolWriter(directory, segment_bytes)
+    template = generate_sensor_data()
+    start = time.perf_counter()
+    for first in range(0, n, burst):
+        batch = []
+        for seq in range(first, min(first + burst, n)):
+            reading = dict(template, seq=seq, written_at=time.time())
+            batch.append(reading)
+        writer.write_many(batch)
+        # rate control: sleep until this burst is due
+        delay = start + (first + burst) / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+    writer.close()
+
+
+def run(n, rate, burst, segment_bytes, use_inotify):
+    with tempfile.TemporaryDirectory() as directory:
+        writer = threading.Thread(target=write, args=(directory, n, rate, burst, segment_bytes))
+        seen = np.zeros(n, dtype=np.int32)
+        latencies = []
+        reader = SpoolReader(directory)
+        watcher = DirectoryWatcher(directory, poll_seconds=0.05, use_inotify=use_inotify)
+        restarted = False
+        start = time.perf_counter()
+        writer.start()
+        while seen.astype(bool).sum() < n and time.perf_counter() - start < 60 + 2 * n / rate:
+            readings = reader.read_new()
+            now = time.time()
+            for reading in readings:
+                seen[reading["seq"]] += 1
+                latencies.append(now - reading["written_at"])
+            reader.commit()
+            if not restarted and seen.astype(bool).sum() >= n // 2:
+                reader = SpoolReader(directory)  # resumes from the committed offset
+                restarted = True
+            watcher.wait(timeout=0.5)
+        writer.join()
+        elapsed = time.perf_counter() - start
+        watcher.close()
+        leftover = [f for f in os.listdir(directory) if f.startswith("seg-")]
+
+    lost = int((seen == 0).sum())
+    duplicates = int(np.maximum(seen - 1, 0).sum())
+    lat = np.array(latencies) * 1000
+    print(f"{watcher.mode:8s} {n} readings in {elapsed:.2f}s ({n / elapsed:,.0f}/s)  lost {lost}  duplicates {duplicates}  "
+          f"latency p50 {np.percentile(lat, 50):.2f} ms  p99 {np.percentile(lat, 99):.2f} ms  "
+          f"segments left {len(leftover)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readings", type=int, default=100000)
+    parser.add_argument("--rate", type=float, default=20000, help="target readings/second")
+    parser.add_argument("--burst", type=int, default=10, help="readings per write")
+    parser.add_argument("--segment-bytes", type=int, default=64 * 1024)
+    args = parser.parse_args()
+
+    for use_inotify in (True, False):
+        run(args.readings, args.rate, args.burst, args.segment_bytes, use_inotify)
+
+
+if __name__ == "__main__":
+    main()
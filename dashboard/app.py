@@ -1,13 +1,40 @@
 import dash
-from dash import dcc, html, Input, Output, dash_table
+from dash import dcc, html, Input, Output, State, Patch, dash_table, no_update
 import plotly.graph_objs as go
-import pandas as pd
-import random
+import copy
+import flask
+import functools
 import numpy as np
-import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))  # components/, wherever the app is started from
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "twin"))
+from live_buffer import LiveRing
+from motor_state import MotorState
+from storage import CsvTail
+from retention import History
+from components.charts import CHART_WIDTH, create_history_chart
+from components.downsample import Rollups
+from components.push import PushHub
 
 app = dash.Dash(__name__)
 
+# Live data: the twin engine writes scored rows to a shared ring (twin/live_buffer.py)
+LIVE_RING_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "live.ring")
+LIVE_MACHINE_ID = "machine1"  # machine shown on the trends chart, gauge and table
+TREND_POINTS = 300  # points kept on the trends chart; older ones drop off as new ones are pushed
+TABLE_ROWS = 10
+HISTORY_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "machine_live.csv")
+HISTORY_RANGES = {'1h': 3600, '24h': 86400, '7d': 7 * 86400, '30d': 30 * 86400}
+HISTORY_REFRESH_MS = 10000
+MOTOR_STATE_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "motor_state.db")
+PUSH_PATH = '/stream'  # Server-Sent Events for the 3D view: motor state and latest telemetry
+PUSH_INTERVAL_SECONDS = 0.5  # telemetry is pushed at most this often
+
 # Modern dark theme colors
 DARK_BG = '#0a0a0a'
 CARD_BG = '#141414'
@@ -18,9 +45,39 @@ ACCENT_GREEN = '#10b981'
 ACCENT_RED = '#ef4444'
 ACCENT_ORANGE = '#f59e0b'
 
-# Global motor state
-motor_running = False
-target_rpm = 1500
+# Motor state, shared with every other dashboard worker and the engine (twin/motor_state.py)
+motor = MotorState(MOTOR_STATE_DB)
+
+# 3D view updates, pushed instead of reloading or polling (components/push.py)
+push_hub = PushHub()
+
+def publish_motor(state):
+    push_hub.publish('motor', {'running': state['running'], 'target_rpm': state['target_rpm'],
+                               'version': state['version']})
+
+TRENDS = [('temperature', 'Temperature (°C)', ACCENT_RED),
+          ('vibration', 'Vibration (mm/s)', ACCENT_BLUE),
+          ('current', 'Current (A)', ACCENT_ORANGE)]
+TABLE_COLUMNS = ['timestamp', 'temperature', 'vibration', 'rpm', 'current', 'risk_score', 'innovation', 'gated']
+# the engine's Kalman estimate of each trend (twin/state_estimation.py), drawn dotted over the readings
+TREND_SERIES = [name for name, _, _ in TRENDS] + [f"kf_{name}" for name, _, _ in TRENDS]
+
+def trend_figure():
+    # built once: every tick only appends the new points (extendData)
+    raw = [go.Scatter(x=[], y=[], name=name, line=dict(color=color, width=3)) for _, name, color in TRENDS]
+    filtered = [go.Scatter(x=[], y=[], name=f"{name} filtered", line=dict(color=color, width=2, dash='dot'))
+                for _, name, color in TRENDS]
+    fig = go.Figure(raw + filtered)
+    fig.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(color=TEXT_SECONDARY),
+        xaxis=dict(type='date', gridcolor='#1f1f1f', showgrid=True, color=TEXT_SECONDARY, zeroline=False),
+        yaxis=dict(gridcolor='#1f1f1f', showgrid=True, color=TEXT_SECONDARY, zeroline=False),
+        legend=dict(font=dict(color=TEXT_SECONDARY)),
+        margin=dict(l=40, r=40, t=20, b=40)
+    )
+    return fig
 
 app.layout = html.Div([
     # Header
@@ -69,7 +126,7 @@ app.layout = html.Div([
     html.Div([
         html.Div([
             html.H3("Sensor Trends", style={'color': TEXT_PRIMARY, 'marginBottom': '20px', 'fontSize': '18px', 'fontWeight': '500'}),
-            dcc.Graph(id='trends-chart', style={'height': '400px'})
+            dcc.Graph(id='trends-chart', figure=trend_figure(), style={'height': '400px'})
         ], style={'background': CARD_BG, 'padding': '24px', 'margin': '12px', 'borderRadius': '8px', 'flex': '2', 'border': '1px solid #1f1f1f'}),
         
         html.Div([
@@ -78,6 +135,18 @@ app.layout = html.Div([
         ], style={'background': CARD_BG, 'padding': '24px', 'margin': '12px', 'borderRadius': '8px', 'flex': '1', 'border': '1px solid #1f1f1f'})
     ], style={'display': 'flex', 'padding': '0 12px'}),
     
+    # History (downsampled server-side from rollups)
+    html.Div([
+        html.Div([
+            html.H3("Sensor History", style={'color': TEXT_PRIMARY, 'margin': '0', 'fontSize': '18px', 'fontWeight': '500'}),
+            dcc.RadioItems(id='history-range', value='1h', inline=True,
+                           options=[{'label': k, 'value': k} for k in HISTORY_RANGES],
+                           style={'color': TEXT_SECONDARY, 'fontSize': '14px'}, inputStyle={'margin': '0 6px 0 16px'})
+        ], style={'display': 'flex', 'justifyContent': 'space-between', 'alignItems': 'center', 'marginBottom': '20px'}),
+        dcc.Graph(id='history-chart', style={'height': '400px'}),
+        dcc.Interval(id='history-interval', interval=HISTORY_REFRESH_MS, n_intervals=0)
+    ], style={'background': CARD_BG, 'padding': '24px', 'margin': '24px', 'borderRadius': '8px', 'border': '1px solid #1f1f1f'}),
+    
     # 3D Model and Data
     html.Div([
         html.Div([
@@ -94,123 +163,98 @@ app.layout = html.Div([
     # Data Table
     html.Div([
         html.H3("Recent Data Points", style={'color': TEXT_PRIMARY, 'marginBottom': '20px', 'fontSize': '18px', 'fontWeight': '500'}),
-        html.Div(id='data-table')
+        dash_table.DataTable(
+            id='data-table',
+            data=[],
+            columns=[{"name": c.replace('_', ' ').title(), "id": c} for c in TABLE_COLUMNS],
+            style_cell={
+                'textAlign': 'center', 
+                'fontSize': '12px',
+                'color': TEXT_PRIMARY,
+                'backgroundColor': CARD_BG,
+                'border': '1px solid #1f1f1f',
+                'padding': '12px'
+            },
+            style_header={
+                'backgroundColor': '#1f1f1f', 
+                'color': TEXT_PRIMARY, 
+                'fontWeight': '500',
+                'border': '1px solid #1f1f1f'
+            }
+        )
     ], style={'background': CARD_BG, 'padding': '24px', 'margin': '24px', 'borderRadius': '8px', 'border': '1px solid #1f1f1f'}),
     
-    dcc.Interval(id='interval', interval=1000, n_intervals=0)
+    dcc.Interval(id='interval', interval=1000, n_intervals=0),
+    dcc.Store(id='live-seq')  # per session: ring sequence number of the last point sent to this browser
 ], style={'fontFamily': 'Inter, -apple-system, BlinkMacSystemFont, sans-serif', 'background': DARK_BG, 'minHeight': '100vh'})
 
 # Motor control callback
 @app.callback(
-    [Output('motor-status', 'children'),
-     Output('3d-iframe', 'src')],
+    Output('motor-status', 'children'),
     [Input('start-btn', 'n_clicks'),
      Input('stop-btn', 'n_clicks'),
      Input('rpm-slider', 'value')]
 )
 def control_motor(start_clicks, stop_clicks, rpm_value):
-    global motor_running, target_rpm
-    
     ctx = dash.callback_context
     if ctx.triggered:
+        changes = {'target_rpm': rpm_value or 1500}
         button_id = ctx.triggered[0]['prop_id'].split('.')[0]
         if button_id == 'start-btn':
-            motor_running = True
+            changes['running'] = True
         elif button_id == 'stop-btn':
-            motor_running = False
-        
-        target_rpm = rpm_value or 1500
-        
-        # Write state for 3D model
-        try:
-            with open('motor_state.json', 'w') as f:
-                json.dump({'running': motor_running, 'target_rpm': target_rpm}, f)
-        except:
-            pass
-    
-    status = f"🟢 Motor Running - Target: {target_rpm} RPM" if motor_running else f"🔴 Motor Stopped - Target: {target_rpm} RPM"
-    
-    # Update 3D model via URL parameters
-    iframe_src = f'/assets/3d.html?running={str(motor_running).lower()}&rpm={target_rpm}&t={random.randint(1,1000)}'
-    
-    return status, iframe_src
-
-# Dashboard updates
-@app.callback(
-    [Output('trends-chart', 'figure'),
-     Output('rpm-gauge', 'figure'),
-     Output('temp-display', 'children'),
-     Output('vib-display', 'children'),
-     Output('rpm-display', 'children'),
-     Output('current-display', 'children'),
-     Output('machine-status', 'children'),
-     Output('data-table', 'children')],
-    [Input('interval', 'n_intervals')]
-)
-def update_dashboard(n):
-    global motor_running, target_rpm
-    
-    if motor_running:
-        # MOTOR RUNNING - Generate active data
-        current_rpm = target_rpm + random.randint(-50, 50)
-        temp = 70 + random.randint(-10, 10)
-        vib = 3.5 + random.uniform(-1, 1)
-        current = 12 + random.uniform(-2, 2)
-        
-        # Active trend data
-        trend_data = pd.DataFrame({
-            'temp': np.random.normal(temp, 3, 50),
-            'vib': np.random.normal(vib, 0.5, 50),
-            'current': np.random.normal(current, 1, 50)
-        })
-        
-        line_style = dict(width=3)
-        
+            changes['running'] = False
+        state = motor.update(**changes)  # atomic, whichever worker serves the click
+        publish_motor(state)
     else:
-        # MOTOR STOPPED - Everything at zero/ambient
-        current_rpm = 0
-        temp = 22  # Ambient
-        vib = 0.0  # No vibration
-        current = 0.0  # No current
-        
-        # Flat line data
-        trend_data = pd.DataFrame({
-            'temp': [22] * 50,
-            'vib': [0] * 50,
-            'current': [0] * 50
-        })
-        
-        line_style = dict(width=3, dash='dot')
-    
-    # Trends Chart
-    fig1 = go.Figure()
-    fig1.add_trace(go.Scatter(y=trend_data['temp'], name='Temperature (°C)', 
-                             line=dict(color=ACCENT_RED, **line_style)))
-    fig1.add_trace(go.Scatter(y=trend_data['vib'], name='Vibration (mm/s)', 
-                             line=dict(color=ACCENT_BLUE, **line_style)))
-    fig1.add_trace(go.Scatter(y=trend_data['current'], name='Current (A)', 
-                             line=dict(color=ACCENT_ORANGE, **line_style)))
-    
-    fig1.update_layout(
-        plot_bgcolor='rgba(0,0,0,0)',
-        paper_bgcolor='rgba(0,0,0,0)',
-        font=dict(color=TEXT_SECONDARY),
-        xaxis=dict(gridcolor='#1f1f1f', showgrid=True, color=TEXT_SECONDARY, zeroline=False),
-        yaxis=dict(gridcolor='#1f1f1f', showgrid=True, color=TEXT_SECONDARY, zeroline=False),
-        legend=dict(font=dict(color=TEXT_SECONDARY)),
-        margin=dict(l=40, r=40, t=20, b=40)
-    )
+        state = motor.get()
     
-    # RPM Gauge
-    gauge_color = ACCENT_GREEN if motor_running else '#666666'
-    fig2 = go.Figure(go.Indicator(
+    target_rpm = state['target_rpm']
+    status = f"🟢 Motor Running - Target: {target_rpm} RPM" if state['running'] else f"🔴 Motor Stopped - Target: {target_rpm} RPM"
+    return status
+
+# Live data shared by all sessions: the latest TREND_POINTS rows of LIVE_MACHINE_ID.
+# It is refreshed from the ring at most once per new write, reading only the rows
+# added since the last refresh, so the per-tick cost does not grow with the
+# history or with the number of open dashboards.
+_live = {"ring": None, "generation": 0, "written": 0, "seqs": np.empty(0, dtype=np.int64), "rows": None}
+_live_lock = threading.Lock()
+
+def machine_tail():
+    """(generation, ring sequence numbers, records) of the machine's latest rows, or None
+    without an engine. The generation changes whenever sequence numbers start over."""
+    with _live_lock:
+        ring = _live["ring"]
+        if ring is None or ring.replaced():
+            try:
+                ring = LiveRing(LIVE_RING_FILE)
+            except FileNotFoundError:
+                return None
+            _live.update(ring=ring, generation=_live["generation"] + 1, written=0,
+                         seqs=np.empty(0, dtype=np.int64), rows=None)
+        if ring.written < _live["written"]:  # engine recreated the ring in place
+            _live.update(generation=_live["generation"] + 1, written=0, seqs=np.empty(0, dtype=np.int64), rows=None)
+        if ring.written != _live["written"] or _live["rows"] is None:
+            new, written = ring.read_since(_live["written"])
+            seqs = np.arange(written - len(new), written)
+            mine = new["machine_id"] == LIVE_MACHINE_ID.encode()
+            rows = new[mine] if _live["rows"] is None else np.concatenate([_live["rows"], new[mine]])
+            _live.update(written=written, seqs=np.concatenate([_live["seqs"], seqs[mine]])[-TREND_POINTS:],
+                         rows=rows[-TREND_POINTS:])
+        return _live["generation"], _live["seqs"], _live["rows"]
+
+def gauge_color(motor_running):
+    return ACCENT_GREEN if motor_running else '#666666'
+
+def rpm_gauge(value, motor_running):
+    fig = go.Figure(go.Indicator(
         mode="gauge+number",
-        value=current_rpm,
+        value=value,
         title={'text': "RPM", 'font': {'color': TEXT_SECONDARY, 'size': 20}},
         number={'font': {'color': TEXT_PRIMARY, 'size': 36}},
         gauge={
             'axis': {'range': [None, 2000], 'tickcolor': TEXT_SECONDARY, 'tickfont': {'color': TEXT_SECONDARY}},
-            'bar': {'color': gauge_color, 'thickness': 0.8},
+            'bar': {'color': gauge_color(motor_running), 'thickness': 0.8},
             'bgcolor': 'rgba(0,0,0,0)',
             'borderwidth': 2,
             'bordercolor': '#1f1f1f',
@@ -228,18 +272,27 @@ def update_dashboard(n):
         }
     ))
     
-    fig2.update_layout(
+    fig.update_layout(
         plot_bgcolor='rgba(0,0,0,0)',
         paper_bgcolor='rgba(0,0,0,0)',
         font=dict(color=TEXT_SECONDARY),
         margin=dict(l=20, r=20, t=40, b=20)
     )
-    
-    # Machine Status
+    return fig
+
+GAUGE_TEMPLATE = rpm_gauge(0, False).to_plotly_json()  # built once; ticks copy it or patch it
+
+def gauge_figure(value, motor_running):
+    fig = copy.deepcopy(GAUGE_TEMPLATE)
+    fig['data'][0]['value'] = value
+    fig['data'][0]['gauge']['bar']['color'] = gauge_color(motor_running)
+    return fig
+
+def status_panel(temp, current_rpm, current, risk, motor_running):
     power_status = "Online" if motor_running else "Standby"
     power_color = ACCENT_GREEN if motor_running else ACCENT_ORANGE
     
-    status_panel = html.Div([
+    return html.Div([
         html.Div([
             html.H4("Power Status", style={'color': TEXT_PRIMARY, 'fontSize': '14px', 'margin': '0 0 8px 0', 'fontWeight': '500'}),
             html.P(power_status, style={'color': power_color, 'fontSize': '12px', 'margin': '0'})
@@ -256,40 +309,209 @@ def update_dashboard(n):
             html.H4("Motor", style={'color': TEXT_PRIMARY, 'fontSize': '14px', 'margin': '0 0 8px 0', 'fontWeight': '500'}),
             html.P(f"RPM: {current_rpm:.0f}", style={'color': TEXT_SECONDARY, 'fontSize': '12px', 'margin': '0'}),
             html.P(f"Current: {current:.1f}A", style={'color': TEXT_SECONDARY, 'fontSize': '12px', 'margin': '0'}),
-            html.P(f"Status: {'Running' if current_rpm > 0 else 'Stopped'}", 
-                  style={'color': ACCENT_GREEN if current_rpm > 0 else ACCENT_RED, 'fontSize': '12px', 'margin': '4px 0 0 0'})
+            html.P(f"Failure risk: {risk:.0%}", 
+                  style={'color': ACCENT_GREEN if risk < 0.6 else ACCENT_RED, 'fontSize': '12px', 'margin': '4px 0 0 0'})
         ])
     ])
-    
-    # Data Table
-    table_data = pd.DataFrame({
-        'timestamp': [f"2024-01-01 12:{i:02d}:00" for i in range(10)],
-        'temperature': [temp + random.uniform(-2, 2) for _ in range(10)],
-        'vibration': [vib + random.uniform(-0.5, 0.5) for _ in range(10)],
-        'rpm': [current_rpm] * 10,
-        'current': [current + random.uniform(-1, 1) for _ in range(10)]
-    })
-    
-    table = dash_table.DataTable(
-        data=table_data.round(2).to_dict('records'),
-        columns=[{"name": i.title(), "id": i} for i in table_data.columns],
-        style_cell={
-            'textAlign': 'center', 
-            'fontSize': '12px',
-            'color': TEXT_PRIMARY,
-            'backgroundColor': CARD_BG,
-            'border': '1px solid #1f1f1f',
-            'padding': '12px'
-        },
-        style_header={
-            'backgroundColor': '#1f1f1f', 
-            'color': TEXT_PRIMARY, 
-            'fontWeight': '500',
-            'border': '1px solid #1f1f1f'
-        }
+
+# History rollups shared by all sessions: seeded from the engine's minute/hour rollups of
+# compacted history (twin/retention.py), then fed incrementally from the raw CSV
+_history = {"tail": None, "rollups": None}
+_history_lock = threading.Lock()
+
+def seed_rollups(rollups):
+    signals = [name for name, _, _ in TRENDS]
+    compacted = History(HISTORY_CSV, LIVE_MACHINE_ID).between(float("-inf"), float("inf"), LIVE_MACHINE_ID, raw=False)
+    for seconds, part in compacted.groupby("resolution", sort=False):  # hours first, then minutes
+        times = part["timestamp"].astype("datetime64[ns]").astype(np.int64).values / 1e9
+        rollups.add(LIVE_MACHINE_ID, times, part[signals].values, part["count"].values,
+                    part[[f"{name}_min" for name in signals]].values, part[[f"{name}_max" for name in signals]].values,
+                    seconds=seconds)
+
+def history_rollups():
+    with _history_lock:
+        if _history["rollups"] is None:
+            _history["tail"] = CsvTail(HISTORY_CSV)
+            _history["rollups"] = Rollups([name for name, _, _ in TRENDS], machines=[LIVE_MACHINE_ID])
+            try:
+                seed_rollups(_history["rollups"])
+            except Exception as e:
+                print("History rollups error:", e)
+        try:
+            _history["rollups"].add_frame(_history["tail"].read_new(), LIVE_MACHINE_ID)
+        except Exception as e:
+            print("History refresh error:", e)
+        return _history["rollups"]
+
+@app.callback(
+    Output('history-chart', 'figure'),
+    [Input('history-interval', 'n_intervals'),
+     Input('history-range', 'value')]
+)
+def update_history(n, history_range):
+    rollups = history_rollups()
+    t1 = rollups.latest or time.time()
+    t0 = t1 - HISTORY_RANGES.get(history_range, 3600)
+    fig = create_history_chart(rollups, LIVE_MACHINE_ID, [name for name, _, _ in TRENDS], t0, t1, CHART_WIDTH,
+                               names=[label for _, label, _ in TRENDS], colors=[color for _, _, color in TRENDS])
+    fig.update_layout(
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(color=TEXT_SECONDARY),
+        xaxis=dict(gridcolor='#1f1f1f', showgrid=True, color=TEXT_SECONDARY, zeroline=False),
+        yaxis=dict(gridcolor='#1f1f1f', showgrid=True, color=TEXT_SECONDARY, zeroline=False),
+        legend=dict(font=dict(color=TEXT_SECONDARY)),
+        margin=dict(l=40, r=40, t=20, b=40)
     )
-    
-    return fig1, fig2, f"{temp:.1f}°C", f"{vib:.1f} mm/s", f"{current_rpm:.0f} RPM", f"{current:.1f} A", status_panel, table
+    return fig
+
+@functools.lru_cache(maxsize=64)
+def live_view(generation, seq, running):
+    """Everything the live outputs show for the rows up to ring sequence `seq`: the
+    same for every session, so built once per data version. None once `seq` has
+    left the shared buffer. Each output has a key; equal keys mean equal output."""
+    tail = machine_tail()
+    if tail is None or tail[0] != generation:
+        return None
+    _, seqs, rows = tail
+    upto = seqs <= seq
+    if not len(seqs) or seqs[0] > seq or not upto.any():
+        return None
+    seqs, rows = seqs[upto], rows[upto]
+    latest = rows[-1]
+    temp, vib = float(latest["temperature"]), float(latest["vibration"])
+    current_rpm, current = float(latest["rpm"]), float(latest["current"])
+    risk = float(latest["risk_score"])
+    table_seqs = seqs[::-1][:TABLE_ROWS].tolist()
+    table = [{
+        'timestamp': datetime.fromtimestamp(r["time"]).strftime("%H:%M:%S.%f")[:-3],
+        'temperature': round(float(r["temperature"]), 2),
+        'vibration': round(float(r["vibration"]), 2),
+        'rpm': int(r["rpm"]),
+        'current': round(float(r["current"]), 2),
+        'risk_score': round(float(r["risk_score"]), 2),
+        'innovation': None if np.isnan(r["innovation"]) else round(float(r["innovation"]), 2),
+        'gated': 'yes' if r["gated"] else '',
+    } for r in rows[::-1][:TABLE_ROWS]]
+    # the status panel only shows these, so it is rebuilt (and resent) only when one changes
+    status_key = (f"{temp:.1f}", temp < 80, f"{current_rpm:.0f}", f"{current:.1f}", f"{risk:.0%}", risk < 0.6, running)
+    return {
+        'kpis': (f"{temp:.1f}°C", f"{vib:.1f} mm/s", f"{current_rpm:.0f} RPM", f"{current:.1f} A"),
+        'gauge_key': (current_rpm, running),
+        'gauge': gauge_figure(current_rpm, running),
+        'status_key': status_key,
+        'status': status_panel(temp, current_rpm, current, risk, running),
+        'table_seqs': table_seqs,
+        'table': table,
+    }
+
+def table_update(view, previous):
+    # new rows are prepended and the oldest dropped, instead of resending the table
+    new = [i for i, seq in enumerate(view['table_seqs']) if seq > previous['table_seqs'][0]] \
+        if previous['table_seqs'] else list(range(len(view['table'])))
+    if not new:
+        return no_update
+    if len(new) >= TABLE_ROWS:
+        return view['table']
+    patch = Patch()
+    for i in reversed(new):
+        patch.prepend(view['table'][i])
+    for _ in range(len(previous['table']) + len(new) - TABLE_ROWS):
+        del patch[TABLE_ROWS]
+    return patch
+
+def trend_extend(rows, max_points=TREND_POINTS):
+    x = (rows["time"] * 1000).tolist()  # epoch ms on a date axis
+    # NaN (no state estimate) leaves a gap in the filtered lines
+    y = [[None if v != v else v for v in rows[name].tolist()] for name in TREND_SERIES]
+    return dict(x=[x] * len(TREND_SERIES), y=y), list(range(len(TREND_SERIES))), max_points
+
+# Dashboard updates: only what changed since this session's last tick is sent
+@app.callback(
+    [Output('trends-chart', 'extendData'),
+     Output('rpm-gauge', 'figure'),
+     Output('temp-display', 'children'),
+     Output('vib-display', 'children'),
+     Output('rpm-display', 'children'),
+     Output('current-display', 'children'),
+     Output('machine-status', 'children'),
+     Output('data-table', 'data'),
+     Output('live-seq', 'data')],
+    [Input('interval', 'n_intervals')],
+    [State('live-seq', 'data')]
+)
+def update_dashboard(n, shown=None):
+    # `shown` (per session): ring generation, sequence number and motor state last sent to this browser
+    running = motor.get()['running']  # cached until any process changes it
+    tail = machine_tail()
+    if tail is None or not len(tail[1]):
+        if shown is not None and shown.get('seq') is None and shown.get('running') == running:
+            return (no_update,) * 9  # still waiting, and the browser already says so
+        return (no_update, gauge_figure(0, running), "--", "--", "--", "--",
+                html.P("Waiting for the twin engine...", style={'color': TEXT_SECONDARY}), [],
+                {'generation': None, 'seq': None, 'running': running})
+    generation, seqs, rows = tail
+    seq = int(seqs[-1])
+    previous = None
+    if shown is not None and shown.get('generation') == generation and shown.get('seq') is not None:
+        if shown['seq'] == seq and shown['running'] == running:
+            return (no_update,) * 9
+        previous = live_view(generation, shown['seq'], shown['running'])
+    view = live_view(generation, seq, running)
+    if view is None:  # the ring was replaced after the tail was read: the next tick starts over from it
+        return (no_update,) * 9
+    state = {'generation': generation, 'seq': seq, 'running': running}
+    if previous is None:  # first load, or this browser fell behind the shared buffer
+        # maxPoints = len(rows) replaces whatever the chart holds instead of appending the window twice
+        return (trend_extend(rows, len(rows)), view['gauge'], *view['kpis'], view['status'], view['table'], state)
+
+    new = rows[seqs > shown['seq']]
+    extend = trend_extend(new) if len(new) else no_update
+    gauge = no_update
+    if view['gauge_key'] != previous['gauge_key']:
+        gauge = Patch()
+        gauge['data'][0]['value'] = view['gauge_key'][0]
+        if running != previous['gauge_key'][1]:
+            gauge['data'][0]['gauge']['bar']['color'] = gauge_color(running)
+    kpis = [text if text != before else no_update for text, before in zip(view['kpis'], previous['kpis'])]
+    status = view['status'] if view['status_key'] != previous['status_key'] else no_update
+    return (extend, gauge, *kpis, status, table_update(view, previous), state)
+
+# Telemetry for the 3D view: one thread per process reads the shared live rows and
+# publishes the latest, however many 3D views are subscribed. Motor changes made
+# through other workers reach this process's streams through a state watcher.
+_pump = {"thread": None}
+_pump_lock = threading.Lock()
+
+def telemetry_pump():
+    last_seq = None
+    while True:
+        try:
+            tail = machine_tail()
+            if tail is not None and len(tail[1]) and tail[1][-1] != last_seq:
+                last_seq, row = tail[1][-1], tail[2][-1]
+                # rounded as displayed, so unchanged readings are not sent again
+                push_hub.publish('telemetry', {
+                    'temperature': round(float(row["temperature"]), 1),
+                    'vibration': round(float(row["vibration"]), 2),
+                    'rpm': int(round(float(row["rpm"]))),
+                    'current': round(float(row["current"]), 1),
+                    'risk_score': round(float(row["risk_score"]), 2),
+                    'anomaly': bool(row["anomaly"]),
+                })
+        except Exception as e:
+            print("Telemetry push error:", e)
+        time.sleep(PUSH_INTERVAL_SECONDS)
+
+@app.server.route(PUSH_PATH)
+def push_stream():
+    with _pump_lock:
+        if _pump["thread"] is None:  # started here, after any worker fork
+            motor.watch(publish_motor)
+            _pump["thread"] = threading.Thread(target=telemetry_pump, daemon=True)
+            _pump["thread"].start()
+    return flask.Response(push_hub.stream(), mimetype='text/event-stream',
+                          headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 # Export server for Vercel
 server = app.server
@@ -1,6 +1,32 @@
+import numpy as np
 import plotly.graph_objs as go
 
-def create_sensor_chart(df, metric):
+from components.downsample import lttb, minmax_downsample
+
+CHART_WIDTH = 1200  # points sent per trace: about the chart's width in pixels
+
+def create_sensor_chart(df, metric, width=CHART_WIDTH, method="lttb"):
+    # long series are reduced to ~width points on the server: "lttb" keeps the
+    # line's shape, "minmax" keeps every spike (two points per pixel column)
+    x = df["timestamp"].values if "timestamp" in df else np.arange(len(df))
+    y = df[metric].values
+    if len(y) > width:
+        if method == "minmax":
+            x, y = minmax_downsample(x, y, width)
+        else:
+            idx = lttb(np.arange(len(y)), y.astype(float), width)[0].astype(int)
+            x, y = x[idx], y[idx]
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=x, y=y, name=metric))
+    return fig
+
+def create_history_chart(rollups, machine_id, metrics, t0, t1, width=CHART_WIDTH, names=None, colors=None):
+    # [t0, t1] (epoch seconds) from the rollups (components/downsample.py): O(width) whatever the range
     fig = go.Figure()
-    fig.add_trace(go.Scatter(y=df[metric], name=metric))
-    return fig
\ No newline at end of file
+    result = rollups.query(machine_id, t0, t1, width)
+    for i, metric in enumerate(metrics):
+        x, y = ([], []) if result is None else (result[1] * 1000, result[2][metric])  # epoch ms on a date axis
+        fig.add_trace(go.Scatter(x=x, y=y, name=(names or metrics)[i],
+                                 line=dict(color=colors[i]) if colors else None))
+    fig.update_layout(xaxis=dict(type='date', range=[t0 * 1000, t1 * 1000]))
+    return fig
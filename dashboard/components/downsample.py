@@ -0,0 +1,192 @@
+import numpy as np
+
+# rollup tiers: (bucket seconds, how long buckets are kept; None keeps them all)
+TIERS = ((1, 6 * 3600), (60, 30 * 86400), (3600, None))
+MAX_BUCKETS_PER_PIXEL = 4  # a tier is used once a range holds at most this many of its buckets per pixel
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: n_out points of (x, y) that keep the line's visual shape."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)  # first and last point are always kept
+    bounds = np.r_[edges, n]
+    cx, cy = np.r_[0.0, np.cumsum(x)], np.r_[0.0, np.cumsum(y)]
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi, nhi = bounds[i], bounds[i + 1], bounds[i + 2]
+        # the next bucket's average is the triangle's third corner
+        avg_x = (cx[nhi] - cx[hi]) / (nhi - hi)
+        avg_y = (cy[nhi] - cy[hi]) / (nhi - hi)
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        idx[i + 1] = a
+    return x[idx], y[idx]
+
+
+def _groups(n, width):
+    return np.linspace(0, n, min(n, width) + 1).astype(int)[:-1]
+
+
+def minmax_downsample(x, y, width):
+    """Min and max of each of `width` consecutive groups, both at the group's first x
+    (a vertical stroke per pixel column), so spikes are never averaged away."""
+    if len(x) <= width:
+        return np.asarray(x), np.asarray(y)
+    starts = _groups(len(x), width)
+    y = np.asarray(y, dtype=float)
+    return (np.repeat(np.asarray(x)[starts], 2),
+            np.column_stack([np.minimum.reduceat(y, starts), np.maximum.reduceat(y, starts)]).ravel())
+
+
+class _Tier:
+    """Per-bucket count, sum, min and max of every signal at one resolution, oldest first."""
+
+    def __init__(self, seconds, retention, n_signals):
+        self.seconds = seconds
+        self.retention = retention
+        self.t = np.empty(0, dtype=np.int64)  # bucket start, epoch seconds
+        self.count = np.empty(0, dtype=np.int64)
+        self.sum = np.empty((0, n_signals))
+        self.min = np.empty((0, n_signals))
+        self.max = np.empty((0, n_signals))
+        self.late_dropped = 0
+        self.trimmed = False  # retention has dropped old buckets
+
+    def add(self, times, values, count=None, low=None, high=None):
+        # times: sorted epoch seconds; values: (len(times), n_signals) readings, or bucket
+        # means with per-bucket `count`, `low` and `high` (rollups from twin/retention.py)
+        keys = (times // self.seconds).astype(np.int64) * self.seconds
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        keys = keys[starts]
+        if count is None:
+            count = np.diff(np.r_[starts, len(times)])
+            total = np.add.reduceat(values, starts)
+            low = np.minimum.reduceat(values, starts)
+            high = np.maximum.reduceat(values, starts)
+        else:
+            total = np.add.reduceat(values * count[:, None], starts)
+            count = np.add.reduceat(count, starts)
+            low = np.minimum.reduceat(low, starts)
+            high = np.maximum.reduceat(high, starts)
+
+        if len(self.t):
+            # buckets that already exist (the one still filling, or late rows) are merged in place
+            old = keys <= self.t[-1]
+            if old.any():
+                pos = np.searchsorted(self.t, keys[old])
+                found = self.t[pos] == keys[old]
+                pos, sel = pos[found], np.flatnonzero(old)[found]
+                self.count[pos] += count[sel]
+                self.sum[pos] += total[sel]
+                self.min[pos] = np.minimum(self.min[pos], low[sel])
+                self.max[pos] = np.maximum(self.max[pos], high[sel])
+                self.late_dropped += int(count[old][~found].sum())  # no bucket to merge into
+                new = ~old
+                keys, count, total, low, high = keys[new], count[new], total[new], low[new], high[new]
+
+        self.t = np.r_[self.t, keys]
+        self.count = np.r_[self.count, count]
+        self.sum = np.vstack([self.sum, total])
+        self.min = np.vstack([self.min, low])
+        self.max = np.vstack([self.max, high])
+        if self.retention is not None and len(self.t):
+            keep = np.searchsorted(self.t, self.t[-1] - self.retention)
+            if keep:
+                self.trimmed = True
+                self.t, self.count = self.t[keep:], self.count[keep:]
+                self.sum, self.min, self.max = self.sum[keep:], self.min[keep:], self.max[keep:]
+
+    def covers(self, t0):
+        return not self.trimmed or (len(self.t) > 0 and self.t[0] <= t0)
+
+    def window(self, t0, t1):
+        return slice(np.searchsorted(self.t, t0 // self.seconds * self.seconds), np.searchsorted(self.t, t1, "right"))
+
+
+class Rollups:
+    """Multi-resolution rollups (TIERS) of sensor rows, per machine, updated incrementally.
+
+    `query` answers a time range with at most ~2 x `width` points from the
+    finest tier that still holds the whole range with no more than
+    MAX_BUCKETS_PER_PIXEL buckets per pixel, so zooming out costs
+    O(pixels), not O(rows). Only the machines in `machines` are kept
+    (all if None): the 1 s tier costs ~3 MB per machine at 1 Hz.
+    """
+
+    def __init__(self, signals, tiers=TIERS, machines=None):
+        self.signals = list(signals)
+        self.tiers = tiers
+        self.machines = set(machines) if machines is not None else None
+        self.by_machine = {}
+        self.latest = None  # newest row time seen, epoch seconds
+
+    def add(self, machine_id, times, values, count=None, low=None, high=None, seconds=1):
+        """Add readings, or `seconds`-long buckets (means in `values`, with count, low and high).
+
+        Buckets only go into tiers at least as coarse; finer tiers are marked
+        as not holding that range. Add older data first."""
+        if self.machines is not None and machine_id not in self.machines:
+            return
+        if not len(times):
+            return
+        order = np.argsort(times, kind="stable")
+        times, values = np.asarray(times, dtype=float)[order], np.asarray(values, dtype=float)[order]
+        if count is not None:
+            count = np.asarray(count, dtype=np.int64)[order]
+            low, high = np.asarray(low, dtype=float)[order], np.asarray(high, dtype=float)[order]
+        tiers = self.by_machine.get(machine_id)
+        if tiers is None:
+            tiers = self.by_machine[machine_id] = [_Tier(s, r, len(self.signals)) for s, r in self.tiers]
+        for tier in tiers:
+            if tier.seconds < seconds:
+                tier.trimmed = True
+                continue
+            tier.add(times, values, count, low, high)
+        self.latest = max(self.latest or times[-1], times[-1])
+
+    def add_frame(self, df, default_machine_id="machine1"):
+        """Add storage rows (timestamp, machine_id and the signal columns)."""
+        import pandas as pd
+        if not len(df):
+            return
+        times = pd.to_datetime(df["timestamp"], errors="coerce", format="ISO8601")
+        ok = times.notna().values
+        seconds = times.values[ok].astype("datetime64[ns]").astype(np.int64) / 1e9
+        values = df[self.signals].astype(float).values[ok]
+        machine_ids = (df["machine_id"].fillna(default_machine_id).astype(str).values[ok] if "machine_id" in df
+                       else np.full(ok.sum(), default_machine_id))
+        for machine_id in np.unique(machine_ids):
+            mine = machine_ids == machine_id
+            self.add(machine_id, seconds[mine], values[mine])
+
+    def query(self, machine_id, t0, t1, width):
+        """(bucket seconds, x epoch seconds, {signal: y}) for [t0, t1]; None if nothing is stored."""
+        tiers = self.by_machine.get(machine_id)
+        if not tiers:
+            return None
+        tier = tiers[-1]
+        for candidate in tiers:
+            window = candidate.window(t0, t1)
+            if candidate.covers(t0) and window.stop - window.start <= MAX_BUCKETS_PER_PIXEL * width:
+                tier = candidate
+                break
+        window = tier.window(t0, t1)
+        t = tier.t[window]
+        if not len(t):
+            return tier.seconds, t, {name: np.empty(0) for name in self.signals}
+        if tier.seconds == 1 and len(t) <= width:
+            # 1 s buckets are the raw readings at the simulators' rates: plot the means
+            mean = tier.sum[window] / tier.count[window][:, None]
+            return tier.seconds, t, {name: mean[:, i] for i, name in enumerate(self.signals)}
+        # one min/max stroke per pixel column from the buckets' own min and max
+        starts = _groups(len(t), width)
+        low = np.minimum.reduceat(tier.min[window], starts)
+        high = np.maximum.reduceat(tier.max[window], starts)
+        x = np.repeat(t[starts], 2)
+        return tier.seconds, x, {name: np.column_stack([low[:, i], high[:, i]]).ravel()
+                                 for i, name in enumerate(self.signals)}
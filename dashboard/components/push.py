@@ -0,0 +1,46 @@
+import json
+import threading
+
+KEEPALIVE_SECONDS = 15  # an idle stream sends a comment this often so proxies keep it open
+
+
+class PushHub:
+    """Latest value (a flat dict) of each named channel, streamed as Server-Sent Events.
+
+    `publish` replaces a channel's value and wakes every open stream. Each
+    stream sends only the fields that differ from what it sent last, so a
+    new subscriber gets the whole state once and a slow one skips straight
+    to the newest values instead of working through a backlog.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.version = 0
+        self._changed = threading.Condition()
+
+    def publish(self, channel, value):
+        with self._changed:
+            if self.values.get(channel) == value:
+                return
+            self.values[channel] = dict(value)
+            self.version += 1
+            self._changed.notify_all()
+
+    def stream(self, keepalive=KEEPALIVE_SECONDS):
+        """Generator of SSE text for one subscriber (holds a server thread while open)."""
+        sent, version = {}, -1
+        yield "retry: 2000\n\n"  # browsers reconnect after 2 s and get a fresh snapshot
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self.version != version, keepalive)
+                version, values = self.version, dict(self.values)
+            idle = True
+            for channel, value in values.items():
+                last = sent.get(channel, {})
+                delta = {k: v for k, v in value.items() if k not in last or last[k] != v}
+                if delta:
+                    sent[channel] = value
+                    idle = False
+                    yield f"event: {channel}\ndata: {json.dumps(delta)}\n\n"
+            if idle:
+                yield ": keepalive\n\n"
@@ -0,0 +1,240 @@
+"""High-rate sensor load for many virtual machines, generated with NumPy in bulk.
+
+Every tick produces one reading per machine from a vectorized model:
+per-machine operating points, slow random-walk drift, degradation ramps
+(a share of machines wear out and are "maintained" back to zero), and
+fault episodes (overheat, bearing wear, overload) that start at random,
+last a random number of ticks, and are logged as ground truth.
+
+Readings go to MQTT (factory/<machine_id>/sensors, as machine_sensor_sim.py),
+to the file engine's spool (as machine_sensor_sim_file.py), or nowhere
+(measures the generator itself), at a target rate with achieved msgs/s
+printed as it runs. With --format binary (or auto, when the engine
+advertises it) each chunk of --chunk readings goes out as one binary batch
+(twin/wire.py) on factory/fleet/sensors instead of one JSON message per
+reading.
+
+    python fleet_load_generator.py --machines 2000 --rate 20000 --duration 60 --sink mqtt --truth faults.csv
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "twin"))
+import wire
+
+SIGNALS = ("temperature", "vibration", "rpm", "current", "load")
+NOMINAL_LOW = np.array([55.0, 2.0, 1200.0, 7.0, 60.0])
+NOMINAL_HIGH = np.array([70.0, 4.0, 1600.0, 10.0, 85.0])
+NOISE = np.array([0.8, 0.25, 15.0, 0.3, 3.0])
+DRIFT = np.array([0.02, 0.005, 0.5, 0.005, 0.05])  # random-walk step per tick
+DRIFT_DECAY = 0.999  # pulls drift back towards the operating point
+WEAR = np.array([15.0, 3.0, 0.0, 2.0, 0.0])  # added at full degradation
+FAULTS = ("overheat", "bearing", "overload")
+FAULT_OFFSETS = np.array([
+    [20.0, 0.5, 0.0, 1.0, 0.0],      # overheat
+    [3.0, 4.0, 150.0, 0.5, 0.0],     # bearing
+    [8.0, 1.0, -200.0, 4.0, 25.0],   # overload
+])
+PAYLOAD = ('{"timestamp": "%s", "machine_id": "%s", "temperature": %.2f, "vibration": %.2f, '
+           '"rpm": %d, "current": %.2f, "load": %d}')
+TRUTH_COLUMNS = ["machine_id", "fault", "start", "end", "start_tick", "end_tick"]
+
+
+def _utc(t):
+    # same clock and format as the engine's row timestamps
+    return datetime.utcfromtimestamp(t).isoformat()
+
+
+class FleetSimulator:
+    def __init__(self, n_machines, seed=0, ramp_fraction=0.1, ramp_ticks=(2000, 20000),
+                 fault_probability=1e-4, fault_ticks=(10, 120)):
+        self.rng = np.random.default_rng(seed)
+        self.n = n_machines
+        self.machine_ids = [f"machine{i}" for i in range(n_machines)]
+        self._wire_ids = np.array(self.machine_ids, dtype=wire.READING["machine_id"])
+        self.tick = 0
+        self.nominal = self.rng.uniform(NOMINAL_LOW, NOMINAL_HIGH, (n_machines, len(SIGNALS)))
+        self.drift = np.zeros((n_machines, len(SIGNALS)))
+        # degradation: machines with a ramp go from 0 to 1 over their ramp length, then get maintained
+        ramps = self.rng.random(n_machines) < ramp_fraction
+        self.wear_rate = np.where(ramps, 1.0 / self.rng.uniform(*ramp_ticks, n_machines), 0.0)
+        self.wear = self.rng.random(n_machines) * (self.wear_rate > 0)
+        self.fault_probability = fault_probability
+        self.fault_ticks = fault_ticks
+        self.fault = np.full(n_machines, -1)
+        self.fault_left = np.zeros(n_machines, dtype=int)
+        self.fault_start = np.zeros(n_machines)
+        self.fault_start_tick = np.zeros(n_machines, dtype=int)
+        self.episodes = []  # ground truth of episodes that ended in the last step, see TRUTH_COLUMNS
+
+    def step(self):
+        """One reading per machine: (values n x 5, active fault index per machine or -1)."""
+        rng, n = self.rng, self.n
+        self.tick += 1
+        self.drift = self.drift * DRIFT_DECAY + rng.standard_normal((n, len(SIGNALS))) * DRIFT
+        self.wear += self.wear_rate
+        self.wear[self.wear >= 1.0] = 0.0
+
+        now = time.time()
+        starting = (self.fault < 0) & (rng.random(n) < self.fault_probability)
+        idx = np.flatnonzero(starting)
+        if len(idx):
+            self.fault[idx] = rng.integers(0, len(FAULTS), len(idx))
+            self.fault_left[idx] = rng.integers(*self.fault_ticks, len(idx))
+            self.fault_start[idx] = now
+            self.fault_start_tick[idx] = self.tick
+
+        X = self.nominal + self.drift + self.wear[:, None] * WEAR + rng.standard_normal((n, len(SIGNALS))) * NOISE
+        active = self.fault >= 0
+        X[active] += FAULT_OFFSETS[self.fault[active]]
+        fault = self.fault.copy()
+
+        self.fault_left[active] -= 1
+        ending = np.flatnonzero(active & (self.fault_left <= 0))
+        self.episodes = [
+            (self.machine_ids[i], FAULTS[self.fault[i]], _utc(self.fault_start[i]), _utc(now),
+             self.fault_start_tick[i], self.tick)
+            for i in ending.tolist()
+        ]
+        self.fault[ending] = -1
+        return X, fault
+
+    def payloads(self, X):
+        timestamp = datetime.now().isoformat()
+        return [PAYLOAD % (timestamp, machine_id, *row) for machine_id, row in zip(self.machine_ids, X.tolist())]
+
+    def records(self, X):
+        batch = wire.records(self.n)
+        batch["time"] = time.time()
+        batch["machine_id"] = self._wire_ids
+        for i, name in enumerate(SIGNALS):
+            batch[name] = np.clip(X[:, i], 0, 65535) if name in wire.INTS else X[:, i]
+        return batch
+
+
+class MqttSink:
+    def __init__(self, broker):
+        import paho.mqtt.client as mqtt
+        self.client = mqtt.Client()
+        self.client.connect(broker, 1883, 60)
+        self.client.loop_start()
+
+    def send(self, machine_ids, payloads):
+        for machine_id, payload in zip(machine_ids, payloads):
+            self.client.publish(f"factory/{machine_id}/sensors", payload)
+
+    def send_batch(self, batch):
+        self.client.publish(wire.BATCH_TOPIC, wire.encode(batch))
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+class SpoolSink:
+    def __init__(self, directory):
+        from machine_sensor_sim_file import SpoolWriter
+        self.writer = SpoolWriter(directory)
+
+    def send(self, machine_ids, payloads):
+        self.writer.write_lines(payloads)
+
+    def close(self):
+        self.writer.close()
+
+
+class NullSink:
+    def send(self, machine_ids, payloads):
+        pass
+
+    def send_batch(self, batch):
+        wire.encode(batch)
+
+    def close(self):
+        pass
+
+
+def run(sim, sink, rate, duration, chunk, truth_writer=None, report_seconds=5.0, fmt="json"):
+    start = time.perf_counter()
+    sent = 0
+    last_report, last_sent = start, 0
+    while time.perf_counter() - start < duration:
+        X, _ = sim.step()
+        if truth_writer is not None and sim.episodes:
+            truth_writer.writerows(sim.episodes)
+        if fmt == "binary":
+            batch = sim.records(X)
+            send = lambda first: sink.send_batch(batch[first:first + chunk])
+        else:
+            payloads = sim.payloads(X)
+            send = lambda first: sink.send(sim.machine_ids[first:first + chunk], payloads[first:first + chunk])
+        for first in range(0, sim.n, chunk):
+            send(first)
+            sent += min(chunk, sim.n - first)
+            # rate control against an absolute schedule, so short stalls are caught up
+            delay = start + sent / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        now = time.perf_counter()
+        if now - last_report >= report_seconds:
+            print(f"[{datetime.now()}] {(sent - last_sent) / (now - last_report):,.0f} msgs/s "
+                  f"(target {rate:,.0f}), {sent:,} sent, tick {sim.tick}")
+            last_report, last_sent = now, sent
+    elapsed = time.perf_counter() - start
+    print(f"Sent {sent:,} readings from {sim.n} machines in {elapsed:.1f}s: {sent / elapsed:,.0f} msgs/s "
+          f"(target {rate:,.0f})")
+    return sent / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--machines", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=10000, help="target readings/second")
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--sink", choices=("mqtt", "spool", "null"), default="mqtt")
+    parser.add_argument("--broker", default="localhost")
+    parser.add_argument("--spool-dir", default=os.path.join("..", "data", "spool"))
+    parser.add_argument("--chunk", type=int, default=500, help="readings sent between rate checks (one binary batch)")
+    parser.add_argument("--format", choices=("auto",) + wire.FORMATS, default="auto",
+                        help="payload format; auto picks binary when the engine advertises it (mqtt sink)")
+    parser.add_argument("--fault-probability", type=float, default=1e-4, help="per machine per tick")
+    parser.add_argument("--truth", help="CSV file for ground-truth fault episodes")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.sink == "spool" and args.format == "binary":
+        parser.error("the spool takes JSON lines only")
+
+    sim = FleetSimulator(args.machines, seed=args.seed, fault_probability=args.fault_probability)
+    fmt = "json" if args.format == "auto" else args.format
+    if args.sink == "mqtt":
+        sink = MqttSink(args.broker)
+        fmt = wire.negotiate(sink.client, args.format, batch_size=min(args.chunk, args.machines))
+    elif args.sink == "spool":
+        sink = SpoolSink(args.spool_dir)
+    else:
+        sink = NullSink()
+    print(f"Sending {fmt} payloads")
+
+    truth_file = open(args.truth, "w", newline="") if args.truth else None
+    truth_writer = None
+    if truth_file is not None:
+        truth_writer = csv.writer(truth_file)
+        truth_writer.writerow(TRUTH_COLUMNS)
+    try:
+        run(sim, sink, args.rate, args.duration, args.chunk, truth_writer, fmt=fmt)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.close()
+        if truth_file is not None:
+            truth_file.close()
+
+
+if __name__ == "__main__":
+    main()
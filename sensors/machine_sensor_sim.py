@@ -1,12 +1,17 @@
-
 import time
 import json
 import random
+import os
+import sys
 import paho.mqtt.client as mqtt
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "twin"))
+import wire
+
 # MQTT Config
 BROKER = "localhost"
 TOPIC = "factory/machine1/sensors"
+FORMAT = "auto"  # "json", "binary" (wire.py batch of one reading), or "auto": JSON, as one reading per message parses no faster in binary
 
 # Connect to MQTT broker
 client = mqtt.Client()
@@ -25,11 +30,22 @@ def generate_sensor_data():
     }
     return data
 
+def encode_binary(sensor_data):
+    # machine_id left empty: the engine takes it from TOPIC
+    batch = wire.records(1)
+    batch["time"] = time.time()
+    for name, value in sensor_data.items():
+        batch[name] = value
+    return wire.encode(batch)
+
 def main():
     print("Machine Sensor Simulator running...")
+    client.loop_start()
+    fmt = wire.negotiate(client, FORMAT, batch_size=1)
+    print("Payload format:", fmt)
     while True:
         sensor_data = generate_sensor_data()
-        payload = json.dumps(sensor_data)
+        payload = encode_binary(sensor_data) if fmt == "binary" else json.dumps(sensor_data)
         client.publish(TOPIC, payload)
         print("Published:", sensor_data)
         time.sleep(1)  # 1 second interval
@@ -6,10 +6,16 @@ import os
 from datetime import datetime
 
 DATA_FILE = os.path.join("..", "data", "sensor_data.json")
+SPOOL_DIR = os.path.join("..", "data", "spool")
+OUTPUT = "spool"  # "spool": append JSON lines to SPOOL_DIR (nothing lost); "json": overwrite DATA_FILE
+SPOOL_SEGMENT_BYTES = 1 << 20  # start a new spool segment after ~1 MB
+MACHINE_ID = "machine1"
+INTERVAL_SECONDS = 2
 
 def generate_sensor_data():
     return {
         "timestamp": datetime.now().isoformat(),
+        "machine_id": MACHINE_ID,
         "temperature": round(random.uniform(50, 85), 2),
         "vibration": round(random.uniform(1, 8), 2),
         "rpm": random.randint(1000, 2000),
@@ -17,19 +23,65 @@ def generate_sensor_data():
         "load": random.randint(50, 100)
     }
 
+class SpoolWriter:
+    """Appends readings as JSON lines to `seg-<n>.jsonl` files in a spool directory.
+
+    Segment names are nanosecond timestamps, so they keep increasing across
+    restarts. A segment is closed before the next one is created, which is
+    what lets the reader (twin/spool.py) know a segment is complete.
+    """
+
+    def __init__(self, directory, segment_bytes=SPOOL_SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._last = 0
+        self._file = None
+        self._open_next()
+
+    def _open_next(self):
+        if self._file is not None:
+            self._file.close()
+        self._last = max(self._last + 1, time.time_ns())
+        self._file = open(os.path.join(self.directory, f"seg-{self._last:020d}.jsonl"), "a")
+
+    def write_many(self, readings):
+        self.write_lines([json.dumps(r) for r in readings])
+
+    def write_lines(self, lines):
+        # lines: already-encoded JSON objects
+        self._file.write("".join(line + "\n" for line in lines))
+        self._file.flush()
+        if self._file.tell() >= self.segment_bytes:
+            self._open_next()
+
+    def write(self, reading):
+        self.write_many([reading])
+
+    def close(self):
+        self._file.close()
+
 def main():
     print("Machine Sensor Simulator (File-based) running...")
     os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
-    
+    spool = SpoolWriter(SPOOL_DIR) if OUTPUT == "spool" else None
+    seq = 0
+
     while True:
         sensor_data = generate_sensor_data()
-        
-        # Write to JSON file
-        with open(DATA_FILE, 'w') as f:
-            json.dump(sensor_data, f)
-        
+        sensor_data["seq"] = seq
+        seq += 1
+
+        if spool is not None:
+            # Append to the spool
+            spool.write(sensor_data)
+        else:
+            # Write to JSON file
+            with open(DATA_FILE, 'w') as f:
+                json.dump(sensor_data, f)
+
         print("Generated:", sensor_data)
-        time.sleep(2)
+        time.sleep(INTERVAL_SECONDS)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
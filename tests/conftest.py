@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the engine's modules are flat scripts in twin/, imported the way the engine and benchmarks do
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "twin"))
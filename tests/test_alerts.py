@@ -0,0 +1,24 @@
+from alerts import AlertManager
+
+
+def test_silent_machine_episode_closes_as_stale():
+    clock = [0.0]
+    manager = AlertManager(stale_seconds=300.0, clock=lambda: clock[0])
+    published = []
+    publish = lambda topic, payload: published.append(payload)
+
+    manager.observe([{"machine_id": "m1", "timestamp": "t0", "anomaly": 1, "risk_score": 0.9},
+                     {"machine_id": "m2", "timestamp": "t0", "anomaly": 1, "risk_score": 0.9}])
+    assert [e["event"] for e in manager.flush(publish)["events"]] == ["opened", "opened"]
+
+    clock[0] = 200.0  # m2 keeps alerting, m1 goes silent
+    manager.observe([{"machine_id": "m2", "timestamp": "t1", "anomaly": 1, "risk_score": 0.9}])
+    assert [e["event"] for e in manager.flush(publish)["events"]] == ["updated"]
+    assert set(manager.episodes) == {"m1", "m2"}
+
+    clock[0] = 300.0
+    summary = manager.flush(publish)
+    assert [(e["event"], e["episode"], e.get("stale")) for e in summary["events"]] == [("closed", "m1#1", True)]
+    assert set(manager.episodes) == {"m2"}
+    assert summary["open_episodes"] == 1
+    assert len(published) == 3
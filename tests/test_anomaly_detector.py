@@ -0,0 +1,30 @@
+import numpy as np
+
+from anomaly_detector import OnlineMahalanobis
+
+
+def normal(rng, n, level=0.0):
+    return level + rng.standard_normal((n, 5))
+
+
+def test_spike_is_flagged_and_not_absorbed():
+    rng = np.random.default_rng(0)
+    model = OnlineMahalanobis()
+    model.fit(normal(rng, 500))
+    mean = model.mean.copy()
+
+    assert model.score_update(np.full(5, 20.0))
+    assert np.array_equal(model.mean, mean)
+    assert sum(model.score_update(x) for x in normal(rng, 200)) <= 2
+
+
+def test_step_change_recovers():
+    rng = np.random.default_rng(1)
+    model = OnlineMahalanobis(rebaseline=20, warmup=50)
+    model.fit(normal(rng, 500))
+
+    flagged = [model.score_update(x) for x in normal(rng, 300, level=10.0)]
+
+    assert all(flagged[:20])  # the new level is anomalous at first ...
+    assert sum(flagged[100:]) <= 2  # ... and normal once the model has re-baselined on it
+    assert np.allclose(model.mean, 10.0, atol=0.5)
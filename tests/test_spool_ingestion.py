@@ -0,0 +1,67 @@
+import csv
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, "sensors"))
+
+from machine_sensor_sim_file import SpoolWriter, generate_sensor_data
+
+ENGINE = os.path.join(ROOT, "twin", "twin_engine_file.py")
+
+
+def readings(first, n):
+    # timestamps double as unique ids: the history CSV keeps them as written
+    start = datetime(2024, 1, 1)
+    return [dict(generate_sensor_data(), timestamp=(start + timedelta(seconds=seq)).isoformat(), seq=seq)
+            for seq in range(first, first + n)]
+
+
+def stored(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, newline="") as f:
+        return {row["timestamp"] for row in csv.DictReader(f)}
+
+
+def start_engine(workdir):
+    # the engine's paths are relative to its working directory ("../data/...")
+    return subprocess.Popen([sys.executable, ENGINE], cwd=workdir, stdout=subprocess.DEVNULL)
+
+
+def wait_for(condition, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.1)
+    return condition()
+
+
+def test_every_spooled_reading_reaches_storage_across_a_crash(tmp_path):
+    workdir = tmp_path / "twin"
+    workdir.mkdir()
+    spool = SpoolWriter(str(tmp_path / "data" / "spool"), segment_bytes=8 * 1024)  # many segments
+    history = str(tmp_path / "data" / "machine_live.csv")
+    written = readings(0, 3000)
+    spool.write_many(written)
+
+    engine = start_engine(workdir)
+    try:
+        assert wait_for(lambda: len(stored(history)) >= 1000)
+        engine.kill()  # no clean shutdown: buffered rows and uncommitted offsets are lost with it
+        engine.wait()
+
+        more = readings(3000, 1000)
+        spool.write_many(more)
+        spool.close()
+        written += more
+        engine = start_engine(workdir)
+        expected = {r["timestamp"] for r in written}
+        assert wait_for(lambda: expected <= stored(history)), \
+            f"{len(expected - stored(history))} of {len(expected)} readings never reached storage"
+    finally:
+        engine.kill()
+        engine.wait()
@@ -0,0 +1,71 @@
+import numpy as np
+
+from state_estimation import MAX_GATED, NOISE_MODELS, FleetKalman
+
+NOISE = np.array(NOISE_MODELS["fleet_load_generator"]["measurement_std"])
+LEVEL = np.array([60.0, 3.0, 1400.0, 8.0])
+
+
+def run(kalman, readings, start=0):
+    return [kalman.step(["m1"], [float(start + t)], [z]) for t, z in enumerate(readings)]
+
+
+def test_normal_readings_are_smoothed():
+    rng = np.random.default_rng(0)
+    readings = LEVEL + rng.standard_normal((500, 4)) * NOISE
+    out = run(FleetKalman("fleet_load_generator"), readings)[100:]
+    filtered = np.array([o["filtered"][0] for o in out])
+    raw_rmse = np.sqrt(((readings[100:] - LEVEL) ** 2).mean(axis=0))
+    kf_rmse = np.sqrt(((filtered - LEVEL) ** 2).mean(axis=0))
+    assert (kf_rmse < raw_rmse / 2).all()
+    assert not any(o["gated"][0] or o["anomaly"][0] for o in out)
+
+
+def test_spike_is_gated_and_not_absorbed():
+    rng = np.random.default_rng(1)
+    kalman = FleetKalman("fleet_load_generator")
+    run(kalman, LEVEL + rng.standard_normal((200, 4)) * NOISE)
+    before = kalman.x[0].copy()
+    spike = kalman.step(["m1"], [200.0], [LEVEL + [20.0, 0, 0, 0]])
+    assert spike["gated"][0] and spike["anomaly"][0]
+    assert abs(spike["filtered"][0][0] - LEVEL[0]) < NOISE[0]  # the prediction, not the spike
+    np.testing.assert_allclose(kalman.x[0, :4], before[:4] + before[4:], rtol=1e-9)
+    after = kalman.step(["m1"], [201.0], [LEVEL])
+    assert not after["gated"][0]
+
+
+def test_step_change_restarts_the_machine():
+    rng = np.random.default_rng(2)
+    kalman = FleetKalman("fleet_load_generator")
+    run(kalman, LEVEL + rng.standard_normal((200, 4)) * NOISE)
+    shifted = LEVEL + [20.0, 0, 0, 0]
+    out = run(kalman, [shifted] * (MAX_GATED + 5), start=200)
+    assert all(o["gated"][0] for o in out[:MAX_GATED])
+    assert not any(o["gated"][0] for o in out[MAX_GATED:])
+    assert abs(out[-1]["filtered"][0][0] - shifted[0]) < NOISE[0]
+
+
+class _Quiet:
+    # a detector and predictor that never alert, so every anomaly comes from the filter
+    feature_names = ("temperature",)
+    version = 0
+
+    def is_anomaly(self, X):
+        return np.zeros(len(X), dtype=bool)
+
+    def predict_batch(self, X):
+        return np.zeros(len(X))
+
+
+def test_score_rows_flags_readings_far_off_the_estimate():
+    from fleet import MachineModels, score_rows
+    quiet = _Quiet()
+    models = MachineModels(shared=lambda: (quiet, quiet), state_estimation={"noise_model": "fleet_load_generator"})
+    rng = np.random.default_rng(3)
+    for t in range(100):
+        anomalies, _, _ = score_rows(models, ["m1"], [[*(LEVEL + rng.standard_normal(4) * NOISE), 70.0]], times=[t])
+        assert anomalies == [False]
+    estimates = {}
+    anomalies, _, _ = score_rows(models, ["m1"], [[*(LEVEL + [20.0, 0, 0, 0]), 70.0]], times=[100.0],
+                                 estimates=estimates)
+    assert anomalies == [True] and estimates["gated"][0]
@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from history_index import ALL, HistoryIndex
+from storage import CsvStorage, CsvTail
+
+
+def rows(start, n):
+    return [{"timestamp": f"2026-01-01T00:{i // 60:02d}:{i % 60:02d}", "temperature": 60.0,
+             "machine_id": "m1"} for i in range(start, start + n)]
+
+
+def write_blocks(storage, blocks, size):
+    for block in range(blocks):
+        storage.append_many(rows(block * size, size))
+        storage.flush()
+
+
+def snapshot(path):
+    trims = path + ".trims"
+    with open(path, "rb") as f:
+        data = f.read()
+    return data, os.stat(path).st_ino, os.path.getsize(trims) if os.path.exists(trims) else 0
+
+
+def test_trim_keeps_index_and_tails_in_step(tmp_path):
+    storage = CsvStorage(str(tmp_path / "history.csv"))
+    write_blocks(storage, 4, 10)
+    tail = CsvTail(storage.path)
+    assert len(tail.read_new()) == 40
+    storage.append_many(rows(40, 10))
+    storage.flush()
+    offset = int(storage.index._tables[ALL].items[2]["offset"])  # start of the third block
+    assert storage.drop_before(offset) > 0
+    assert storage.index.last(100)["timestamp"].tolist() == [r["timestamp"] for r in rows(20, 30)]
+    assert len(tail.read_new()) == 10  # only the rows written after its last read
+    assert not os.path.exists(storage.path + ".old")
+    storage.close()
+
+
+@pytest.mark.parametrize("failure", ["locked", "error"])
+def test_failed_index_commit_puts_the_csv_back(tmp_path, monkeypatch, failure):
+    storage = CsvStorage(str(tmp_path / "history.csv"))
+    write_blocks(storage, 4, 10)
+    before = snapshot(storage.path)
+    offset = int(storage.index._tables[ALL].items[2]["offset"])
+
+    def commit_drop(self, tmp):
+        if failure == "locked":
+            return False
+        raise OSError("disk full")
+
+    monkeypatch.setattr(HistoryIndex, "commit_drop", commit_drop)
+    if failure == "locked":
+        assert storage.drop_before(offset) is None
+    else:
+        with pytest.raises(OSError):
+            storage.drop_before(offset)
+    assert snapshot(storage.path) == before
+    assert [name for name in os.listdir(tmp_path) if name.endswith((".tmp", ".old"))] == []
+    storage.append_many(rows(40, 10))
+    storage.flush()
+    assert storage.index.last(100)["timestamp"].tolist() == [r["timestamp"] for r in rows(0, 50)]
+    storage.close()
+
+
+def test_training_reads_only_complete_segments(tmp_path):
+    pytest.importorskip("pyarrow")
+    from storage import ColumnarStorage
+    from train import _chunks
+    storage = ColumnarStorage(str(tmp_path / "history"))
+    write_blocks(storage, 2, 10)
+    storage.close()
+    segment = sorted((tmp_path / "history").glob("*/seg-*.parquet"))[0]
+    for suffix in (".tmp", ".ready"):  # an interrupted write and compaction
+        (segment.parent / (segment.name + suffix)).write_bytes(b"partial")
+    assert sum(len(df) for df in _chunks(str(tmp_path / "history"), None, 1 << 20)) == 20
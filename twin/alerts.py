@@ -0,0 +1,145 @@
+import json
+import threading
+import time
+
+SUMMARY_TOPIC = "factory/fleet/alerts"  # matches the per-machine subscription factory/+/alerts
+
+
+class _Episode:
+    __slots__ = ("machine_id", "number", "opened", "last", "readings", "anomalies", "max_risk", "risk",
+                 "clear", "last_event", "seen")
+
+    def __init__(self, machine_id, number, row, now):
+        self.machine_id, self.number = machine_id, number
+        self.opened = row.get("timestamp")
+        self.readings = self.anomalies = 0
+        self.max_risk = 0.0
+        self.clear = 0  # consecutive readings below the off threshold
+        self.last_event = self.seen = now  # seen: when the machine last sent a reading
+        self.add(row)
+
+    def add(self, row):
+        self.last = row.get("timestamp")
+        self.readings += 1
+        self.anomalies += bool(row.get("anomaly"))
+        self.risk = float(row.get("risk_score") or 0.0)
+        self.max_risk = max(self.max_risk, self.risk)
+
+    def event(self, kind, **extra):
+        event = {"event": kind, "episode": f"{self.machine_id}#{self.number}", "last": self.last,
+                 "readings": self.readings, "anomalies": self.anomalies, "risk_score": round(self.risk, 3),
+                 "max_risk": round(self.max_risk, 3)}
+        if kind == "opened":  # later events of the episode refer to it by "episode"
+            event.update(machine_id=self.machine_id, opened=self.opened)
+        event.update(extra)
+        return event
+
+
+class AlertManager:
+    """Alert episodes per machine instead of one alert per alerting reading.
+
+    An episode opens on an anomaly or a risk above `on_risk` and closes
+    once `clear_readings` readings in a row have no anomaly and a risk
+    below `off_risk` (hysteresis, so a risk hovering around the threshold
+    does not flap). While open, readings only update it; an "updated"
+    event is emitted at most once per `dedup_seconds` per episode, and
+    every other alerting reading is counted as suppressed. Events are
+    queued and `flush` publishes them as one summary message at most per
+    `summary_seconds`, so a fleet-wide fault costs one message per
+    interval instead of one per machine per reading.
+
+    A machine that sends no reading for `stale_seconds` cannot clear its
+    episode, so `flush` closes it as stale (a "closed" event with
+    "stale": true).
+
+    `observe` runs in the alert stage; `flush` may also be called from a
+    timer so a summary goes out and stale episodes close when readings stop.
+    """
+
+    def __init__(self, on_risk=0.6, off_risk=0.4, clear_readings=5, dedup_seconds=60.0, summary_seconds=5.0,
+                 stale_seconds=300.0, metrics=None, clock=time.monotonic):
+        self.on_risk, self.off_risk, self.clear_readings = on_risk, off_risk, clear_readings
+        self.dedup_seconds, self.summary_seconds = dedup_seconds, summary_seconds
+        self.stale_seconds = stale_seconds
+        self.clock = clock
+        self.episodes = {}  # machine_id -> open _Episode
+        self.numbers = {}  # machine_id -> episodes opened so far
+        self.pending = []
+        self.counts = {"alerting_readings": 0, "suppressed": 0, "opened": 0, "updated": 0, "closed": 0,
+                       "messages": 0}
+        self._next_summary = clock()  # the first events after a quiet interval go out at once
+        self._lock = threading.Lock()
+        if metrics is not None:
+            self._export(metrics)
+
+    def _export(self, metrics):
+        metrics.counter("twin_alert_readings_total", "Readings with an anomaly or risk above the alert threshold",
+                        fn=lambda: self.counts["alerting_readings"])
+        metrics.counter("twin_alerts_suppressed_total", "Alerting readings folded into an open episode",
+                        fn=lambda: self.counts["suppressed"])
+        for kind in ("opened", "updated", "closed"):
+            metrics.counter("twin_alert_events_total", "Alert episode events emitted", {"event": kind},
+                            fn=lambda kind=kind: self.counts[kind])
+        metrics.counter("twin_alert_messages_total", "Alert summary messages published",
+                        fn=lambda: self.counts["messages"])
+        metrics.gauge("twin_alert_episodes_open", "Machines with an open alert episode", fn=lambda: len(self.episodes))
+
+    def _emit(self, episode, kind, now, **extra):
+        self.pending.append(episode.event(kind, **extra))
+        self.counts[kind] += 1
+        episode.last_event = now
+
+    def observe(self, rows):
+        with self._lock:
+            self._observe(rows, self.clock())
+
+    def _observe(self, rows, now):
+        for row in rows:
+            risk = float(row.get("risk_score") or 0.0)
+            alerting = bool(row.get("anomaly")) or risk > self.on_risk
+            self.counts["alerting_readings"] += alerting
+            machine_id = row["machine_id"]
+            episode = self.episodes.get(machine_id)
+            if episode is None:
+                if alerting:
+                    number = self.numbers[machine_id] = self.numbers.get(machine_id, 0) + 1
+                    episode = self.episodes[machine_id] = _Episode(machine_id, number, row, now)
+                    self._emit(episode, "opened", now)
+                continue
+            episode.add(row)
+            episode.seen = now
+            if bool(row.get("anomaly")) or risk >= self.off_risk:
+                episode.clear = 0
+            else:
+                episode.clear += 1
+                if episode.clear >= self.clear_readings:
+                    del self.episodes[machine_id]
+                    self._emit(episode, "closed", now)
+                    continue
+            if alerting:
+                if now - episode.last_event >= self.dedup_seconds:
+                    self._emit(episode, "updated", now)
+                else:
+                    self.counts["suppressed"] += 1
+
+    def _expire(self, now):
+        for machine_id, episode in list(self.episodes.items()):
+            if now - episode.seen >= self.stale_seconds:
+                del self.episodes[machine_id]
+                self._emit(episode, "closed", now, stale=True)
+
+    def flush(self, publish, force=False):
+        """Close stale episodes, then publish queued events as one summary via publish(topic, payload)
+        once the summary interval has passed (or now with `force`); returns the message or None."""
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            if not self.pending or (now < self._next_summary and not force):
+                return None
+            self._next_summary = now + self.summary_seconds
+            events, self.pending = self.pending, []
+            summary = {"timestamp": events[-1]["last"], "events": events, "open_episodes": len(self.episodes),
+                       "suppressed_total": self.counts["suppressed"]}
+            self.counts["messages"] += 1
+        publish(SUMMARY_TOPIC, json.dumps(summary, separators=(",", ":")))
+        return summary
@@ -1,31 +1,184 @@
 import os
-import joblib
+import statistics
 import numpy as np
-from sklearn.ensemble import IsolationForest
+
+from tree_export import FlatIsolationForest
 
 MODEL_DIR = os.path.join(os.path.dirname(__file__), "..", "models")
 os.makedirs(MODEL_DIR, exist_ok=True)
 
+
+def chi2_quantile(p, d):
+    # Wilson-Hilferty approximation of the chi-square quantile
+    z = statistics.NormalDist().inv_cdf(p)
+    return d * (1 - 2 / (9 * d) + z * (2 / (9 * d)) ** 0.5) ** 3
+
+
+class OnlineMahalanobis:
+    """Streaming Gaussian model of one machine's readings.
+
+    Keeps an exponentially weighted mean and covariance (weight 1/n until
+    1/n drops below the forgetting rate, so the start is an exact running
+    covariance) and flags a reading whose squared Mahalanobis distance to
+    the current model exceeds the chi-square quantile `p` for d degrees of
+    freedom. Each reading is scored against the model *before* it is
+    absorbed, and anomalous readings are not absorbed, so a spike does not
+    drag the model. `rebaseline` anomalous readings in a row are a change
+    of operating point (new setpoint, sensor swapped), not a fault that
+    comes and goes (the default outlasts the fleet load generator's fault
+    episodes): the model restarts from those readings and warms up again. Memory and time per reading are O(d^2) and O(d^3), constant
+    for the five features.
+    """
+
+    def __init__(self, n_features=5, halflife=2000, p=0.999, warmup=50, rebaseline=150):
+        self.alpha = 1.0 - 0.5 ** (1.0 / halflife)
+        self.warmup = warmup
+        self.rebaseline = rebaseline
+        self.threshold = chi2_quantile(p, n_features)
+        self.n = 0
+        self.mean = np.zeros(n_features)
+        self.cov = np.zeros((n_features, n_features))
+        self.inv = None
+        self.run = []  # the current run of anomalous readings
+
+    def distance(self, x):
+        """Squared Mahalanobis distance of x to the current model."""
+        if self.inv is None:
+            # ridge keeps constant signals (zero variance) invertible
+            ridge = np.diag(1e-6 * np.diag(self.cov) + 1e-9)
+            self.inv = np.linalg.inv(self.cov + ridge)
+        delta = x - self.mean
+        return float(delta @ self.inv @ delta)
+
+    def update(self, x):
+        self.n += 1
+        w = max(1.0 / self.n, self.alpha)
+        delta = x - self.mean
+        self.mean += w * delta
+        self.cov = (1.0 - w) * (self.cov + w * np.outer(delta, delta))
+        self.inv = None
+
+    def score_update(self, x):
+        """True if x is anomalous; normal readings are then absorbed into the model."""
+        x = np.asarray(x, dtype=float)
+        anomalous = self.n >= self.warmup and self.distance(x) > self.threshold
+        if not anomalous:
+            self.run = []
+            self.update(x)
+            return False
+        self.run.append(x)
+        if len(self.run) >= self.rebaseline:
+            run = self.run
+            self.set_state({"n": 0, "mean": np.zeros_like(self.mean), "cov": np.zeros_like(self.cov)})
+            for y in run:
+                self.update(y)
+        return True
+
+    def fit(self, X):
+        for x in np.asarray(X, dtype=float):
+            self.score_update(x)
+
+    def state(self):
+        return {"n": np.asarray(self.n), "mean": self.mean, "cov": self.cov}
+
+    def set_state(self, state):
+        self.n = int(state["n"])
+        self.mean = np.array(state["mean"], dtype=float)
+        self.cov = np.array(state["cov"], dtype=float)
+        self.inv = None
+        self.run = []
+
+
 class AnomalyDetector:
-    def __init__(self):
-        self.model = IsolationForest(contamination=0.05, random_state=42)
+    """Anomaly detector for sensor readings.
+
+    mode "iforest": batch IsolationForest, fitted offline with `fit`.
+    mode "online": OnlineMahalanobis, meant for one machine; `is_anomaly`
+    scores the rows in order and keeps learning from the normal ones, and
+    `fit` bootstraps it from history rows.
+    """
+
+    def __init__(self, machine_id=None, mode="iforest"):
+        if mode not in ("iforest", "online"):
+            raise ValueError(f"mode must be 'iforest' or 'online', got {mode!r}")
+        self.mode = mode
+        self.online = OnlineMahalanobis() if mode == "online" else None
+        self._model = None
         self.is_fitted = False
+        self.flat = None
+        # per-machine models live in models/<machine_id>/, the fleet-wide one in models/
+        self.model_dir = os.path.join(MODEL_DIR, machine_id) if machine_id else MODEL_DIR
+        self._model_path = None
+
+    @property
+    def model(self):
+        # sklearn (and the pickle) are only needed to fit or to score without a flat export
+        if self._model is None:
+            if self._model_path is not None and os.path.exists(self._model_path):
+                import joblib
+                self._model = joblib.load(self._model_path)
+            else:
+                from sklearn.ensemble import IsolationForest
+                self._model = IsolationForest(contamination=0.05, random_state=42)
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
 
     def fit(self, X):
+        if self.online is not None:
+            self.online.fit(X)
+            self.is_fitted = True
+            return
         self.model.fit(X)
+        self.flat = FlatIsolationForest.from_sklearn(self.model)
         self.is_fitted = True
 
     def is_anomaly(self, X):
+        if self.online is not None:
+            self.is_fitted = True
+            return [self.online.score_update(x) for x in np.asarray(X, dtype=float)]
         if not self.is_fitted or len(X) == 0:
             return [False] * len(X)
+        if self.flat is not None:
+            return self.flat.predict(np.asarray(X, dtype=float)).tolist()
         preds = self.model.predict(X)
         return (preds == -1).tolist()
 
-    def save(self, name="anomaly_iforest.pkl"):
-        joblib.dump(self.model, os.path.join(MODEL_DIR, name))
+    def save(self, name=None):
+        os.makedirs(self.model_dir, exist_ok=True)
+        if self.online is not None:
+            path = os.path.join(self.model_dir, name or "anomaly_online.npz")
+            with open(path + ".tmp", "wb") as f:
+                np.savez(f, **self.online.state())
+            os.replace(path + ".tmp", path)
+            return
+        import joblib
+        path = os.path.join(self.model_dir, name or "anomaly_iforest.pkl")
+        joblib.dump(self.model, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        if self.flat is not None:
+            self.flat.save(os.path.splitext(path)[0] + ".flat")
 
-    def load(self, name="anomaly_iforest.pkl"):
-        path = os.path.join(MODEL_DIR, name)
-        if os.path.exists(path):
+    def load(self, name=None, mmap=True):
+        """Load the saved model; with `mmap` the flat export is memory-mapped
+        and the pickle is only read if the sklearn model is actually used."""
+        if self.online is not None:
+            path = os.path.join(self.model_dir, name or "anomaly_online.npz")
+            if os.path.exists(path):
+                with np.load(path) as state:
+                    self.online.set_state(state)
+                self.is_fitted = True
+            return
+        path = os.path.join(self.model_dir, name or "anomaly_iforest.pkl")
+        flat_path = os.path.splitext(path)[0] + ".flat"
+        if mmap and os.path.exists(flat_path):
+            self.flat, _ = FlatIsolationForest.load(flat_path)
+            self._model, self._model_path = None, path
+            self.is_fitted = True
+        elif os.path.exists(path):
+            import joblib
             self.model = joblib.load(path)
+            self.flat = FlatIsolationForest.from_sklearn(self.model)
             self.is_fitted = True
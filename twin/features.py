@@ -0,0 +1,164 @@
+import collections
+import functools
+import math
+
+import numpy as np
+
+from predictive_maintenance import FEATURES
+
+WINDOWS = (10, 60)  # rolling windows, in readings
+EWMA_ALPHA = 0.2
+STATS = ("mean", "std", "min", "max", "slope")
+
+ROLLING_FEATURES = [f"{signal}_{stat}_{w}" for w in WINDOWS for stat in STATS for signal in FEATURES] + \
+                   [f"{signal}_ewma" for signal in FEATURES]
+ALL_FEATURES = FEATURES + ROLLING_FEATURES  # column order of RollingFeatures.update output
+
+
+class _Window:
+    """Running statistics of one signal over its last `size` readings.
+
+    Mean/variance use Welford's update with removal, slope keeps running
+    sums of y and i*y (i = 0 for the oldest reading in the window), and
+    min/max keep monotonic deques, so each push is O(1) (amortized for
+    min/max). The running sums are recomputed from the ring buffer once
+    per window to stop floating point drift, also O(1) amortized.
+
+    Plain floats: for a handful of values per update they are several times
+    faster than NumPy calls.
+    """
+
+    __slots__ = ("size", "buf", "seen", "n", "mean", "m2", "sum_y", "sum_iy", "mins", "maxs")
+
+    def __init__(self, size):
+        self.size = size
+        self.buf = [0.0] * size
+        self.seen = 0
+        self.n = 0
+        self.mean = self.m2 = self.sum_y = self.sum_iy = 0.0
+        self.mins = collections.deque()
+        self.maxs = collections.deque()
+
+    def push(self, x):
+        size, seen = self.size, self.seen
+        pos = seen % size
+        n, mean = self.n, self.mean
+        if n < size:
+            n += 1
+            new_mean = mean + (x - mean) / n
+            self.m2 += (x - mean) * (x - new_mean)
+            self.sum_iy += (n - 1) * x
+            self.sum_y += x
+            self.n = n
+        else:
+            old = self.buf[pos]
+            new_mean = mean + (x - old) / n
+            self.m2 += (x - old) * (x - new_mean + old - mean)
+            # drop the oldest (every index shifts down by one), then append at n - 1
+            self.sum_iy += old - self.sum_y + (n - 1) * x
+            self.sum_y += x - old
+        self.mean = new_mean
+        self.buf[pos] = x
+
+        oldest = seen - n + 1
+        mins, maxs = self.mins, self.maxs
+        while mins and mins[-1][1] >= x:
+            mins.pop()
+        mins.append((seen, x))
+        if mins[0][0] < oldest:
+            mins.popleft()
+        while maxs and maxs[-1][1] <= x:
+            maxs.pop()
+        maxs.append((seen, x))
+        if maxs[0][0] < oldest:
+            maxs.popleft()
+
+        self.seen = seen = seen + 1
+        if seen % size == 0:
+            self._resync()
+
+    def _resync(self):
+        # buffer in age order, oldest first (the window is full here)
+        start = self.seen % self.size
+        window = self.buf[start:] + self.buf[:start]
+        self.sum_y = math.fsum(window)
+        self.mean = self.sum_y / self.n
+        self.m2 = math.fsum((y - self.mean) ** 2 for y in window)
+        self.sum_iy = math.fsum(i * y for i, y in enumerate(window))
+
+    def stats(self):
+        """[mean, std, min, max, slope]"""
+        n = self.n
+        if n > 1:
+            # least squares slope of value against reading index
+            sum_i = n * (n - 1) / 2
+            sum_ii = (n - 1) * n * (2 * n - 1) / 6
+            slope = (n * self.sum_iy - sum_i * self.sum_y) / (n * sum_ii - sum_i * sum_i)
+        else:
+            slope = 0.0
+        return [self.mean, math.sqrt(max(self.m2, 0.0) / n), self.mins[0][1], self.maxs[0][1], slope]
+
+
+class RollingFeatures:
+    """Rolling statistics of one machine's readings, updated one reading at a time.
+
+    `update(x)` takes the raw FEATURES values and returns the full feature
+    vector in ALL_FEATURES order. Memory is fixed by WINDOWS.
+    """
+
+    def __init__(self, windows=WINDOWS, ewma_alpha=EWMA_ALPHA):
+        self.windows = [[_Window(w) for _ in FEATURES] for w in windows]
+        self.ewma_alpha = ewma_alpha
+        self.ewma = None
+
+    def update(self, x):
+        x = [float(v) for v in x]
+        if self.ewma is None:
+            self.ewma = list(x)
+        else:
+            alpha = self.ewma_alpha
+            self.ewma = [e + alpha * (v - e) for e, v in zip(self.ewma, x)]
+        out = list(x)
+        for signals in self.windows:
+            stats = []
+            for window, value in zip(signals, x):
+                window.push(value)
+                stats.append(window.stats())
+            # ALL_FEATURES order within a window: stat-major, then signal
+            for column in zip(*stats):
+                out.extend(column)
+        out.extend(self.ewma)
+        return out
+
+
+class MachineFeatures:
+    """RollingFeatures per machine id, shared by online scoring and retraining."""
+
+    def __init__(self):
+        self.machines = {}
+
+    def get(self, machine_id):
+        features = self.machines.get(machine_id)
+        if features is None:
+            features = self.machines[machine_id] = RollingFeatures()
+        return features
+
+    def transform(self, machine_ids, X):
+        """Feed rows (in arrival order) through each machine's features; returns rows x ALL_FEATURES."""
+        out = [self.get(machine_id).update(x) for machine_id, x in zip(machine_ids, np.asarray(X).tolist())]
+        return np.array(out, dtype=float).reshape(len(out), len(ALL_FEATURES))
+
+    def transform_frame(self, df, default_machine_id):
+        """Same as `transform` for a history DataFrame; returns a frame with ALL_FEATURES columns."""
+        import pandas as pd
+        machine_ids = df["machine_id"].fillna(default_machine_id).astype(str) if "machine_id" in df \
+            else [default_machine_id] * len(df)
+        X = df[FEATURES].astype(float).fillna(0).values
+        return pd.DataFrame(self.transform(list(machine_ids), X), columns=ALL_FEATURES, index=df.index)
+
+
+@functools.lru_cache(maxsize=None)
+def feature_columns(feature_names):
+    """Column indices of `feature_names` (a tuple) in ALL_FEATURES."""
+    index = {name: i for i, name in enumerate(ALL_FEATURES)}
+    return np.array([index[name] for name in feature_names], dtype=np.intp)
@@ -0,0 +1,313 @@
+import bisect
+import hashlib
+import itertools
+import multiprocessing as mp
+import os
+import threading
+import time
+
+import numpy as np
+
+from anomaly_detector import AnomalyDetector
+from features import RollingFeatures, feature_columns
+from predictive_maintenance import FEATURES, MODEL_DIR, PredictiveMaintenance
+from state_estimation import SIGNALS, FleetKalman
+
+DEFAULT_MACHINE_ID = "machine1"  # rows written before machine ids existed
+MODEL_FILES = ("anomaly_iforest.pkl", "anomaly_iforest.flat", "pm_rf.pkl", "pm_rf.flat")
+STATE_COLUMNS = [FEATURES.index(signal) for signal in SIGNALS]  # FleetKalman inputs within the raw FEATURES
+
+
+def machine_id_from_topic(topic):
+    # factory/<machine_id>/sensors
+    parts = topic.split("/")
+    return parts[1] if len(parts) >= 3 else DEFAULT_MACHINE_ID
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(str(key).encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring mapping machine ids to shards.
+
+    Each shard owns `replicas` points on the ring, so adding or removing a
+    shard only moves the machines that hashed next to its points.
+    """
+
+    def __init__(self, shards, replicas=100):
+        points = sorted((_hash(f"{shard}:{r}"), shard) for shard in shards for r in range(replicas))
+        self._keys = [key for key, _ in points]
+        self._shards = [shard for _, shard in points]
+        self._cache = {}
+
+    def shard(self, machine_id):
+        shard = self._cache.get(machine_id)
+        if shard is None:
+            i = bisect.bisect(self._keys, _hash(machine_id)) % len(self._keys)
+            shard = self._cache[machine_id] = self._shards[i]
+        return shard
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+class MachineState:
+    def __init__(self, machine_id, detector, predictor):
+        self.machine_id = machine_id
+        self.detector = detector
+        self.predictor = predictor
+        self.online = None  # per-machine online anomaly detector, when enabled
+        self.features = RollingFeatures()
+        self.readings = 0
+        self.last_seen = None
+
+
+class MachineModels:
+    """Per-machine state and model instances.
+
+    A machine uses its own models from models/<machine_id>/ when they exist,
+    otherwise the fleet-wide pair. `shared` is a callable returning that
+    pair (the engine passes its live, hot-swapped models); without it the
+    fleet models are loaded from models/. Model files are re-checked every
+    `reload_seconds` and reloaded when they change on disk.
+
+    With `online_anomaly` every machine also gets its own online anomaly
+    detector, started from models/<machine_id>/anomaly_online.npz if saved,
+    which replaces the batch detector for that machine. With
+    `state_estimation` (True, or a dict of FleetKalman settings such as
+    the noise model) a FleetKalman filters the readings of all machines.
+    """
+
+    def __init__(self, shared=None, reload_seconds=5.0, online_anomaly=False, state_estimation=False):
+        self.reload_seconds = reload_seconds
+        self.online_anomaly = online_anomaly
+        settings = state_estimation if isinstance(state_estimation, dict) else {}
+        self.kalman = FleetKalman(**settings) if state_estimation else None
+        self.machines = {}
+        self._own = {}  # machine_id -> (detector, predictor, mtimes) for machines with their own files
+        self._shared = shared
+        self._fleet = None
+        self._fleet_mtimes = None
+        self._last_check = None
+
+    @staticmethod
+    def _mtimes(machine_id):
+        model_dir = os.path.join(MODEL_DIR, machine_id) if machine_id else MODEL_DIR
+        return tuple(_mtime(os.path.join(model_dir, name)) for name in MODEL_FILES)
+
+    def _load(self, machine_id):
+        mtimes = self._mtimes(machine_id)
+        detector, predictor = AnomalyDetector(machine_id), PredictiveMaintenance(machine_id)
+        try:
+            detector.load()
+            predictor.load()
+        except Exception as e:
+            print(f"Model load error for {machine_id or 'fleet'}:", e)
+        return detector, predictor, mtimes
+
+    def _check_machine(self, state):
+        mtimes = self._mtimes(state.machine_id)
+        own = self._own.get(state.machine_id)
+        if not any(mtimes):
+            self._own.pop(state.machine_id, None)
+            own = None
+        elif own is None or own[2] != mtimes:
+            own = self._own[state.machine_id] = self._load(state.machine_id)
+        state.detector, state.predictor = own[:2] if own else self.fleet()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._last_check is not None and now - self._last_check < self.reload_seconds:
+            return
+        self._last_check = now
+
+        if self._shared is None:
+            mtimes = self._mtimes(None)
+            if mtimes != self._fleet_mtimes:
+                detector, predictor, self._fleet_mtimes = self._load(None)
+                self._fleet = (detector, predictor)
+
+        for state in self.machines.values():
+            self._check_machine(state)
+
+    def fleet(self):
+        return self._shared() if self._shared is not None else self._fleet
+
+    def get(self, machine_id):
+        self._refresh()
+        state = self.machines.get(machine_id)
+        if state is None:
+            state = MachineState(machine_id, *self.fleet())
+            self._check_machine(state)
+            if self.online_anomaly:
+                state.online = AnomalyDetector(machine_id, mode="online")
+                state.online.load()
+            self.machines[machine_id] = state
+        elif self._shared is not None and machine_id not in self._own:
+            # follow model swaps as soon as they are published
+            state.detector, state.predictor = self._shared()
+        return state
+
+    def save_online(self):
+        for state in list(self.machines.values()):
+            if state.online is not None:
+                state.online.save()
+
+
+def score_rows(models, machine_ids, X, timings=None, times=None, estimates=None):
+    """Score rows from any number of machines; returns (anomalies, risks, versions) lists.
+
+    `X` holds the raw FEATURES; each row first updates its machine's rolling
+    features, in order. Rows are then grouped by the model pair their
+    machine uses, so machines that share the fleet models are scored in a
+    single call. `versions` is the version of the predictor that scored
+    each row. If `timings` is a dict, the seconds spent in anomaly detection
+    and risk prediction are added to its "anomaly" and "risk" entries.
+
+    When `models` has a FleetKalman, the whole batch goes through it first
+    (`times`: reading times in seconds, default now), and if `estimates`
+    is a dict it receives the filter's arrays (see FleetKalman.step). A
+    reading the filter finds far off its prediction (its "anomaly", a NIS
+    well past the gate) is an anomaly whatever the detector says; one
+    merely gated is not. Its time is added to timings["state"].
+    """
+    groups = {}
+    now = time.time()
+    anomalies = [False] * len(machine_ids)
+    if models.kalman is not None:
+        start = time.perf_counter()
+        times = np.full(len(machine_ids), time.monotonic()) if times is None else times
+        result = models.kalman.step(machine_ids, times, np.asarray(X)[:, STATE_COLUMNS])
+        if estimates is not None:
+            estimates.update(result)
+        anomalies = result["anomaly"].tolist()
+        if timings is not None:
+            timings["state"] = timings.get("state", 0.0) + time.perf_counter() - start
+    X_all = []
+    anomaly_seconds = risk_seconds = 0.0
+    for i, (machine_id, x) in enumerate(zip(machine_ids, np.asarray(X).tolist())):
+        state = models.get(machine_id)
+        state.readings += 1
+        state.last_seen = now
+        X_all.append(state.features.update(x))
+        if state.online is not None:
+            start = time.perf_counter()
+            anomalies[i] = state.online.is_anomaly([x])[0] or anomalies[i]
+            anomaly_seconds += time.perf_counter() - start
+        key = (id(state.detector), id(state.predictor))
+        groups.setdefault(key, (state, []))[1].append(i)
+    X_all = np.array(X_all, dtype=float)
+
+    risks = [0.0] * len(machine_ids)
+    versions = [0] * len(machine_ids)
+    for state, idx in groups.values():
+        part = X_all[idx]
+        detector, predictor = state.detector, state.predictor
+        start = time.perf_counter()
+        if state.online is None:
+            for i, anom in zip(idx, detector.is_anomaly(part[:, :len(FEATURES)])):
+                anomalies[i] = bool(anom) or anomalies[i]
+        scored = time.perf_counter()
+        risk_part = part[:, feature_columns(tuple(predictor.feature_names))]
+        for i, risk in zip(idx, predictor.predict_batch(risk_part)):
+            risks[i] = float(risk)
+            versions[i] = predictor.version
+        anomaly_seconds += scored - start
+        risk_seconds += time.perf_counter() - scored
+    if timings is not None:
+        timings["anomaly"] = timings.get("anomaly", 0.0) + anomaly_seconds
+        timings["risk"] = timings.get("risk", 0.0) + risk_seconds
+    return anomalies, risks, versions
+
+
+def _worker_main(inbox, results, reload_seconds, online_anomaly, state_estimation):
+    models = MachineModels(reload_seconds=reload_seconds, online_anomaly=online_anomaly,
+                           state_estimation=state_estimation)
+    while True:
+        msg = inbox.get()
+        if msg is None:
+            models.save_online()
+            return
+        batch_id, machine_ids, X, times = msg
+        timings, estimates = {}, {}
+        try:
+            anomalies, risks, versions = score_rows(models, machine_ids, X, timings, times, estimates)
+        except Exception as e:
+            print("Scorer worker error:", e)
+            anomalies, risks, versions = [False] * len(machine_ids), [0.0] * len(machine_ids), [0] * len(machine_ids)
+        results.put((batch_id, anomalies, risks, versions, timings, estimates or None))
+
+
+class ScorerPool:
+    """Scorer worker processes, one shard each, with machines consistently hashed to shards.
+
+    `submit(rows, X, times)` splits a batch by shard and returns immediately; results
+    come back on a collector thread that calls `on_result(rows, anomalies,
+    risks, versions, estimates)` once per shard sub-batch (`estimates` are
+    the FleetKalman arrays with `state_estimation`, else None). All rows of one machine go to the same
+    worker, so per-machine state stays in one process and keeps its order.
+    `on_timings(timings)`, if given, receives each sub-batch's score_rows timings.
+    """
+
+    def __init__(self, n_workers, on_result, reload_seconds=5.0, online_anomaly=False, on_timings=None,
+                 state_estimation=False):
+        # fork keeps startup cheap and avoids re-running the engine module in each worker
+        methods = mp.get_all_start_methods()
+        ctx = mp.get_context("fork" if "fork" in methods else None)
+        self.on_result = on_result
+        self.on_timings = on_timings
+        self.ring = HashRing(range(n_workers))
+        self.inboxes = [ctx.Queue() for _ in range(n_workers)]
+        self.results = ctx.Queue()
+        self.pending = {}
+        self._ids = itertools.count()
+        self.workers = [
+            ctx.Process(target=_worker_main,
+                        args=(inbox, self.results, reload_seconds, online_anomaly, state_estimation), daemon=True)
+            for inbox in self.inboxes
+        ]
+        for worker in self.workers:
+            worker.start()
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def submit(self, rows, X, times=None):
+        by_shard = {}
+        for i, row in enumerate(rows):
+            by_shard.setdefault(self.ring.shard(row["machine_id"]), []).append(i)
+        for shard, idx in by_shard.items():
+            batch_id = next(self._ids)
+            self.pending[batch_id] = [rows[i] for i in idx]
+            self.inboxes[shard].put((batch_id, [rows[i]["machine_id"] for i in idx], X[idx],
+                                     None if times is None else times[idx]))
+
+    def _collect(self):
+        while True:
+            msg = self.results.get()
+            if msg is None:
+                return
+            batch_id, anomalies, risks, versions, timings, estimates = msg
+            rows = self.pending.pop(batch_id)
+            try:
+                if self.on_timings is not None:
+                    self.on_timings(timings)
+                self.on_result(rows, anomalies, risks, versions, estimates)
+            except Exception as e:
+                print("Scorer result handler error:", e)
+
+    def close(self, timeout=5.0):
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for worker in self.workers:
+            worker.join(timeout)
+        self.results.put(None)
+        self._collector.join(timeout)
+
+
+def features_array(rows):
+    return np.array([[r["temperature"], r["vibration"], r["rpm"], r["current"], r["load"]] for r in rows], dtype=float)
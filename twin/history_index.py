@@ -0,0 +1,293 @@
+import csv
+import io
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+from storage import replace_file
+
+# pandas is imported where rows are read back, keeping it off the engine's startup path
+
+ENTRY = np.dtype([
+    ("machine_id", "S32"),  # ALL for the entry covering the whole block
+    ("t_first", "<f8"),  # epoch seconds of the block's (or this machine's) oldest and newest row
+    ("t_last", "<f8"),
+    ("offset", "<i8"),  # byte range of the block in the CSV
+    ("length", "<i8"),
+    ("rows", "<i4"),  # rows of this machine in the block
+], align=True)
+ALL = b"*"
+REBUILD_BLOCK_ROWS = 256  # block size when indexing rows written without an index
+
+
+def _epoch(value):
+    # the engine writes naive UTC ISO timestamps
+    try:
+        t = datetime.fromisoformat(str(value))
+    except ValueError:
+        return np.nan
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    return t.timestamp()
+
+
+class _Entries:
+    """One machine's (or ALL's) index entries in write order, in arrays that grow by doubling."""
+
+    def __init__(self):
+        self.items = np.zeros(16, ENTRY)
+        self.first_reach = np.zeros(16)  # running max of t_first / t_last, what the searches bisect
+        self.last_reach = np.zeros(16)
+        self.n = 0
+
+    def extend(self, entries):
+        need = self.n + len(entries)
+        if need > len(self.items):
+            size = max(need, 2 * len(self.items))
+            for name in ("items", "first_reach", "last_reach"):
+                grown = np.zeros(size, getattr(self, name).dtype)
+                grown[:self.n] = getattr(self, name)[:self.n]
+                setattr(self, name, grown)
+        self.items[self.n:need] = entries
+        for reach, column in ((self.first_reach, "t_first"), (self.last_reach, "t_last")):
+            previous = reach[self.n - 1] if self.n else -np.inf
+            reach[self.n:need] = np.maximum(previous, np.maximum.accumulate(entries[column]))
+        self.n = need
+
+    def between(self, t0, t1):
+        # rows arrive in time order, so both running maxima find the range by bisection
+        start = np.searchsorted(self.last_reach[:self.n], t0)
+        stop = np.searchsorted(self.first_reach[:self.n], t1, "right")
+        found = self.items[start:max(start, stop)]
+        return found[(found["t_last"] >= t0) & (found["t_first"] <= t1)]
+
+    def last(self, n):
+        rows = np.cumsum(self.items[:self.n]["rows"][::-1])
+        return self.items[self.n - min(self.n, int(np.searchsorted(rows, n)) + 1):self.n]
+
+
+class HistoryIndex:
+    """Sparse timestamp -> byte offset index over the history CSV, per machine.
+
+    Every block of rows the storage writes gets one entry for the whole
+    block and one per machine in it (time range, byte range, row count),
+    appended to `<csv>.idx`. "Last N rows" and "rows between t0 and t1"
+    bisect a machine's entries and read only the blocks they point at, so
+    a query costs O(log blocks + rows returned) whatever the file size.
+
+    The writer (CsvStorage) opens it with `writable=True`: a missing or
+    stale index is rebuilt, and rows written without one are indexed, in
+    a single pass. Other processes open it read-only and pick up new
+    entries on each query.
+    """
+
+    def __init__(self, csv_path, writable=False, default_machine_id="machine1"):
+        self.csv_path = csv_path
+        self.path = csv_path + ".idx"
+        self.writable = writable
+        self.default_machine_id = default_machine_id
+        self.header = None
+        self.end = 0  # CSV bytes covered by the index
+        self._tables = {}
+        self._loaded = 0  # index file bytes loaded
+        self._inode = None
+        self._last_time = 0.0
+        if writable:
+            self._open_writer()
+
+    def _open_writer(self):
+        size = os.path.getsize(self.csv_path) if os.path.exists(self.csv_path) else 0
+        self.refresh()
+        if self.end > size:
+            # the CSV was truncated or replaced under the index: start over
+            os.remove(self.path)
+            self._reset()
+        if size > max(self.end, self._header_bytes()):
+            self._index_existing(size)
+
+    def _reset(self):
+        self._tables, self._loaded, self.end, self._inode = {}, 0, 0, None
+
+    def _header_bytes(self):
+        if not os.path.exists(self.csv_path):
+            return 0
+        with open(self.csv_path, "rb") as f:
+            first = f.readline()
+        if first.endswith(b"\n"):
+            self.header = first.decode().strip().split(",")
+        return len(first)
+
+    def _index_existing(self, size):
+        start = max(self.end, self._header_bytes())
+        print(f"Indexing {size - start} bytes of {self.csv_path} ...")
+        with open(self.csv_path, "rb") as f:
+            f.seek(start)
+            offset, lines = start, []
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # a partial last line is indexed once it is complete
+                lines.append(line)
+                if len(lines) == REBUILD_BLOCK_ROWS:
+                    offset = self._index_lines(lines, offset)
+                    lines = []
+            if lines:
+                self._index_lines(lines, offset)
+
+    def _index_lines(self, lines, offset):
+        data = b"".join(lines)
+        rows = [dict(zip(self.header, values)) for values in csv.reader(io.StringIO(data.decode()))]
+        self.add(rows, offset, len(data))
+        return offset + len(data)
+
+    def add(self, rows, offset, length):
+        """Index a block of rows (dicts) just written at `offset` (`length` bytes)."""
+        if not rows:
+            return
+        # ISO timestamps of one format order as strings: only each machine's first and last are parsed
+        spans = {}
+        for row in rows:
+            key, ts = row.get("machine_id") or self.default_machine_id, str(row.get("timestamp"))
+            span = spans.get(key)
+            if span is None:
+                spans[key] = [ts, ts, 1]
+                continue
+            if ts < span[0]:
+                span[0] = ts
+            elif ts > span[1]:
+                span[1] = ts
+            span[2] += 1
+        entries = np.zeros(len(spans) + 1, ENTRY)
+        entries["machine_id"][1:] = [str(key).encode()[:32] for key in spans]
+        entries["t_first"][1:] = [_epoch(span[0]) for span in spans.values()]
+        entries["t_last"][1:] = [_epoch(span[1]) for span in spans.values()]
+        entries["rows"][1:] = [span[2] for span in spans.values()]
+        # an unparseable time takes the latest indexed one so the ranges stay searchable
+        for column in ("t_first", "t_last"):
+            entries[column][np.isnan(entries[column])] = self._last_time
+        entries[0] = (ALL, entries["t_first"][1:].min(), entries["t_last"][1:].max(), offset, length, len(rows))
+        entries["offset"], entries["length"] = offset, length
+        with open(self.path, "ab") as f:
+            f.write(entries.tobytes())
+        self._loaded += entries.nbytes
+        self._ingest(entries)
+
+    def _ingest(self, entries):
+        order = np.argsort(entries["machine_id"], kind="stable")
+        entries = entries[order]
+        starts = np.flatnonzero(np.r_[True, entries["machine_id"][1:] != entries["machine_id"][:-1]])
+        for part in np.split(entries, starts[1:]):
+            table = self._tables.get(part["machine_id"][0])
+            if table is None:
+                table = self._tables[part["machine_id"][0]] = _Entries()
+            table.extend(part)
+        self.end = max(self.end, int((entries["offset"] + entries["length"]).max()))
+        self._last_time = max(self._last_time, float(entries["t_last"].max()))
+
+    def refresh(self):
+        """Load entries appended (by the writer) since the last call."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            if self._inode is not None:
+                self._reset()
+            return
+        if stat.st_ino != self._inode or stat.st_size < self._loaded:
+            self._reset()
+            self._inode = stat.st_ino
+        complete = stat.st_size - stat.st_size % ENTRY.itemsize
+        if complete > self._loaded:
+            with open(self.path, "rb") as f:
+                f.seek(self._loaded)
+                entries = np.frombuffer(f.read(complete - self._loaded), ENTRY)
+            self._loaded = complete
+            self._ingest(entries)
+
+    def _key(self, machine_id):
+        return ALL if machine_id is None else str(machine_id).encode()[:32]
+
+    def _read(self, entries, machine_id):
+        import pandas as pd
+        if self.header is None:
+            self._header_bytes()
+        if not len(entries):
+            return pd.DataFrame(columns=self.header or [])
+        chunks = []
+        with open(self.csv_path, "rb") as f:
+            for offset, length in zip(entries["offset"].tolist(), entries["length"].tolist()):
+                f.seek(offset)
+                chunks.append(f.read(length))
+        df = pd.read_csv(io.BytesIO(b"".join(chunks)), names=self.header, header=None)
+        if machine_id is not None and "machine_id" in df:
+            df = df[df["machine_id"].fillna(self.default_machine_id).astype(str) == str(machine_id)]
+        return df.reset_index(drop=True)
+
+    def last(self, n, machine_id=None):
+        """The latest `n` rows (of one machine, or of all) as a DataFrame, oldest first."""
+        if not self.writable:
+            self.refresh()
+        table = self._tables.get(self._key(machine_id))
+        entries = table.last(n) if table is not None and n > 0 else np.zeros(0, ENTRY)
+        return self._read(entries, machine_id).tail(n).reset_index(drop=True)
+
+    def between(self, t0, t1, machine_id=None):
+        """Rows with t0 <= timestamp <= t1 (epoch seconds), oldest first as written."""
+        import pandas as pd
+        if not self.writable:
+            self.refresh()
+        table = self._tables.get(self._key(machine_id))
+        df = self._read(table.between(t0, t1) if table is not None else np.zeros(0, ENTRY), machine_id)
+        if not len(df):
+            return df
+        seconds = pd.to_datetime(df["timestamp"], errors="coerce", format="ISO8601").values \
+            .astype("datetime64[ns]").astype(np.int64) / 1e9
+        return df[(seconds >= t0) & (seconds <= t1)].reset_index(drop=True)
+
+    def first_time(self):
+        """Epoch seconds of the oldest indexed row (inf when there are none)."""
+        if not self.writable:
+            self.refresh()
+        table = self._tables.get(ALL)
+        return float(table.items[:table.n]["t_first"].min()) if table is not None and table.n else np.inf
+
+    def boundary_before(self, t):
+        """End offset of the longest run of blocks from the top whose rows are all older than `t`
+        (0 when the first block already has newer rows)."""
+        if not self.writable:
+            self.refresh()
+        table = self._tables.get(ALL)
+        if table is None:
+            return 0
+        n = int(np.searchsorted(table.last_reach[:table.n], t))
+        return int(table.items[n - 1]["offset"] + table.items[n - 1]["length"]) if n else 0
+
+    def prepare_drop(self, offset, header_bytes):
+        """For CsvStorage.drop_before: write the index without the blocks before `offset`, the rest
+        shifted to start right after the header, to a temporary file that commit_drop puts in place."""
+        entries = np.fromfile(self.path, ENTRY) if os.path.exists(self.path) else np.zeros(0, ENTRY)
+        entries = entries[entries["offset"] >= offset]
+        entries["offset"] -= offset - header_bytes
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(entries.tobytes())
+        return tmp
+
+    def commit_drop(self, tmp):
+        """Replace the index with prepare_drop's file; False if it is open in another process."""
+        if not replace_file(tmp, self.path):
+            return False
+        self._reset()
+        self.refresh()
+        return True
+
+    def offset_of_last(self, n):
+        """Byte offset of a block boundary at or before the latest `n` rows (0 if there are fewer)."""
+        if not self.writable:
+            self.refresh()
+        table = self._tables.get(ALL)
+        if table is None:
+            return 0
+        entries = table.last(n)
+        if not len(entries) or entries["rows"].sum() < n:
+            return 0
+        return int(entries["offset"][0])
@@ -0,0 +1,156 @@
+import time
+
+import numpy as np
+
+from features import ALL_FEATURES, MachineFeatures
+from fleet import DEFAULT_MACHINE_ID
+from model_registry import ModelRegistry
+
+
+class IncrementalTrainer:
+    """Keeps a bounded sliding window of recent readings and warm-start updates the predictor.
+
+    `tail` is a storage tail (see storage.py) whose `read_new()` returns only
+    the rows appended since the last call, so the cost of each `step`
+    follows the amount of new data rather than the size of the history.
+
+    Updates are made on a copy of the live predictor, which is then
+    published to `registry` and saved; the live model is never modified.
+
+    New rows go through the same per-machine RollingFeatures as online
+    scoring, and the window keeps the full ALL_FEATURES vector (float32,
+    which is what the trees see anyway).
+    """
+
+    def __init__(self, registry, tail, window_rows=20000, trees_per_update=10,
+                 max_trees=50, min_rows=30):
+        self.registry = registry
+        self.tail = tail
+        self.features = MachineFeatures()
+        self.window = np.zeros((window_rows, len(ALL_FEATURES)), dtype=np.float32)
+        self.labels = np.zeros(window_rows, dtype=int)
+        self.window_len = 0
+        self.window_pos = 0
+        self.trees_per_update = trees_per_update
+        self.max_trees = max_trees
+        self.min_rows = min_rows
+        self.pending = 0
+        self.rng = np.random.default_rng(42)
+
+    @property
+    def predictor(self):
+        return self.registry.current().model
+
+    def _push(self, X):
+        import pandas as pd
+        capacity = len(self.window)
+        if len(X) >= capacity:
+            X = X[-capacity:]
+        n = len(X)
+        y = self.predictor._generate_labels(pd.DataFrame(X, columns=ALL_FEATURES))
+        first = min(n, capacity - self.window_pos)
+        self.window[self.window_pos:self.window_pos + first] = X[:first]
+        self.window[:n - first] = X[first:]
+        self.labels[self.window_pos:self.window_pos + first] = y[:first]
+        self.labels[:n - first] = y[first:]
+        self.window_pos = (self.window_pos + n) % capacity
+        self.window_len = min(capacity, self.window_len + n)
+
+    def _recent(self, n):
+        n = min(n, self.window_len)
+        idx = (self.window_pos - n + np.arange(n)) % len(self.window)
+        return self.window[idx]
+
+    def _training_frame(self, X_new):
+        import pandas as pd
+        window = self.window[:self.window_len]
+        # mix in as many older window rows as new ones so new trees don't only see the latest regime
+        n_context = min(len(window), max(len(X_new), self.min_rows))
+        context = window[self.rng.choice(len(window), n_context, replace=False)]
+        X = np.vstack([X_new, context])
+        df = pd.DataFrame(X, columns=ALL_FEATURES)
+
+        # make sure every class seen in the window is represented
+        labels = self.predictor._generate_labels(df)
+        window_labels = self.labels[:self.window_len]
+        for cls in np.unique(window_labels):
+            if not (labels == cls).any():
+                idx = np.flatnonzero(window_labels == cls)
+                take = self.rng.choice(idx, min(len(idx), max(len(X_new), 10)), replace=False)
+                df = pd.concat([df, pd.DataFrame(window[take], columns=ALL_FEATURES)], ignore_index=True)
+        return df
+
+    def step(self):
+        """Read new rows from the tail and update the model; returns stats for this cycle."""
+        return self.consume(self.tail.read_new())
+
+    def consume(self, new):
+        start = time.perf_counter()
+        X_new = self.features.transform_frame(new, DEFAULT_MACHINE_ID).values if len(new) \
+            else np.empty((0, len(ALL_FEATURES)))
+        if len(X_new):
+            self._push(X_new)
+            self.pending += len(X_new)
+
+        trained = False
+        rows_trained = 0
+        if self.pending >= self.min_rows:
+            df = self._training_frame(self._recent(self.pending))
+            candidate = self.predictor.clone_for_update()
+            trained = candidate.update(df, self.trees_per_update, self.max_trees, save=False)
+            rows_trained = len(df)
+            if trained:
+                self.registry.publish(candidate)
+                candidate.save()
+                self.pending = 0
+
+        return {
+            "rows_consumed": len(X_new),
+            "rows_trained": rows_trained,
+            "window_rows": self.window_len,
+            "trees": len(getattr(self.predictor.model, "estimators_", [])),
+            "trained": bool(trained),
+            "version": self.registry.current().version,
+            "seconds": time.perf_counter() - start,
+        }
+
+
+class FleetTrainer:
+    """One IncrementalTrainer (and model) per machine, fed from a single storage tail.
+
+    New rows are split by `machine_id`; `make_predictor(machine_id)` creates
+    the predictor for a machine the first time it shows up (continuing from
+    its saved model, if any). Every trainer keeps its own window of
+    `window_rows`.
+    """
+
+    def __init__(self, make_predictor, tail, **trainer_kwargs):
+        self.make_predictor = make_predictor
+        self.tail = tail
+        self.trainer_kwargs = trainer_kwargs
+        self.trainers = {}
+
+    def step(self):
+        start = time.perf_counter()
+        new = self.tail.read_new()
+        stats = {"rows_consumed": len(new), "rows_trained": 0, "window_rows": 0, "trees": 0,
+                 "trained": False, "machines_trained": 0}
+        if len(new):
+            if "machine_id" not in new.columns:
+                new["machine_id"] = DEFAULT_MACHINE_ID
+            new["machine_id"] = new["machine_id"].fillna(DEFAULT_MACHINE_ID).astype(str)
+            for machine_id, part in new.groupby("machine_id", sort=False):
+                trainer = self.trainers.get(machine_id)
+                if trainer is None:
+                    predictor = self.make_predictor(machine_id)
+                    predictor.load()
+                    trainer = self.trainers[machine_id] = IncrementalTrainer(
+                        ModelRegistry(predictor), None, **self.trainer_kwargs)
+                result = trainer.consume(part)
+                stats["rows_trained"] += result["rows_trained"]
+                stats["machines_trained"] += int(result["trained"])
+                stats["trees"] = max(stats["trees"], result["trees"])
+        stats["window_rows"] = sum(t.window_len for t in self.trainers.values())
+        stats["trained"] = stats["machines_trained"] > 0
+        stats["seconds"] = time.perf_counter() - start
+        return stats
@@ -0,0 +1,119 @@
+import os
+import time
+
+import numpy as np
+
+MAGIC = b"TWINRING"
+HEADER_BYTES = 64
+WRITTEN_OFFSET = 32  # uint64 count of records ever written, 8-byte aligned
+RECORD = np.dtype([
+    ("time", "<f8"),  # epoch seconds the row was scored
+    ("machine_id", "S32"),
+    ("temperature", "<f4"), ("vibration", "<f4"), ("rpm", "<f4"), ("current", "<f4"), ("load", "<f4"),
+    ("risk_score", "<f4"),
+    ("model_version", "<i4"),
+    ("anomaly", "u1"),
+    ("gated", "u1"),  # failed the state estimate's innovation gate
+    # state estimate (twin/state_estimation.py), NaN when the engine runs without it
+    ("kf_temperature", "<f4"), ("kf_vibration", "<f4"), ("kf_rpm", "<f4"), ("kf_current", "<f4"),
+    ("res_temperature", "<f4"), ("res_vibration", "<f4"), ("res_rpm", "<f4"), ("res_current", "<f4"),
+    ("innovation", "<f4"),
+], align=True)
+VALUES = ("temperature", "vibration", "rpm", "current", "load", "risk_score", "model_version")
+ESTIMATES = ("kf_temperature", "kf_vibration", "kf_rpm", "kf_current",
+             "res_temperature", "res_vibration", "res_rpm", "res_current", "innovation")
+
+
+class LiveRing:
+    """Fixed-size ring of the latest scored rows in a memory-mapped file.
+
+    One writer (the engine) appends rows; any number of processes (dashboard
+    workers) map the same file read-only and copy out what is new since the
+    sequence number they last saw, so a reader's cost depends on the rows
+    it asks for, never on the history length. Readers take no locks: the
+    writer stores the records first and then bumps the `written` counter in
+    the header, and a reader drops any record that may have been
+    overwritten while it was copying.
+    """
+
+    def __init__(self, path, capacity=65536, create=False):
+        self.path = path
+        self.capacity = capacity
+        size = HEADER_BYTES + capacity * RECORD.itemsize
+        if create:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            if not self._compatible(path, capacity):
+                # new layout: start empty (a reader still mapping the old file keeps its copy)
+                with open(path + ".tmp", "wb") as f:
+                    f.write(MAGIC + np.array([1, capacity, RECORD.itemsize], "<u8").tobytes())
+                    f.truncate(size)
+                os.replace(path + ".tmp", path)
+            mode = "r+"
+        else:
+            if not self._compatible(path, None):
+                raise FileNotFoundError(f"no live ring at {path}")
+            with open(path, "rb") as f:
+                self.capacity = capacity = int(np.frombuffer(f.read(HEADER_BYTES), "<u8", 1, 16)[0])
+            mode = "r"
+        self._map = np.memmap(path, np.uint8, mode, shape=HEADER_BYTES + capacity * RECORD.itemsize)
+        self._inode = os.stat(path).st_ino
+        self._written = self._map[WRITTEN_OFFSET:WRITTEN_OFFSET + 8].view("<u8")
+        self.records = self._map[HEADER_BYTES:].view(RECORD)
+
+    @staticmethod
+    def _compatible(path, capacity):
+        try:
+            with open(path, "rb") as f:
+                header = f.read(HEADER_BYTES)
+        except FileNotFoundError:
+            return False
+        if len(header) < HEADER_BYTES or header[:8] != MAGIC:
+            return False
+        _, file_capacity, itemsize = np.frombuffer(header, "<u8", 3, 8)
+        return itemsize == RECORD.itemsize and (capacity is None or file_capacity == capacity)
+
+    def replaced(self):
+        """True once the writer has recreated the file with a new layout (reopen to follow it)."""
+        try:
+            return os.stat(self.path).st_ino != self._inode
+        except FileNotFoundError:
+            return False
+
+    @property
+    def written(self):
+        return int(self._written[0])
+
+    def write(self, rows, now=None):
+        """Append scored rows (dicts with the storage columns)."""
+        rows = rows[-self.capacity:]
+        batch = np.zeros(len(rows), RECORD)
+        batch["time"] = time.time() if now is None else now
+        batch["machine_id"] = [str(r["machine_id"]).encode()[:32] for r in rows]
+        for name in VALUES:
+            batch[name] = [r.get(name) or 0 for r in rows]
+        batch["anomaly"] = [bool(r.get("anomaly")) for r in rows]
+        batch["gated"] = [bool(r.get("gated")) for r in rows]
+        for name in ESTIMATES:
+            batch[name] = [r.get(name, np.nan) for r in rows]
+        start = self.written
+        self.records[(start + np.arange(len(rows))) % self.capacity] = batch
+        self._written[0] = start + len(rows)  # publish after the records are in place
+
+    def read_since(self, seq):
+        """Records written after sequence number `seq` (oldest first, at most
+        `capacity`) and the sequence number to pass next time."""
+        written = self.written
+        start = max(seq, written - self.capacity)
+        if start >= written:
+            return self.records[:0].copy(), written
+        out = self.records[np.arange(start, written) % self.capacity]
+        # anything the writer may have overwritten during the copy is dropped
+        torn = max(0, self.written - self.capacity - start)
+        return out[torn:], written
+
+    def latest(self, n):
+        return self.read_since(max(0, self.written - n))[0]
+
+    def close(self):
+        self._map.flush()
+        del self._map, self._written, self.records
@@ -0,0 +1,181 @@
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+# upper bounds in seconds, from a single parse (~10 us) to a retrain (minutes)
+LATENCY_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _labels(labels, extra=None):
+    items = list((labels or {}).items()) + list((extra or {}).items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Counter:
+    """Monotonic count. With `fn`, the value is read from fn() at scrape time instead of inc()."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=None, fn=None):
+        self.name, self.help, self.labels, self.fn = name, help, labels, fn
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+    def samples(self):
+        yield self.name + _labels(self.labels), self.fn() if self.fn is not None else self.value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """Cumulative buckets, sum and count of observed values (seconds, by default buckets).
+
+    `observe` takes no lock: it is on the per-message path, and each of the
+    engine's histograms has a single writer at a time (the event loop, or
+    one stage's call). A scrape may see the sum one observation ahead of
+    the buckets.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=None, buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, labels
+        self.bounds = list(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def snapshot(self):
+        return list(self.counts), self.sum
+
+    def samples(self):
+        counts, total = self.snapshot()
+        cumulative = 0
+        for bound, count in zip(self.bounds + ["+Inf"], counts):
+            cumulative += count
+            yield self.name + "_bucket" + _labels(self.labels, {"le": bound}), cumulative
+        yield self.name + "_sum" + _labels(self.labels), total
+        yield self.name + "_count" + _labels(self.labels), cumulative
+
+
+class MetricsRegistry:
+    """Named metrics rendered in the Prometheus text format.
+
+    Several metrics may share a name with different labels (one per stage,
+    say); they are rendered under a single HELP/TYPE header.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=None, fn=None):
+        return self._add(Counter(name, help, labels, fn))
+
+    def gauge(self, name, help, labels=None, fn=None):
+        return self._add(Gauge(name, help, labels, fn))
+
+    def histogram(self, name, help, labels=None, buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        lines, seen = [], set()
+        with self._lock:
+            metrics = sorted(self.metrics, key=lambda m: m.name)
+        for metric in metrics:
+            if metric.name not in seen:
+                seen.add(metric.name)
+                lines.append(f"# HELP {metric.name} {metric.help}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, value in metric.samples():
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def serve(port, host="127.0.0.1", registry=REGISTRY, routes=None):
+    """Serve GET /metrics on a daemon thread; returns the server (shutdown() stops it).
+
+    `routes` maps more paths to fn(query params) -> (content type, body
+    bytes), or None for a 404. Those may be fetched by pages from any origin.
+    """
+    routes = dict(routes or {})
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path, _, query = self.path.partition("?")
+            if path == "/metrics":
+                result = "text/plain; version=0.0.4", registry.render().encode()
+            elif path in routes:
+                result = routes[path](dict(parse_qsl(query)))
+            else:
+                result = None
+            if result is None:
+                self.send_error(404)
+                return
+            content_type, body = result
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            if path != "/metrics":
+                self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # scrapes are not worth a line each
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class RateLimitedLog:
+    """Prints at most one line per `interval` seconds and counts the rest.
+
+    `log(make_line)` takes a callable so suppressed lines are never
+    formatted; the next printed line says how many were skipped.
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.suppressed = 0
+        self._next = 0.0
+
+    def log(self, make_line):
+        now = time.monotonic()
+        if now < self._next:
+            self.suppressed += 1
+            return False
+        self._next = now + self.interval
+        line = make_line()
+        if self.suppressed:
+            line += f"  (+{self.suppressed} not shown)"
+            self.suppressed = 0
+        print(line)
+        return True
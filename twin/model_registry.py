@@ -0,0 +1,106 @@
+import collections
+import os
+import threading
+import time
+
+
+class ModelGeneration:
+    def __init__(self, version, model):
+        self.version = version
+        self.model = model
+        self.published_at = time.time()
+        self.retired_at = None
+        self.rows_scored = 0
+
+    def as_dict(self):
+        end = self.retired_at or time.time()
+        return {
+            "version": self.version,
+            "published_at": self.published_at,
+            "retired_at": self.retired_at,
+            "served_seconds": end - self.published_at,
+            "rows_scored": self.rows_scored,
+        }
+
+
+class ModelRegistry:
+    """Versioned slot holding the live model.
+
+    Scorers read `current()` once per batch and keep using that object;
+    trainers build a new model off to the side and `publish` it, which
+    swaps the reference in one assignment. A published model is never
+    mutated again, so readers never see a half-trained model.
+    """
+
+    def __init__(self, model, history=50):
+        self._lock = threading.Lock()
+        self._current = ModelGeneration(getattr(model, "version", 0), model)
+        self._history = collections.deque(maxlen=history)
+        self._by_version = {self._current.version: self._current}
+
+    def current(self):
+        return self._current
+
+    def publish(self, model):
+        with self._lock:
+            old = self._current
+            model.version = old.version + 1
+            new = ModelGeneration(model.version, model)
+            old.retired_at = new.published_at
+            self._history.append(old)
+            self._by_version = {g.version: g for g in self._history}
+            self._by_version[new.version] = new
+            self._current = new
+        return old, new
+
+    def record_scored(self, versions):
+        for version, n in collections.Counter(versions).items():
+            generation = self._by_version.get(version)
+            if generation is not None:
+                generation.rows_scored += n
+
+    def history(self):
+        return [g.as_dict() for g in list(self._history) + [self._current]]
+
+
+class ModelFileWatcher:
+    """Publishes to `registry` the model a separate process saves (the offline trainer, twin/train.py).
+
+    `step` reloads when the saved file changed since the last look, so the
+    engine serves models trained elsewhere without training itself.
+    """
+
+    def __init__(self, registry, make_predictor):
+        self.registry = registry
+        self.make_predictor = make_predictor
+        predictor = make_predictor()
+        # the flat export is written after the pickle: once it changed, both are complete
+        self.paths = (predictor.flat_path, predictor.model_path)
+        self.mtime = self._mtime()
+
+    def _mtime(self):
+        for path in self.paths:
+            if os.path.exists(path):
+                return os.path.getmtime(path)
+        return None
+
+    def step(self):
+        start = time.perf_counter()
+        mtime = self._mtime()
+        loaded = mtime is not None and mtime != self.mtime
+        if loaded:
+            predictor = self.make_predictor()
+            predictor.load()
+            self.registry.publish(predictor)
+            self.mtime = mtime
+        current = self.registry.current()
+        return {
+            "rows_consumed": 0,
+            "rows_trained": 0,
+            "window_rows": 0,
+            "trees": current.model.flat.n_trees if current.model.flat is not None else 0,
+            "trained": False,
+            "loaded": loaded,
+            "version": current.version,
+            "seconds": time.perf_counter() - start,
+        }
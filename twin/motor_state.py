@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULTS = {"running": False, "target_rpm": 1500}
+
+
+class MotorState:
+    """Motor control state shared by every process on the host through one SQLite file.
+
+    Replaces per-process globals: dashboard workers, the engine and the 3D
+    view's push stream all read the same row. `update` is a single
+    transaction (BEGIN IMMEDIATE), so concurrent writers never lose each
+    other's changes, and bumps `version`; passing `expected_version` makes
+    it a compare-and-set. Readers cache the row and re-read it only when
+    SQLite's data_version says another connection committed, so `get` is
+    cheap enough for every dashboard tick. `wait` and `watch` deliver
+    changes made by any process.
+    """
+
+    def __init__(self, path, poll_seconds=0.1):
+        self.path = path
+        self.poll_seconds = poll_seconds
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()  # one connection, shared by the threads of this process
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")  # readers never block the writer
+            self._db.execute("CREATE TABLE IF NOT EXISTS motor (id INTEGER PRIMARY KEY CHECK (id = 1), "
+                             "running INTEGER NOT NULL, target_rpm INTEGER NOT NULL, "
+                             "version INTEGER NOT NULL, updated REAL NOT NULL)")
+            self._db.execute("INSERT OR IGNORE INTO motor VALUES (1, ?, ?, 0, ?)",
+                             (int(DEFAULTS["running"]), DEFAULTS["target_rpm"], time.time()))
+        self._seen = None  # data_version of the cached row
+        self._state = None
+
+    def _read_locked(self):
+        data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        if self._state is None or data_version != self._seen:
+            running, target_rpm, version, updated = self._db.execute(
+                "SELECT running, target_rpm, version, updated FROM motor WHERE id = 1").fetchone()
+            self._state = {"running": bool(running), "target_rpm": target_rpm, "version": version,
+                           "updated": updated}
+            self._seen = data_version
+        return self._state
+
+    def get(self):
+        """{"running", "target_rpm", "version", "updated"} as last committed by any process."""
+        with self._lock:
+            return dict(self._read_locked())
+
+    def update(self, expected_version=None, **changes):
+        """Apply `changes` (running, target_rpm) atomically; returns the new state, or None if
+        `expected_version` is given and another writer got there first."""
+        unknown = set(changes) - set(DEFAULTS)
+        if unknown:
+            raise ValueError(f"unknown motor state fields {sorted(unknown)}")
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute("SELECT running, target_rpm, version FROM motor WHERE id = 1").fetchone()
+                state = dict(zip(("running", "target_rpm", "version"), row))
+                if expected_version is not None and state["version"] != expected_version:
+                    self._db.execute("ROLLBACK")
+                    return None
+                state.update(changes)
+                state["version"] += 1
+                state["updated"] = time.time()
+                self._db.execute("UPDATE motor SET running = ?, target_rpm = ?, version = ?, updated = ? WHERE id = 1",
+                                 (int(bool(state["running"])), int(state["target_rpm"]), state["version"],
+                                  state["updated"]))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._state = None  # our own commit does not change data_version for this connection
+            return dict(self._read_locked())
+
+    def wait(self, version, timeout=None):
+        """The state once its version differs from `version` (or the current one after `timeout`)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            state = self.get()
+            if state["version"] != version or (deadline is not None and time.monotonic() >= deadline):
+                return state
+            time.sleep(self.poll_seconds)
+
+    def watch(self, callback):
+        """Call callback(state) now and after every change, from a daemon thread."""
+        def loop():
+            version = None
+            while True:
+                state = self.wait(version)
+                version = state["version"]
+                try:
+                    callback(state)
+                except Exception as e:
+                    print("Motor state watcher error:", e)
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,218 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+STAGES = ("parse", "score", "persist", "alert")  # queues are named after the stage that consumes them
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.batches = 0
+        self.errors = 0
+        self.dropped = 0
+        self.busy_seconds = 0.0
+        self.max_seconds = 0.0
+        self.max_depth = 0
+        self.histogram = None  # metrics.Histogram of call durations, when exported
+
+    def record(self, n_items, seconds):
+        self.items += n_items
+        self.batches += 1
+        self.busy_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        if self.histogram is not None:
+            self.histogram.observe(seconds)
+
+    def as_dict(self, depth):
+        return {
+            "items": self.items,
+            "batches": self.batches,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "queue_depth": depth,
+            "max_queue_depth": self.max_depth,
+            "avg_ms": 1000 * self.busy_seconds / self.batches if self.batches else 0.0,
+            "max_ms": 1000 * self.max_seconds,
+        }
+
+
+class Pipeline:
+    """Asyncio pipeline: receive -> parse -> score -> persist -> alert.
+
+    Stages are connected by bounded queues and each runs as its own task, so
+    a slow stage only fills the queue in front of it. `receive` is the
+    thread-safe entry point for the MQTT network thread and never blocks:
+    when the receive queue is full the message is dropped and counted.
+    Further downstream a full queue makes the upstream stage wait
+    (backpressure) instead of dropping.
+
+    `parse(topic, payload, received_at)` runs on the event loop and returns a
+    row dict, a list of rows (a batched message) or None to skip. `score(rows)`, `persist(rows)` and
+    `alert(rows)` run in worker threads so blocking model, disk and network
+    calls never stall the loop. `score` may return None when it hands the
+    batch to another scorer that later calls `push_scored(rows)`.
+
+    With a `metrics` registry (metrics.py) the per-stage counters, queue
+    depths, call durations and end-to-end latency are also exported there.
+    """
+
+    def __init__(self, parse, score, persist, alert, queue_size=10000, batch_rows=64, batch_wait_ms=50,
+                 metrics=None):
+        self.parse = parse
+        self.score = score
+        self.persist = persist
+        self.alert = alert
+        self.queue_size = queue_size
+        self.batch_rows = batch_rows
+        self.batch_wait = batch_wait_ms / 1000.0
+        self.received = StageStats("receive")
+        self.stats = {name: StageStats(name) for name in STAGES}
+        self.latency = StageStats("end_to_end")
+        self.queues = {}
+        self.loop = None
+        self._executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="pipeline")
+        self._stopped = None
+        if metrics is not None:
+            self._export(metrics)
+
+    def _export(self, metrics):
+        # counters are read from the stats at scrape time; only the histograms cost anything per call
+        metrics.counter("twin_messages_received_total", "Messages accepted from MQTT", fn=lambda: self.received.items)
+        metrics.counter("twin_messages_dropped_total", "Messages dropped on a full receive queue",
+                        fn=lambda: self.received.dropped)
+        for name, stats in self.stats.items():
+            labels = {"stage": name}
+            metrics.counter("twin_stage_items_total", "Rows through each pipeline stage", labels,
+                            fn=lambda stats=stats: stats.items)
+            metrics.counter("twin_stage_errors_total", "Failed stage calls", labels, fn=lambda stats=stats: stats.errors)
+            metrics.gauge("twin_queue_depth", "Items waiting in front of each stage", labels,
+                          fn=lambda name=name: self.queues[name].qsize() if name in self.queues else 0)
+            stats.histogram = metrics.histogram(
+                "twin_stage_seconds", "Stage call duration (one message for parse, one batch otherwise)", labels)
+        self.latency.histogram = metrics.histogram("twin_end_to_end_seconds", "Receive to alert stage, per row")
+
+    # entry points (any thread)
+
+    def receive(self, topic, payload):
+        if self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self._offer, (time.monotonic(), topic, payload))
+
+    def push_scored(self, rows):
+        asyncio.run_coroutine_threadsafe(self._put("persist", rows), self.loop)
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._stopped.set)
+
+    def snapshot(self):
+        out = {"receive": self.received.as_dict(0)}
+        out.update({name: self.stats[name].as_dict(self.queues[name].qsize() if name in self.queues else 0)
+                    for name in STAGES})
+        out["end_to_end"] = self.latency.as_dict(0)
+        return out
+
+    # event loop side
+
+    def _offer(self, item):
+        try:
+            self.queues["parse"].put_nowait(item)
+        except asyncio.QueueFull:
+            self.received.dropped += 1
+            return
+        self.received.items += 1
+        self._track_depth("parse")
+
+    def _track_depth(self, stage):
+        stats = self.stats[stage]
+        stats.max_depth = max(stats.max_depth, self.queues[stage].qsize())
+
+    async def _put(self, stage, item):
+        await self.queues[stage].put(item)
+        self._track_depth(stage)
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self.queues = {name: asyncio.Queue(self.queue_size) for name in STAGES}
+        tasks = [
+            asyncio.create_task(self._parse_stage()),
+            asyncio.create_task(self._score_stage()),
+            asyncio.create_task(self._persist_stage()),
+            asyncio.create_task(self._alert_stage()),
+        ]
+        try:
+            await self._stopped.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._executor.shutdown(wait=False)
+
+    async def _call(self, stage, fn, rows):
+        start = time.perf_counter()
+        try:
+            result = await self.loop.run_in_executor(self._executor, fn, rows)
+        except Exception as e:
+            self.stats[stage].errors += 1
+            print(f"Pipeline {stage} error:", e)
+            return None, False
+        self.stats[stage].record(len(rows), time.perf_counter() - start)
+        return result, True
+
+    async def _parse_stage(self):
+        inbox, stats = self.queues["parse"], self.stats["parse"]
+        while True:
+            received_at, topic, payload = await inbox.get()
+            start = time.perf_counter()
+            try:
+                row = self.parse(topic, payload, received_at)
+            except Exception as e:
+                stats.errors += 1
+                print("Error handling message:", e)
+                continue
+            rows = row if isinstance(row, list) else [row]
+            stats.record(len(rows), time.perf_counter() - start)
+            for row in rows:
+                if row is not None:
+                    await self._put("score", row)
+
+    async def _score_stage(self):
+        inbox = self.queues["score"]
+        while True:
+            batch = [await inbox.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_rows:
+                if not inbox.empty():
+                    batch.append(inbox.get_nowait())
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(inbox.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            scored, ok = await self._call("score", self.score, batch)
+            if ok and scored is not None:
+                await self._put("persist", scored)
+
+    async def _persist_stage(self):
+        inbox = self.queues["persist"]
+        while True:
+            rows = await inbox.get()
+            await self._call("persist", self.persist, rows)
+            await self._put("alert", rows)
+
+    async def _alert_stage(self):
+        inbox = self.queues["alert"]
+        while True:
+            rows = await inbox.get()
+            await self._call("alert", self.alert, rows)
+            now = time.monotonic()
+            for row in rows:
+                received_at = row.get("received_at")
+                if received_at is not None:
+                    self.latency.record(1, now - received_at)
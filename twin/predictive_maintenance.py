@@ -1,20 +1,77 @@
 import os
+import copy
 import numpy as np
-import joblib
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
+
+from tree_export import FlatForest
 
 MODEL_DIR = os.path.join(os.path.dirname(__file__), "..", "models")
 os.makedirs(MODEL_DIR, exist_ok=True)
 
+FEATURES = ["temperature", "vibration", "rpm", "current", "load"]
+MODEL_PARAMS = {"n_estimators": 50, "random_state": 42}  # RandomForestClassifier settings unless given
+TEST_SIZE = 0.2  # held-out share of the rows `train` is given, for `evaluation`
+
+
+def evaluate(y, risk, threshold=0.5):
+    """Held-out metrics of risk scores `risk` against labels `y` (plain floats, None where undefined)."""
+    from sklearn import metrics
+    y = np.asarray(y, dtype=int)
+    risk = np.asarray(risk, dtype=float)
+    predicted = (risk >= threshold).astype(int)
+    both = len(np.unique(y)) == 2
+    return {
+        "samples": int(len(y)),
+        "positives": int(y.sum()),
+        "accuracy": float(metrics.accuracy_score(y, predicted)),
+        "precision": float(metrics.precision_score(y, predicted, zero_division=0)),
+        "recall": float(metrics.recall_score(y, predicted, zero_division=0)),
+        "f1": float(metrics.f1_score(y, predicted, zero_division=0)),
+        "roc_auc": float(metrics.roc_auc_score(y, risk)) if both else None,
+        "average_precision": float(metrics.average_precision_score(y, risk)) if both else None,
+        "log_loss": float(metrics.log_loss(y, np.clip(risk, 1e-6, 1 - 1e-6), labels=[0, 1])),
+    }
+
+
 class PredictiveMaintenance:
-    def __init__(self):
-        self.model = RandomForestClassifier(n_estimators=50, random_state=42)
+    def __init__(self, machine_id=None, feature_names=None, params=None):
+        self._model = None
+        # model inputs: the raw FEATURES and/or rolling columns from features.ALL_FEATURES
+        self.feature_names = list(feature_names or FEATURES)
+        self.params = dict(MODEL_PARAMS, **(params or {}))
         self.is_fitted = False
-        self.model_path = os.path.join(MODEL_DIR, "pm_rf.pkl")
+        self.evaluation = None  # held-out metrics of the last full training (see `evaluate`)
+        self.flat = None
+        # per-machine models live in models/<machine_id>/, the fleet-wide one in models/
+        model_dir = os.path.join(MODEL_DIR, machine_id) if machine_id else MODEL_DIR
+        self.model_path = os.path.join(model_dir, "pm_rf.pkl")
+        self.flat_path = os.path.join(model_dir, "pm_rf.flat")
+        self.updates = 0
+        self.version = 0  # set by ModelRegistry.publish, stored with the saved model
+        self._model_pending = False  # loaded from the flat file; the pickle is read on first use
+
+    @property
+    def model(self):
+        # sklearn (and the pickle) are only needed to train, not to score the flat export
+        if self._model is None:
+            if self._model_pending and os.path.exists(self.model_path):
+                import joblib
+                saved = joblib.load(self.model_path)
+                self._model = saved["model"] if isinstance(saved, dict) else saved
+            else:
+                from sklearn.ensemble import RandomForestClassifier
+                self._model = RandomForestClassifier(**self.params)
+            self._model_pending = False
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+        self._model_pending = False
 
     def _prepare_features(self, df):
-        return df[["temperature", "vibration", "rpm", "current", "load"]].fillna(0).values
+        if isinstance(df, np.ndarray):
+            return df
+        return df[self.feature_names].fillna(0).values
 
     def _generate_labels(self, df):
         cond = (
@@ -25,39 +82,128 @@ class PredictiveMaintenance:
         )
         return cond.astype(int).values
 
-    def train(self, df):
+    def train(self, df, save=True):
         if len(df) < 30:
             return False
 
         X = self._prepare_features(df)
         y = self._generate_labels(df)
 
+        from sklearn.base import clone
+        from sklearn.model_selection import train_test_split
+
         X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42
+            X, y, test_size=TEST_SIZE, random_state=42
         )
 
+        # fit a fresh estimator so a copy made by `clone_for_update` never shares a fitting model
+        self.model = clone(self.model)
+        self.fit(X_train, y_train, X_test, y_test)
+
+        if save:
+            self.save()
+        return True
+
+    def fit(self, X_train, y_train, X_test=None, y_test=None):
+        """Fit the estimator on prepared arrays and, given a held-out split, score it into `evaluation`."""
         self.model.fit(X_train, y_train)
+        self.export()
         self.is_fitted = True
+        self.evaluation = evaluate(y_test, self.predict_batch(X_test)) if X_test is not None and len(X_test) \
+            else None
+        return self.evaluation
+
+    def clone_for_update(self):
+        """Copy to train on while this instance keeps serving.
+
+        The fitted trees are shared (they are never modified after fit); the
+        list holding them is not, so `update`/`train` on the copy leave this
+        instance untouched.
+        """
+        other = copy.copy(self)
+        other.model = copy.copy(self.model)
+        if hasattr(self.model, "estimators_"):
+            other.model.estimators_ = list(self.model.estimators_)
+        return other
+
+    def update(self, df, n_new_trees=10, max_trees=50, save=True):
+        """Warm-start update: fit `n_new_trees` on df, append them, drop the oldest.
+
+        Falls back to a full `train` when there is no model yet or the class
+        set in df differs from the fitted one (trees must agree on classes).
+        """
+        y = self._generate_labels(df)
+        if not self.is_fitted or not np.array_equal(np.unique(y), self.model.classes_):
+            return self.train(df, save)
+
+        from sklearn.ensemble import RandomForestClassifier
 
-        joblib.dump(self.model, self.model_path)
+        X = self._prepare_features(df)
+        self.updates += 1
+        # same settings as the forest being extended, only fewer trees and a fresh seed
+        batch = RandomForestClassifier(**dict(self.params, n_estimators=n_new_trees, random_state=42 + self.updates))
+        batch.fit(X, y)
+
+        estimators = (list(self.model.estimators_) + list(batch.estimators_))[-max_trees:]
+        self.model.estimators_ = estimators
+        self.model.n_estimators = len(estimators)
+        self.export()
+
+        if save:
+            self.save()
         return True
 
-    def load(self):
-        if os.path.exists(self.model_path):
-            self.model = joblib.load(self.model_path)
+    def save(self):
+        import joblib
+        # write then rename, so scorers reloading by mtime never read a partial file
+        os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
+        tmp = self.model_path + ".tmp"
+        meta = {"version": self.version, "feature_names": self.feature_names, "evaluation": self.evaluation,
+                "params": self.params}
+        joblib.dump(dict(meta, model=self.model), tmp)
+        os.replace(tmp, self.model_path)
+        if self.flat is not None:
+            self.flat.save(self.flat_path, meta)
+
+    def load(self, mmap=True):
+        """Load the saved model; with `mmap` the flat export is memory-mapped
+        and the pickle is only read if the sklearn model is actually used."""
+        if mmap and os.path.exists(self.flat_path):
+            self.flat, meta = FlatForest.load(self.flat_path)
+            self.version = meta.get("version", 0)
+            self.feature_names = meta.get("feature_names", FEATURES)
+            self.evaluation = meta.get("evaluation")
+            self.params = dict(MODEL_PARAMS, **meta.get("params", {}))
+            self._model, self._model_pending = None, True
+            self.is_fitted = True
+        elif os.path.exists(self.model_path):
+            import joblib
+            saved = joblib.load(self.model_path)
+            if isinstance(saved, dict):
+                self.model, self.version = saved["model"], saved["version"]
+                self.feature_names = saved.get("feature_names", FEATURES)
+                self.evaluation = saved.get("evaluation")
+                self.params = dict(MODEL_PARAMS, **saved.get("params", {}))
+            else:
+                self.model = saved
+            self.export()
             self.is_fitted = True
 
+    def export(self):
+        # flatten the fitted forest so scoring skips sklearn's per-call overhead
+        if hasattr(self.model, "estimators_") and hasattr(self.model, "predict_proba"):
+            self.flat = FlatForest.from_sklearn(self.model)
+        else:
+            self.flat = None
+
     def predict_single(self, sample_dict):
         if not self.is_fitted:
             return 0.0
 
-        X = np.array([[
-            sample_dict["temperature"],
-            sample_dict["vibration"],
-            sample_dict["rpm"],
-            sample_dict["current"],
-            sample_dict["load"]
-        ]])
+        X = np.array([[sample_dict[name] for name in self.feature_names]])
+
+        if self.flat is not None:
+            return float(self.flat.predict_proba(X)[0])
 
         if hasattr(self.model, "predict_proba"):
             probs = self.model.predict_proba(X)
@@ -71,6 +217,9 @@ class PredictiveMaintenance:
 
         X = self._prepare_features(df)
 
+        if self.flat is not None:
+            return self.flat.predict_proba(X).tolist()
+
         if hasattr(self.model, "predict_proba"):
             return self.model.predict_proba(X)[:, 1].tolist()
 
@@ -0,0 +1,307 @@
+import io
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from history_index import HistoryIndex
+from storage import CsvStorage
+
+# pandas is imported where rows are read back, keeping it off the engine's startup path
+
+SIGNALS = ["temperature", "vibration", "rpm", "current", "load"]
+ROLLUP_COLUMNS = ["timestamp", "machine_id", "count", "anomalies", "max_risk"] + \
+    [f"{signal}{stat}" for signal in SIGNALS for stat in ("", "_min", "_max")]  # bare signal name: the mean
+TIERS = (60, 3600)  # rollup bucket seconds
+LATE_SECONDS = 60  # a bucket is written once rows this much newer have been read
+READ_CHUNK_BYTES = 8 << 20  # raw bytes aggregated at a time: memory follows this and the machine count, not the history
+ROLLUP_FLUSH_ROWS = 4096
+
+
+def rollup_path(csv_path, seconds):
+    # machine_live.csv -> machine_live_1m.csv / machine_live_1h.csv
+    return f"{os.path.splitext(csv_path)[0]}_{'1m' if seconds == 60 else '1h'}.csv"
+
+
+def _seconds(timestamps):
+    import pandas as pd
+    return pd.to_datetime(timestamps, errors="coerce", format="ISO8601").values \
+        .astype("datetime64[ns]").astype(np.int64) / 1e9
+
+
+def _fold(partial, seconds):
+    """Combine partial aggregates (t, machine_id, count, anomalies, max_risk, <signal>_sum/_min/_max)
+    into one per machine and `seconds` bucket."""
+    partial = partial.assign(t=(partial["t"] // seconds) * seconds)
+    agg = {"count": "sum", "anomalies": "sum", "max_risk": "max"}
+    for signal in SIGNALS:
+        agg.update({f"{signal}_sum": "sum", f"{signal}_min": "min", f"{signal}_max": "max"})
+    return partial.groupby(["machine_id", "t"], sort=False).agg(agg).reset_index()
+
+
+def _raw_partial(df, default_machine_id, t=None):
+    import pandas as pd
+    t = _seconds(df["timestamp"]) if t is None else t
+    ok = ~np.isnan(t)
+    df = df[ok]
+    partial = pd.DataFrame({
+        "t": t[ok],
+        "machine_id": df["machine_id"].fillna(default_machine_id).astype(str).values if "machine_id" in df
+        else default_machine_id,
+        "count": 1,
+        "anomalies": (df["anomaly"].astype(str) == "True").astype(int).values if "anomaly" in df else 0,
+        "max_risk": pd.to_numeric(df["risk_score"], errors="coerce").fillna(0.0).values if "risk_score" in df
+        else 0.0,
+    })
+    for signal in SIGNALS:
+        values = pd.to_numeric(df[signal], errors="coerce").values
+        partial[f"{signal}_sum"] = partial[f"{signal}_min"] = partial[f"{signal}_max"] = values
+    return partial
+
+
+def _rollup_partial(df):
+    partial = df[["machine_id", "count", "anomalies", "max_risk"]].assign(t=_seconds(df["timestamp"]))
+    for signal in SIGNALS:
+        partial[f"{signal}_sum"] = df[signal] * df["count"]
+        partial[f"{signal}_min"], partial[f"{signal}_max"] = df[f"{signal}_min"], df[f"{signal}_max"]
+    return partial
+
+
+def _rollup_frame(partial):
+    frame = partial.sort_values("t", kind="stable")
+    out = frame[["machine_id", "count", "anomalies", "max_risk"]].copy()
+    # naive UTC ISO strings, the format of the raw rows
+    out.insert(0, "timestamp", [datetime.fromtimestamp(t, timezone.utc).replace(tzinfo=None).isoformat()
+                               for t in frame["t"].tolist()])
+    for signal in SIGNALS:
+        out[signal] = (frame[f"{signal}_sum"] / frame["count"]).round(4)
+        out[f"{signal}_min"], out[f"{signal}_max"] = frame[f"{signal}_min"], frame[f"{signal}_max"]
+    return out[ROLLUP_COLUMNS].reset_index(drop=True)
+
+
+def _csv_chunks(f, start, end, header, chunk_bytes=READ_CHUNK_BYTES):
+    """DataFrames of the whole lines in bytes [start, end) of the open CSV `f`, about `chunk_bytes` at a time."""
+    import pandas as pd
+    f.seek(start)
+    position, rest = start, b""
+    while position < end:
+        chunk = f.read(min(chunk_bytes, end - position))
+        if not chunk:
+            break
+        position += len(chunk)
+        data = rest + chunk
+        cut = data.rfind(b"\n") + 1
+        data, rest = data[:cut], data[cut:]
+        if data:
+            yield pd.read_csv(io.BytesIO(data), names=header, header=None)
+
+
+def _concat(frames):
+    import pandas as pd
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS + ["resolution"])
+    return pd.concat(frames, ignore_index=True)
+
+
+class _Folder:
+    """Streams partial aggregates into `seconds` buckets, holding only the buckets still open."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.open = None
+        self.latest = -np.inf
+
+    def add(self, partial, final=False):
+        """Fold `partial` in; returns the buckets that are now closed (all of them with `final`)."""
+        import pandas as pd
+        if partial is not None and len(partial):
+            self.latest = max(self.latest, float(partial["t"].max()))
+            partial = _fold(partial, self.seconds)
+            self.open = partial if self.open is None else _fold(pd.concat([self.open, partial]), self.seconds)
+        if self.open is None:
+            return None
+        done = np.full(len(self.open), final) | (self.open["t"] + self.seconds + LATE_SECONDS <= self.latest).values
+        closed, self.open = self.open[done], self.open[~done]
+        return closed
+
+
+class Compactor:
+    """Retention for the history CSV: raw rows for `raw_seconds`, then per-minute and per-hour rollups.
+
+    Each `run` folds the raw blocks that are entirely older than the raw
+    window (whole hours, found through the CsvStorage's HistoryIndex) into
+    count / anomaly count / max risk and mean / min / max per signal, in
+    one streaming pass that holds only the buckets still open. The
+    buckets are appended to `<csv>_1m.csv` and `<csv>_1h.csv` (CsvStorage
+    files with their own index), flushed, and only then are the raw rows
+    dropped (CsvStorage.drop_before). The minute tier is trimmed the same
+    way after `minute_seconds`; hours are kept. A run interrupted between
+    writing rollups and trimming, or whose trim was skipped because the
+    CSV was open elsewhere (Windows), finishes the trim next time instead
+    of folding the rows again.
+    """
+
+    def __init__(self, storage, raw_seconds, minute_seconds=None, default_machine_id="machine1"):
+        if getattr(storage, "index", None) is None:
+            raise ValueError("compaction needs a CSV storage with an index")
+        self.storage = storage
+        self.raw_seconds = raw_seconds
+        self.minute_seconds = minute_seconds
+        self.default_machine_id = default_machine_id
+        self.tiers = {seconds: CsvStorage(rollup_path(storage.path, seconds), columns=ROLLUP_COLUMNS,
+                                          flush_rows=ROLLUP_FLUSH_ROWS, fsync=storage.fsync)
+                      for seconds in TIERS}
+        self.journal = storage.path + ".compacting"
+
+    def close(self):
+        for tier in self.tiers.values():
+            tier.close()
+
+    def run(self, now=None):
+        start = time.perf_counter()
+        now = time.time() if now is None else now
+        removed = self._finish_trim()
+        stats = {"rows": 0, "buckets_1m": 0, "buckets_1h": 0, "raw_bytes_removed": removed or 0,
+                 "rollup_bytes_removed": 0}
+        boundary = self.storage.index.boundary_before((now - self.raw_seconds) // 3600 * 3600)
+        # while a trim is still pending its rows are folded already
+        if removed is not None and boundary > self.storage.header_bytes:
+            self._fold(boundary, stats)
+            with open(self.journal, "w") as f:
+                json.dump({"inode": os.stat(self.storage.path).st_ino, "boundary": boundary}, f)
+            stats["raw_bytes_removed"] += self._finish_trim() or 0
+        if self.minute_seconds is not None:
+            minutes = self.tiers[60]
+            cut = minutes.index.boundary_before((now - self.minute_seconds) // 3600 * 3600)
+            stats["rollup_bytes_removed"] = minutes.drop_before(cut) or 0
+        stats["seconds"] = time.perf_counter() - start
+        return stats
+
+    def _finish_trim(self):
+        # bytes removed, or None if the CSV was locked (Windows) and the journal stays for the next run
+        try:
+            with open(self.journal) as f:
+                journal = json.load(f)
+        except FileNotFoundError:
+            return 0
+        removed = 0
+        if os.stat(self.storage.path).st_ino == journal["inode"]:  # otherwise the trim already happened
+            removed = self.storage.drop_before(journal["boundary"])
+            if removed is None:
+                return None
+        os.remove(self.journal)
+        return removed
+
+    def _fold(self, boundary, stats):
+        folders = [_Folder(seconds) for seconds in TIERS]
+
+        def write(partial, final=False):
+            # minutes close into the minute tier and roll up into hours
+            for folder in folders:
+                partial = folder.add(partial, final)
+                if partial is not None and len(partial):
+                    self.tiers[folder.seconds].append_many(_rollup_frame(partial).to_dict("records"))
+                    stats[f"buckets_{'1m' if folder.seconds == 60 else '1h'}"] += len(partial)
+
+        with open(self.storage.path, "rb") as f:
+            for df in _csv_chunks(f, self.storage.header_bytes, boundary, self.storage.columns):
+                stats["rows"] += len(df)
+                write(_raw_partial(df, self.default_machine_id))
+        write(None, final=True)
+        for tier in self.tiers.values():
+            tier.flush()
+
+
+class History:
+    """Time-range reads across the raw history CSV and its rollup tiers, for any process.
+
+    Hours cover what the minute tier no longer holds and minutes what the
+    raw file no longer holds, so a range is answered from the finest data
+    still kept. Rows come back oldest tier first as one frame with
+    ROLLUP_COLUMNS plus `resolution` (bucket seconds, 0 for raw rows, which
+    are single-reading buckets), so callers that only want the signals can
+    use the bare signal columns (readings or bucket means) throughout.
+    """
+
+    def __init__(self, csv_path, default_machine_id="machine1"):
+        self.default_machine_id = default_machine_id
+        self.raw = HistoryIndex(csv_path, default_machine_id=default_machine_id)
+        self.tiers = {seconds: HistoryIndex(rollup_path(csv_path, seconds), default_machine_id=default_machine_id)
+                      for seconds in TIERS}
+
+    def between(self, t0, t1, machine_id=None, raw=True):
+        """Rows and buckets with t0 <= timestamp <= t1 (epoch seconds); `raw=False` leaves out the raw rows."""
+        raw_start = self.raw.first_time()
+        frames = self._tiers(t0, t1, machine_id, raw_start)
+        if raw:
+            frames.append(self._raw(max(t0, raw_start), t1, machine_id))
+        return _concat(frames)
+
+    def chunks(self, machine_id=None, chunk_bytes=READ_CHUNK_BYTES, rollups=True):
+        """The whole history as `between` returns it, in pieces: the rollup tiers in one frame, then the
+        raw file about `chunk_bytes` at a time, so callers can stream it through bounded memory.
+        `rollups=False` leaves out the tiers."""
+        try:
+            f = open(self.raw.csv_path, "rb")  # held open: a compaction meanwhile replaces the file, not this view
+        except FileNotFoundError:
+            tiers = self.between(-np.inf, np.inf, machine_id, raw=False) if rollups else ()
+            if len(tiers):
+                yield tiers
+            return
+        with f:
+            first = f.readline()
+            header = first.decode().strip().split(",")
+            line = f.readline()
+            raw_start = _seconds([line.decode().split(",")[header.index("timestamp")]])[0] \
+                if line.endswith(b"\n") and "timestamp" in header else np.nan
+            # rows compacted after the file was opened are still in it, so the tiers stop where it starts
+            if rollups:
+                tiers = _concat(self._tiers(-np.inf, np.inf, machine_id, np.inf if np.isnan(raw_start) else raw_start))
+                if len(tiers):
+                    yield tiers
+            for df in _csv_chunks(f, len(first), os.fstat(f.fileno()).st_size, header, chunk_bytes):
+                if machine_id is not None and "machine_id" in df:
+                    df = df[df["machine_id"].fillna(self.default_machine_id).astype(str) == str(machine_id)]
+                if len(df):
+                    yield self._raw_frame(df)
+
+    def _tiers(self, t0, t1, machine_id, raw_start):
+        # the hour tier holds every compacted row: it takes over from the minutes at an hour boundary
+        minute_start = min(np.ceil(self.tiers[60].first_time() / 3600) * 3600, raw_start)
+        return [self._rollups(3600, t0, min(t1, minute_start), t1, machine_id),
+                self._rollups(60, max(t0, minute_start), min(t1, raw_start), t1, machine_id)]
+
+    def _rollups(self, seconds, lo, hi, t1, machine_id):
+        import pandas as pd
+        if lo > hi:
+            return pd.DataFrame()
+        df = self.tiers[seconds].between(lo, hi, machine_id)
+        if not len(df):
+            return df
+        if hi < t1:  # a tier boundary, not the end of the range: the next tier starts there
+            df = df[_seconds(df["timestamp"]) < hi]
+        if df.duplicated(["machine_id", "timestamp"]).any():
+            # buckets split across compaction runs (rows that were late, or in a block kept raw)
+            partial = _rollup_partial(df)
+            df = _rollup_frame(_fold(partial, seconds))
+        return df[ROLLUP_COLUMNS].assign(resolution=seconds)
+
+    def _raw(self, lo, hi, machine_id):
+        import pandas as pd
+        if lo > hi:
+            return pd.DataFrame()
+        df = self.raw.between(lo, hi, machine_id)
+        return self._raw_frame(df) if len(df) else df
+
+    def _raw_frame(self, df):
+        t = _seconds(df["timestamp"])
+        partial = _raw_partial(df, self.default_machine_id, t)  # rows with unparseable timestamps are left out
+        frame = partial[["machine_id", "count", "anomalies", "max_risk"]].copy()
+        frame.insert(0, "timestamp", df["timestamp"].values[~np.isnan(t)])
+        for signal in SIGNALS:
+            frame[signal] = partial[f"{signal}_sum"]
+            frame[f"{signal}_min"], frame[f"{signal}_max"] = partial[f"{signal}_min"], partial[f"{signal}_max"]
+        return frame.assign(resolution=0)
@@ -0,0 +1,152 @@
+import ctypes
+import ctypes.util
+import glob
+import json
+import os
+import select
+import sys
+import time
+
+SEGMENT_PATTERN = "seg-*.jsonl"
+OFFSET_FILE = ".offset"
+
+
+class SpoolReader:
+    """Reads a spool directory of append-only JSON-lines segments without losing lines.
+
+    Writers append one reading per line to `seg-<n>.jsonl` and move on to a
+    segment with a larger name once the current one is large enough (see
+    SpoolWriter in sensors/machine_sensor_sim_file.py). The reader tracks (segment, byte offset) of
+    the last complete line it returned; `commit()` stores it in `.offset`
+    so a restarted reader resumes exactly there. Lines are delivered at
+    least once: a crash between processing and `commit()` replays them.
+    """
+
+    def __init__(self, directory, delete_consumed=True):
+        self.directory = directory
+        self.delete_consumed = delete_consumed
+        os.makedirs(directory, exist_ok=True)
+        self.segment, self.offset = None, 0
+        path = os.path.join(directory, OFFSET_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            self.segment, self.offset = saved["segment"], saved["offset"]
+        self._done = []  # consumed segments, deleted on commit
+        self.bad_lines = 0
+
+    def _segments(self):
+        return sorted(os.path.basename(p) for p in glob.glob(os.path.join(self.directory, SEGMENT_PATTERN)))
+
+    def _read_from(self, segment, offset):
+        try:
+            with open(os.path.join(self.directory, segment), "rb") as f:
+                f.seek(offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return [], offset
+        end = chunk.rfind(b"\n")
+        if end == -1:
+            return [], offset
+        return chunk[:end].split(b"\n"), offset + end + 1
+
+    def read_new(self):
+        """Parsed readings appended since the previous call, in write order."""
+        lines = []
+        segments = self._segments()
+        if self.segment is None:
+            if not segments:
+                return []
+            self.segment, self.offset = segments[0], 0
+        while True:
+            newer = [s for s in segments if s > self.segment]
+            # a writer only starts a new segment after finishing the current one,
+            # so once a newer one exists this read reaches the final end of the segment
+            new_lines, self.offset = self._read_from(self.segment, self.offset)
+            lines.extend(new_lines)
+            if not newer:
+                break
+            self._done.append(self.segment)
+            self.segment, self.offset = newer[0], 0
+        readings = []
+        for line in lines:
+            try:
+                readings.append(json.loads(line))
+            except ValueError:
+                self.bad_lines += 1
+        return readings
+
+    def commit(self):
+        path = os.path.join(self.directory, OFFSET_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"segment": self.segment, "offset": self.offset}, f)
+        os.replace(path + ".tmp", path)
+        if self.delete_consumed:
+            for segment in self._done:
+                try:
+                    os.remove(os.path.join(self.directory, segment))
+                except FileNotFoundError:
+                    pass
+        self._done = []
+
+
+class _Inotify:
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class DirectoryWatcher:
+    """Blocks until something in `directory` changes: inotify on Linux, polling elsewhere.
+
+    `wait(timeout)` returns as soon as a file is created or written (within
+    `poll_seconds` when polling), or after `timeout` seconds. Callers always
+    re-read after it returns, so a missed or spurious wakeup costs nothing.
+    """
+
+    def __init__(self, directory, poll_seconds=0.05, use_inotify=True):
+        self.poll_seconds = poll_seconds
+        self.mode = "poll"
+        self._inotify = None
+        if use_inotify and sys.platform.startswith("linux"):
+            try:
+                self._inotify = _Inotify(directory)
+                self.mode = "inotify"
+            except (OSError, AttributeError) as e:
+                print("inotify unavailable, polling instead:", e)
+
+    def wait(self, timeout=1.0):
+        if self._inotify is not None:
+            return self._inotify.wait(timeout)
+        time.sleep(min(self.poll_seconds, timeout))
+        return True
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
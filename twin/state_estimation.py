@@ -0,0 +1,178 @@
+import numpy as np
+
+from anomaly_detector import chi2_quantile
+
+SIGNALS = ("temperature", "vibration", "rpm", "current")  # load is the operator's setpoint, not estimated
+# per data source, per signal: sensor noise, and the random-walk steps (per second) of the true level and of its rate
+NOISE_MODELS = {
+    # sensors/machine_sensor_sim*.py: independent uniform readings around a fixed level (std = range / sqrt(12))
+    "machine_sensor_sim": {"measurement_std": [10.1, 2.02, 289.0, 2.89], "level_std": [0.01, 0.002, 0.3, 0.003],
+                           "rate_std": [1e-4, 2e-5, 3e-3, 3e-5]},
+    # sensors/fleet_load_generator.py: operating point plus slow drift and wear, Gaussian sensor noise
+    "fleet_load_generator": {"measurement_std": [0.8, 0.25, 15.0, 0.3], "level_std": [0.02, 0.005, 0.5, 0.005],
+                             "rate_std": [1e-3, 2.5e-4, 2.5e-2, 2.5e-4]},
+}
+NOISE_MODEL = "machine_sensor_sim"  # for machines not given one: the repo's default sensors
+GATE_P = 0.999  # readings beyond this chi-square quantile of the innovation are flagged and not absorbed
+ANOMALY_P = 0.999999  # readings beyond this one are also anomalies (score_rows): about one in a million healthy ones
+MAX_GATED = 2  # after this many flagged readings in a row the machine restarts at the reading (a real change)
+MAX_DT = 60.0  # longer gaps are predicted as this long: uncertainty grows, the rate is not run for hours
+LEVELS = [f"kf_{signal}" for signal in SIGNALS]
+RESIDUALS = [f"res_{signal}" for signal in SIGNALS]
+COLUMNS = LEVELS + RESIDUALS + ["innovation"]  # fields scored rows get: levels, residuals and NIS
+
+
+class FleetKalman:
+    """Kalman filter of every machine's temperature, vibration, rpm and current, as stacked arrays.
+
+    Each signal is a level with a rate of change (constant-rate process
+    model: the level moves by rate * dt, both take random-walk noise), so
+    a machine's state is 8 numbers, levels first. States, covariances and
+    last update times of all machines sit in (machines, ...) arrays, and
+    `step` predicts and updates every machine in a batch with a handful of
+    batched matrix operations instead of a Python loop per machine; a
+    machine with several readings in one batch takes them in order over as
+    many rounds.
+
+    Besides the filtered levels, `step` returns the innovation (reading
+    minus prediction) and its normalized square (NIS, chi-square with 4
+    degrees of freedom for a healthy sensor). A reading whose NIS exceeds
+    the GATE_P quantile is reported as gated and not absorbed, so a spike
+    does not drag the state; MAX_GATED gated readings in a row restart the
+    machine at the new level. A NIS beyond the stricter `anomaly_p`
+    quantile also marks the reading as an anomaly.
+
+    The gate is only as good as the noise model: each machine uses the
+    NOISE_MODELS entry of its data source, `machine_noise[machine_id]` or
+    else `noise_model`.
+    """
+
+    def __init__(self, noise_model=NOISE_MODEL, machine_noise=None, noise_models=NOISE_MODELS, gate_p=GATE_P,
+                 anomaly_p=ANOMALY_P, max_gated=MAX_GATED, capacity=1024):
+        d = len(SIGNALS)
+        self.models = list(noise_models)
+        self.noise_model = self.models.index(noise_model)
+        self.machine_noise = {machine_id: self.models.index(name) for machine_id, name in (machine_noise or {}).items()}
+        std = {key: np.array([noise_models[name][key] for name in self.models], dtype=float)
+               for key in ("measurement_std", "level_std", "rate_std")}
+        # one row per noise model
+        self.R = np.stack([np.diag(v) for v in std["measurement_std"] ** 2])
+        self.level_var = std["level_std"] ** 2
+        self.rate_var = std["rate_std"] ** 2
+        self.P0 = np.stack([np.diag(np.concatenate([v, v * 0.01])) for v in std["measurement_std"] ** 2])
+        self.threshold = chi2_quantile(gate_p, d) if gate_p is not None else np.inf
+        self.anomaly_threshold = chi2_quantile(anomaly_p, d) if anomaly_p is not None else np.inf
+        self.max_gated = max_gated
+        self.index = {}  # machine_id -> row in the arrays
+        self.model = np.zeros(capacity, dtype=np.intp)  # noise model of each machine
+        self.x = np.zeros((capacity, 2 * d))
+        self.P = np.zeros((capacity, 2 * d, 2 * d))
+        self.t = np.zeros(capacity)
+        self.gated = np.zeros(capacity, dtype=int)  # consecutive gated readings
+
+    def __len__(self):
+        return len(self.index)
+
+    def _slots(self, machine_ids):
+        index = self.index
+        slots = np.empty(len(machine_ids), dtype=np.intp)
+        new = []
+        for i, machine_id in enumerate(machine_ids):
+            slot = index.get(machine_id)
+            if slot is None:
+                slot = index[machine_id] = len(index)
+                new.append((slot, self.machine_noise.get(machine_id, self.noise_model)))
+            slots[i] = slot
+        if len(index) > len(self.x):
+            grow = max(len(index), 2 * len(self.x)) - len(self.x)
+            self.model = np.concatenate([self.model, np.zeros(grow, dtype=np.intp)])
+            self.x = np.concatenate([self.x, np.zeros((grow,) + self.x.shape[1:])])
+            self.P = np.concatenate([self.P, np.zeros((grow,) + self.P.shape[1:])])
+            self.t = np.concatenate([self.t, np.zeros(grow)])
+            self.gated = np.concatenate([self.gated, np.zeros(grow, dtype=int)])
+        for slot, model in new:
+            self.model[slot] = model
+        return slots, np.array([slot for slot, _ in new], dtype=np.intp)
+
+    def step(self, machine_ids, times, Z):
+        """Filter one reading per row: Z holds the SIGNALS values (rows x 4), `times` seconds on any one clock.
+
+        Returns a dict of arrays, one row per reading: "filtered" levels and
+        "residual" (innovation) per signal, "nis", "gated" and "anomaly"."""
+        Z = np.asarray(Z, dtype=float)
+        times = np.asarray(times, dtype=float)
+        n = len(Z)
+        out = {"filtered": np.empty((n, len(SIGNALS))), "residual": np.zeros((n, len(SIGNALS))),
+               "nis": np.zeros(n), "gated": np.zeros(n, dtype=bool), "anomaly": np.zeros(n, dtype=bool)}
+        if not n:
+            return out
+        slots, new = self._slots(machine_ids)
+        # the k-th reading of a machine in this batch goes in round k
+        order = np.argsort(slots, kind="stable")
+        first = np.r_[True, slots[order][1:] != slots[order][:-1]]
+        rank = np.empty(n, dtype=int)
+        rank[order] = np.arange(n) - np.maximum.accumulate(np.where(first, np.arange(n), 0))
+        fresh = np.zeros(n, dtype=bool)
+        fresh[order[first]] = np.isin(slots[order[first]], new)
+        for r in range(rank.max() + 1):
+            rows = np.flatnonzero(rank == r)
+            start = rows[fresh[rows]]
+            if len(start):
+                self._start(slots[start], times[start], Z[start])
+                out["filtered"][start] = Z[start]
+            rows = rows[~fresh[rows]]
+            if len(rows):
+                self._update(rows, slots[rows], times[rows], Z[rows], out)
+        return out
+
+    def _start(self, slots, times, Z):
+        d = len(SIGNALS)
+        self.x[slots, :d], self.x[slots, d:] = Z, 0.0
+        self.P[slots] = self.P0[self.model[slots]]
+        self.t[slots] = times
+        self.gated[slots] = 0
+
+    def _update(self, rows, slots, times, Z, out):
+        d = len(SIGNALS)
+        m = len(slots)
+        dt = np.clip(times - self.t[slots], 0.0, MAX_DT)
+        x, P = self.x[slots], self.P[slots]
+        model = self.model[slots]
+
+        # predict: level += rate * dt
+        F = np.broadcast_to(np.eye(2 * d), (m, 2 * d, 2 * d)).copy()
+        levels, rates = np.arange(d), np.arange(d, 2 * d)
+        F[:, levels, rates] = dt[:, None]
+        x_pred = x.copy()
+        x_pred[:, :d] += x[:, d:] * dt[:, None]
+        Q = np.zeros((m, 2 * d, 2 * d))
+        dt1 = dt[:, None]
+        level_var, rate_var = self.level_var[model], self.rate_var[model]
+        Q[:, levels, levels] = level_var * dt1 + rate_var * dt1 ** 3 / 3
+        Q[:, levels, rates] = Q[:, rates, levels] = rate_var * dt1 ** 2 / 2
+        Q[:, rates, rates] = rate_var * dt1
+        P_pred = F @ P @ F.transpose(0, 2, 1) + Q
+
+        # update: the readings measure the levels (H = [I 0])
+        residual = Z - x_pred[:, :d]
+        S_inv = np.linalg.inv(P_pred[:, :d, :d] + self.R[model])
+        nis = np.einsum("mi,mij,mj->m", residual, S_inv, residual)
+        K = P_pred[:, :, :d] @ S_inv
+        x_new = x_pred + (K @ residual[:, :, None])[:, :, 0]
+        P_new = P_pred - K @ P_pred[:, :d, :]
+        P_new = (P_new + P_new.transpose(0, 2, 1)) / 2
+
+        gated = nis > self.threshold
+        count = np.where(gated, self.gated[slots] + 1, 0)
+        keep = gated & (count < self.max_gated)  # flagged: carry the prediction, ignore the reading
+        x_new[keep], P_new[keep] = x_pred[keep], P_pred[keep]
+        self.x[slots], self.P[slots], self.t[slots], self.gated[slots] = x_new, P_new, times, count
+        restart = gated & ~keep
+        if restart.any():
+            self._start(slots[restart], times[restart], Z[restart])
+
+        out["filtered"][rows] = self.x[slots, :d]
+        out["residual"][rows] = residual
+        out["nis"][rows] = nis
+        out["gated"][rows] = gated
+        out["anomaly"][rows] = nis > self.anomaly_threshold
@@ -0,0 +1,553 @@
+import csv
+import glob
+import io
+import os
+import threading
+import time
+
+# pandas is imported where rows are read back, keeping it off the engine's startup path
+
+COLUMNS = ["timestamp", "temperature", "vibration", "rpm", "current", "load", "anomaly", "risk_score", "machine_id", "model_version"]
+FSYNC_POLICIES = ("never", "flush", "always")
+COPY_CHUNK_BYTES = 8 << 20
+REPLACE_ATTEMPTS = 5  # tries (with growing pauses, 0.75 s in all, under the write lock) to swap a file open elsewhere
+
+
+def _inode(path):
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+
+def replace_file(src, dst):
+    # on Windows os.replace fails while any process (a reader's brief open) holds dst
+    for attempt in range(REPLACE_ATTEMPTS):
+        try:
+            os.replace(src, dst)
+            return True
+        except PermissionError:
+            time.sleep(0.05 * (attempt + 1))
+    return False
+
+
+def _copy_range(src, dst, start, end):
+    src.seek(start)
+    while start < end:
+        chunk = src.read(min(COPY_CHUNK_BYTES, end - start))
+        if not chunk:
+            break
+        dst.write(chunk)
+        start += len(chunk)
+
+
+class BufferedStorage:
+    """Base for history writers that buffer rows and write them in batches.
+
+    Rows are written once `flush_rows` are buffered or `flush_seconds` have
+    passed since the last write, whichever comes first. `fsync` is one of
+    "never" (leave it to the OS), "flush" (fsync after every batch write) or
+    "always" (write and fsync every row as it arrives).
+    """
+
+    def __init__(self, flush_rows=256, flush_seconds=1.0, fsync="never"):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        self.flush_rows = 1 if fsync == "always" else flush_rows
+        self.flush_seconds = flush_seconds
+        self.fsync = fsync
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._closed = threading.Event()
+        self._timer = threading.Thread(target=self._flush_loop, daemon=True)
+        self._timer.start()
+
+    def append(self, row_dict):
+        self.append_many([row_dict])
+
+    def append_many(self, rows):
+        with self._lock:
+            self._buffer.extend(rows)
+            if len(self._buffer) >= self.flush_rows:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            self._flush_locked()
+            self._close()
+
+    def _flush_locked(self):
+        if self._buffer:
+            rows, self._buffer = self._buffer, []
+            self._write(rows)
+        self._last_flush = time.monotonic()
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_seconds / 2):
+            with self._lock:
+                if self._buffer and time.monotonic() - self._last_flush >= self.flush_seconds:
+                    self._flush_locked()
+
+    def _write(self, rows):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+
+def _add_columns(path, existing, columns):
+    # one streaming pass into a copy that replaces the file; its index no longer matches and is rebuilt
+    missing = [c for c in columns if c not in existing]
+    columns = existing + missing
+    tmp = path + ".tmp"
+    with open(path, newline="") as src, open(tmp, "w", newline="") as dst:
+        reader, writer = csv.reader(src), csv.writer(dst)
+        next(reader)
+        writer.writerow(columns)
+        for row in reader:
+            writer.writerow(row + [""] * (len(columns) - len(row)))
+    if not replace_file(tmp, path):
+        os.remove(tmp)
+        raise PermissionError(f"{path} lacks columns {missing} and is open in another process: cannot add them")
+    if os.path.exists(path + ".idx"):
+        os.remove(path + ".idx")
+    print(f"Added columns {missing} to {path}.")
+    return columns
+
+
+class CsvStorage(BufferedStorage):
+    """Appends to a single CSV file that stays open between writes.
+
+    An existing file keeps its own header; one written by an older version
+    that lacks some of `columns` is first rewritten with them added (empty
+    in its old rows), so no column of new rows is dropped. With `index`,
+    every written batch is recorded in a HistoryIndex (history_index.py)
+    for time-range and last-N queries that seek instead of scanning.
+    `drop_before` trims old rows off the front (retention.py) without
+    stopping writers.
+    """
+
+    def __init__(self, path, index=True, columns=COLUMNS, **kwargs):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.columns = columns
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new_file:
+            with open(path, "rb") as f:
+                header = f.readline()
+            self.columns = next(csv.reader([header.decode()]))
+            if set(columns) - set(self.columns):
+                self.columns = _add_columns(path, self.columns, columns)
+                header = None
+        # batches are encoded first so their byte range is known for the index
+        self._file = open(path, "ab")
+        self._text = io.StringIO()
+        self._writer = csv.writer(self._text)
+        if new_file:
+            header = self._encode([self.columns])
+            self._file.write(header)
+            self._file.flush()
+        elif header is None:
+            header = self._encode([self.columns])
+        self.header_bytes = len(header)
+        self.index = None
+        if index:
+            from history_index import HistoryIndex
+            self.index = HistoryIndex(path, writable=True)
+        super().__init__(**kwargs)
+
+    def _encode(self, rows):
+        self._text.seek(0)
+        self._text.truncate()
+        self._writer.writerows(rows)
+        return self._text.getvalue().encode()
+
+    def _write(self, rows):
+        data = self._encode([[row.get(c) for c in self.columns] for row in rows])
+        offset = self._file.tell()
+        self._file.write(data)
+        self._file.flush()
+        if self.fsync != "never":
+            os.fsync(self._file.fileno())
+        if self.index is not None:
+            self.index.add(rows, offset, len(data))
+
+    def _close(self):
+        self._file.close()
+
+    def drop_before(self, offset):
+        """Remove the rows before byte `offset` (a block boundary from the index), keeping the header.
+
+        The rows after it are copied to a new file that replaces this one;
+        only the bytes written during the copy are copied under the write
+        lock. Tails (CsvTail) follow the move through `<csv>.trims`. The
+        new CSV, its index and the `.trims` record are all ready before the
+        swap, and a failure after it puts the old CSV back (kept as a hard
+        link) and drops the record, so the three always match.
+        Returns the bytes removed, or None if the file or its index stayed
+        locked by another process (Windows) and the trim was skipped."""
+        removed = offset - self.header_bytes
+        if removed <= 0:
+            return 0
+        tmp = self.path + ".tmp"
+        with self._lock:
+            self._flush_locked()
+            end = self._file.tell()
+        with open(self.path, "rb") as src, open(tmp, "wb") as dst:
+            dst.write(src.read(self.header_bytes))
+            _copy_range(src, dst, offset, end)
+        with self._lock:
+            self._flush_locked()
+            with open(self.path, "rb") as src, open(tmp, "ab") as dst:
+                _copy_range(src, dst, end, self._file.tell())
+                dst.flush()
+                if self.fsync != "never":
+                    os.fsync(dst.fileno())
+            index_tmp = self.index.prepare_drop(offset, self.header_bytes) if self.index is not None else None
+            trims, backup = self.path + ".trims", self.path + ".old"
+            trims_size = os.path.getsize(trims) if os.path.exists(trims) else 0
+            before = _inode(self.path)
+            if os.path.exists(backup):
+                os.remove(backup)
+            os.link(self.path, backup)
+            # Windows cannot replace a file that is open, so the write handle is closed around the swap
+            self._file.close()
+            restored = True
+            try:
+                replaced = replace_file(tmp, self.path)
+                if replaced:
+                    try:
+                        with open(trims, "a") as f:
+                            f.write(f"{before} {_inode(self.path)} {self.header_bytes} {removed}\n")
+                        replaced = index_tmp is None or self.index.commit_drop(index_tmp)
+                    except BaseException:
+                        restored = self._restore(backup, trims, trims_size)
+                        raise
+                    if not replaced:
+                        restored = self._restore(backup, trims, trims_size)
+            finally:
+                self._file = open(self.path, "ab")
+                for path in (tmp, index_tmp, backup if restored else None):
+                    if path is not None and os.path.exists(path):
+                        os.remove(path)
+            if not restored:
+                raise PermissionError(f"{self.path} is trimmed but its index is not, and the old file is kept "
+                                      f"as {backup}: it is locked by another process")
+            if not replaced:
+                print(f"{self.path} or its index is open in another process, trim skipped.")
+                return None
+        return removed
+
+    def _restore(self, backup, trims, trims_size):
+        # undo a trim whose index or .trims record could not follow the swapped CSV; False if it stays
+        if not replace_file(backup, self.path):
+            print(f"{self.path} is trimmed but could not be restored: the old file is kept as {backup}.")
+            return False
+        if os.path.exists(trims):
+            with open(trims, "r+b") as f:
+                f.truncate(trims_size)
+        return True
+
+    def tail(self, last_rows=None):
+        """A CsvTail; with `last_rows` (and an index) it starts near the latest rows, not the top."""
+        if last_rows is None or self.index is None:
+            return CsvTail(self.path)
+        self.flush()
+        offset = self.index.offset_of_last(last_rows)
+        return CsvTail(self.path, offset, self.columns if offset else None)
+
+    def read(self):
+        import pandas as pd
+        self.flush()
+        return pd.read_csv(self.path)
+
+
+class CsvTail:
+    """Reads only the rows appended to a CSV since the previous call.
+
+    Tracks the byte offset of the last complete line consumed; a partially
+    written trailing line is left for the next call. When the writer trims
+    old rows (CsvStorage.drop_before) the offset is moved with them, and
+    rows trimmed before they were read are skipped. A file that shrinks or
+    is replaced any other way is read again from the top.
+    """
+
+    def __init__(self, path, offset=0, header=None):
+        self.path = path
+        self.offset = offset  # a line start past the header needs `header` given
+        self.header = header
+        self.inode = None
+        self.trims_read = None  # bytes of `<csv>.trims` already followed
+
+    def _follow_trims(self, inode):
+        # one pass forward from the last entry followed, in the order the trims happened: an inode
+        # number the filesystem reuses cannot send it round in a cycle
+        try:
+            with open(self.path + ".trims", "rb") as f:
+                f.seek(self.trims_read)
+                for line in f:
+                    if self.inode == inode or not line.endswith(b"\n"):
+                        break
+                    self.trims_read += len(line)
+                    before, after, header_bytes, removed = map(int, line.split())
+                    if before == self.inode:
+                        self.inode = after
+                        if self.offset:
+                            self.offset = max(header_bytes, self.offset - removed)
+        except (FileNotFoundError, ValueError):
+            pass
+        if self.inode != inode:
+            self.offset = 0
+            self.header = None
+
+    def read_new(self):
+        import pandas as pd
+        if not os.path.exists(self.path):
+            return pd.DataFrame(columns=self.header or [])
+        if self.trims_read is None:  # trims before the first read are not ours to follow
+            try:
+                self.trims_read = os.path.getsize(self.path + ".trims")
+            except OSError:
+                self.trims_read = 0
+
+        with open(self.path, "rb") as f:
+            inode = os.fstat(f.fileno()).st_ino
+            if self.inode is not None and inode != self.inode:
+                self._follow_trims(inode)
+            self.inode = inode
+            f.seek(0, os.SEEK_END)
+            if f.tell() < self.offset:
+                self.offset = 0
+                self.header = None
+            f.seek(self.offset)
+            chunk = f.read()
+
+        end = chunk.rfind(b"\n")
+        if end == -1:
+            return pd.DataFrame(columns=self.header or [])
+        chunk = chunk[:end + 1]
+        self.offset += len(chunk)
+
+        if self.header is None:
+            first, _, chunk = chunk.partition(b"\n")
+            self.header = first.decode().strip().split(",")
+        if not chunk:
+            return pd.DataFrame(columns=self.header)
+        return pd.read_csv(io.BytesIO(chunk), names=self.header, header=None)
+
+
+def _arrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("the columnar storage backend needs pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+
+def arrow_schema():
+    pa = _arrow()
+    return pa.schema([
+        ("timestamp", pa.timestamp("us")),
+        ("temperature", pa.float32()),
+        ("vibration", pa.float32()),
+        ("rpm", pa.int16()),
+        ("current", pa.float32()),
+        ("load", pa.int16()),
+        ("anomaly", pa.bool_()),
+        ("risk_score", pa.float32()),
+        ("machine_id", pa.dictionary(pa.int32(), pa.string())),
+        ("model_version", pa.int32()),
+    ])
+
+
+class ColumnarStorage(BufferedStorage):
+    """Writes typed Parquet or Arrow IPC segments, one directory per UTC hour.
+
+    Every flush writes a new segment `<hour>/seg-<seq>.<ext>`. When rows for a
+    newer hour arrive, the segments of older hours are compacted into one
+    file `seg-<first>-<last>.<ext>`, which sorts before any segment written
+    for that hour later, so file name order is always row order.
+    """
+
+    def __init__(self, directory, format="parquet", **kwargs):
+        if format not in ("parquet", "arrow"):
+            raise ValueError(f"format must be 'parquet' or 'arrow', got {format!r}")
+        self.pa = _arrow()
+        self.schema = arrow_schema()
+        self.directory = directory
+        self.format = format
+        self.ext = "parquet" if format == "parquet" else "arrow"
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+        self._seq = max((_segment_seq(p)[1] for p in self._all_segments()), default=0)
+        self._current_hour = None
+        super().__init__(**kwargs)
+
+    def _all_segments(self):
+        return list_segments(self.directory, self.ext)
+
+    def _recover(self):
+        # a compaction interrupted after removing its inputs left only its .ready output;
+        # a .tmp file is a write that never completed
+        for ready in glob.glob(os.path.join(self.directory, "*", f"seg-*.{self.ext}.ready")):
+            os.replace(ready, ready[:-len(".ready")])
+        for tmp in glob.glob(os.path.join(self.directory, "*", f"seg-*.{self.ext}.tmp")):
+            os.remove(tmp)
+
+    def _table(self, rows):
+        pa = self.pa
+        arrays = []
+        for field in self.schema:
+            values = [row.get(field.name) for row in rows]
+            if field.name == "timestamp":
+                arrays.append(pa.array(values, pa.string()).cast(field.type))
+            else:
+                arrays.append(pa.array(values).cast(field.type))
+        return pa.Table.from_arrays(arrays, schema=self.schema)
+
+    def _write_table(self, table, path):
+        tmp = path + ".tmp"
+        if self.format == "parquet":
+            self.pa.parquet.write_table(table, tmp)
+        else:
+            with self.pa.OSFile(tmp, "wb") as sink:
+                with self.pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+        if self.fsync != "never":
+            with open(tmp, "rb") as f:
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _write(self, rows):
+        by_hour = {}
+        for row in rows:
+            by_hour.setdefault(str(row.get("timestamp"))[:13], []).append(row)
+
+        for hour in sorted(by_hour):
+            hour_dir = os.path.join(self.directory, hour)
+            os.makedirs(hour_dir, exist_ok=True)
+            self._seq += 1
+            self._write_table(self._table(by_hour[hour]), os.path.join(hour_dir, f"seg-{self._seq:08d}.{self.ext}"))
+
+        newest = max(by_hour)
+        if self._current_hour is None or newest > self._current_hour:
+            self._current_hour = newest
+            self._compact_before(newest)
+
+    def _compact_before(self, hour):
+        for hour_dir in sorted(glob.glob(os.path.join(self.directory, "*"))):
+            if os.path.basename(hour_dir) >= hour:
+                continue
+            files = sorted(glob.glob(os.path.join(hour_dir, f"seg-*.{self.ext}")))
+            if len(files) < 2:
+                continue
+            table = self.pa.concat_tables([read_segment(p) for p in files])
+            first, last = _segment_seq(files[0])[0], _segment_seq(files[-1])[1]
+            target = os.path.join(hour_dir, f"seg-{first:08d}-{last:08d}.{self.ext}")
+            ready = target + ".ready"
+            self._write_table(table, ready)
+            # remove inputs before publishing the output: readers may briefly
+            # see fewer rows for this hour, never the same rows twice
+            for p in files:
+                os.remove(p)
+            os.replace(ready, target)
+
+    def tail(self, last_rows=None):
+        # segments have no row index: a tail always starts from the oldest hour
+        return SegmentTail(self.directory, self.ext)
+
+    def read(self):
+        import pandas as pd
+        self.flush()
+        files = self._all_segments()
+        if not files:
+            return pd.DataFrame(columns=COLUMNS)
+        return self.pa.concat_tables([read_segment(p) for p in files]).to_pandas()
+
+
+def _segment_seq(path):
+    parts = os.path.basename(path).split(".")[0].split("-")[1:]
+    return int(parts[0]), int(parts[-1])
+
+
+def list_segments(directory, ext):
+    """Complete segments of a ColumnarStorage directory in row order (no .tmp or .ready files)."""
+    return sorted(glob.glob(os.path.join(directory, "*", f"seg-*.{ext}")))
+
+
+def read_segment(path, columns=None):
+    pa = _arrow()
+    if path.endswith(".parquet"):
+        return pa.parquet.read_table(path, columns=columns)
+    with pa.memory_map(path) as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.select(columns) if columns else table
+
+
+def _segment_rows(path):
+    pa = _arrow()
+    if path.endswith(".parquet"):
+        return pa.parquet.read_metadata(path).num_rows
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+
+
+class SegmentTail:
+    """Columnar counterpart of CsvTail: returns rows written since the previous call.
+
+    Progress is tracked as rows consumed per hour directory, which stays
+    valid when that hour's segments are compacted into one file.
+    """
+
+    def __init__(self, directory, ext="parquet"):
+        self.directory = directory
+        self.ext = ext
+        self.consumed = {}
+        self.done = set()
+
+    def read_new(self):
+        import pandas as pd
+        pa = _arrow()
+        tables = []
+        hour_dirs = sorted(glob.glob(os.path.join(self.directory, "*")))
+        for hour_dir in hour_dirs:
+            hour = os.path.basename(hour_dir)
+            if hour in self.done:
+                continue
+            skip = self.consumed.get(hour, 0)
+            files = sorted(glob.glob(os.path.join(hour_dir, f"seg-*.{self.ext}")))
+            if hour_dir != hour_dirs[-1] and len(files) == 1 and "-" in os.path.basename(files[0])[4:]:
+                # a past hour already compacted: once consumed, stop listing it
+                if skip == _segment_rows(files[0]):
+                    self.done.add(hour)
+                    continue
+            for path in files:
+                n = _segment_rows(path)
+                if skip >= n:
+                    skip -= n
+                    continue
+                table = read_segment(path)
+                tables.append(table.slice(skip))
+                self.consumed[hour] = self.consumed.get(hour, 0) + n - skip
+                skip = 0
+        if not tables:
+            return pd.DataFrame(columns=COLUMNS)
+        return pa.concat_tables(tables).to_pandas()
+
+
+def open_storage(backend, path, **kwargs):
+    """`backend` is "csv" (path is the CSV file), "parquet" or "arrow" (path is a directory)."""
+    if backend == "csv":
+        return CsvStorage(path, **kwargs)
+    if backend in ("parquet", "arrow"):
+        return ColumnarStorage(path, format=backend, **kwargs)
+    raise ValueError(f"unknown storage backend {backend!r}")
@@ -0,0 +1,237 @@
+"""Offline training of the risk predictor: candidate models fitted in parallel, the best on held-out rows published.
+
+The raw history (the CSV through retention.History, or the hourly
+segments of a columnar backend; not the rollup tiers, whose means would
+skew the rolling features) is streamed in order, in chunks, through the
+engine's rolling features into float32 arrays on disk. The most recent
+TEST_SIZE of the rows are held out, so rows scored in evaluation come
+after everything trained on. Every candidate (RandomForest settings) is fitted in a
+pool of --n-jobs processes that memory-map those arrays; candidates still
+running when the --budget of wall-clock seconds is spent are stopped.
+The winner on --metric over the held-out rows is saved to models/ (or
+models/<machine_id>/) unless the model already there scores better on the
+same rows. The engine picks it up with RETRAIN_MODE = "offline", scorer
+processes on their next model reload.
+
+    python twin/train.py --n-jobs 8 --budget 600
+    python twin/train.py --history data/machine_live.csv --candidates '[{"n_estimators": 100}]'
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from features import ALL_FEATURES, MachineFeatures, feature_columns
+from fleet import DEFAULT_MACHINE_ID
+from predictive_maintenance import FEATURES, TEST_SIZE, PredictiveMaintenance, evaluate
+from retention import History
+from storage import list_segments, read_segment
+
+# CONFIG
+HISTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "machine_live.csv")
+CANDIDATES = [  # RandomForestClassifier settings, cheapest first so a short budget still yields a model
+    {"n_estimators": 50},  # the engine's own retrain
+    {"n_estimators": 50, "max_depth": 12},
+    {"n_estimators": 100, "min_samples_leaf": 5},
+    {"n_estimators": 100, "class_weight": "balanced"},
+    {"n_estimators": 200, "max_features": 0.5},
+]
+METRIC = "average_precision"  # a key of predictive_maintenance.evaluate; lower is better only for log_loss
+BUDGET_SECONDS = 600  # wall clock for fitting the candidates
+MIN_ROWS = 30  # same floor as PredictiveMaintenance.train
+CHUNK_BYTES = 1 << 20  # history read per step (~15k rows, each expanded to ~55 features)
+
+_data = {}  # worker process: the memory-mapped split
+
+
+def _chunks(history, machine_id, chunk_bytes):
+    if os.path.isdir(history):  # parquet / arrow hourly segments
+        for path in list_segments(history, "parquet") or list_segments(history, "arrow"):
+            df = read_segment(path).to_pandas()
+            if machine_id is not None and "machine_id" in df:
+                df = df[df["machine_id"].fillna(DEFAULT_MACHINE_ID).astype(str) == machine_id]
+            if len(df):
+                yield df
+    else:
+        yield from History(history, DEFAULT_MACHINE_ID).chunks(machine_id, chunk_bytes, rollups=False)
+
+
+def stream_split(history, workdir, feature_names, machine_id=None, chunk_bytes=CHUNK_BYTES):
+    """Write features and labels of the whole history, in order, to `workdir`; returns the row counts
+    of the split: the last TEST_SIZE of the rows are the test rows. Memory follows `chunk_bytes`."""
+    features = MachineFeatures()
+    columns = feature_columns(tuple(feature_names))
+    labeller = PredictiveMaintenance()
+    n = 0
+    with open(os.path.join(workdir, "X.bin"), "wb") as fx, open(os.path.join(workdir, "y.bin"), "wb") as fy:
+        for df in _chunks(history, machine_id, chunk_bytes):
+            # replay in order through the rolling features, as retrain_full does
+            X = features.transform_frame(df, DEFAULT_MACHINE_ID).values[:, columns].astype(np.float32)
+            fx.write(X.tobytes())
+            fy.write(labeller._generate_labels(df).astype(np.int8).tobytes())
+            n += len(X)
+    test = int(round(n * TEST_SIZE))
+    return {"train": n - test, "test": test}
+
+
+def _load_split(workdir, counts, n_features):
+    # X.bin and y.bin hold the training rows, then the test rows
+    split, start = {}, 0
+    for name in ("train", "test"):
+        n = counts[name]
+        split[f"X_{name}"] = np.memmap(os.path.join(workdir, "X.bin"), np.float32, "r",
+                                       offset=start * n_features * 4, shape=(n, n_features))
+        split[f"y_{name}"] = np.memmap(os.path.join(workdir, "y.bin"), np.int8, "r", offset=start, shape=(n,))
+        start += n
+    return split
+
+
+def _init_worker(workdir, counts, n_features):
+    _data.update(_load_split(workdir, counts, n_features))
+
+
+def _fit_candidate(task):
+    i, params, feature_names, path = task
+    import joblib
+    start = time.perf_counter()
+    predictor = PredictiveMaintenance(feature_names=feature_names, params=params)
+    try:
+        evaluation = predictor.fit(_data["X_train"], _data["y_train"], _data["X_test"], _data["y_test"])
+    except Exception as e:  # bad settings fail this candidate, not the run
+        return i, repr(e), time.perf_counter() - start, 0
+    seconds = time.perf_counter() - start
+    model = predictor.model
+    model.set_params(n_jobs=None)  # the saved model scores in a single process
+    joblib.dump(model, path)
+    nodes = sum(tree.tree_.node_count for tree in model.estimators_)
+    return i, evaluation, seconds, nodes
+
+
+def _score(evaluation, metric):
+    value = (evaluation or {}).get(metric)
+    if value is None:
+        return -np.inf
+    return -value if metric == "log_loss" else value
+
+
+def fit_candidates(workdir, counts, feature_names, candidates, n_jobs, budget, metric=METRIC):
+    """Fit candidates in a process pool until done or `budget` seconds have passed; returns one result
+    per finished candidate (params, evaluation, seconds, nodes, path), best first."""
+    workers = max(1, min(n_jobs, len(candidates)))
+    per_fit = max(1, n_jobs // workers)  # cores left over go to each forest's own tree building
+    tasks = [(i, dict(params, n_jobs=per_fit), feature_names, os.path.join(workdir, f"candidate{i}.pkl"))
+             for i, params in enumerate(candidates)]
+    methods = mp.get_all_start_methods()
+    ctx = mp.get_context("fork" if "fork" in methods else None)
+    deadline = time.monotonic() + budget
+    results = []
+    pool = ctx.Pool(workers, _init_worker, (workdir, counts, len(feature_names)))
+    try:
+        finished = pool.imap_unordered(_fit_candidate, tasks)
+        for _ in tasks:
+            try:
+                i, evaluation, seconds, nodes = finished.next(timeout=max(0.0, deadline - time.monotonic()))
+            except mp.TimeoutError:
+                print(f"Budget of {budget:.0f}s spent: unfinished candidates stopped.")
+                break
+            if isinstance(evaluation, str):
+                print(f"Candidate {json.dumps(candidates[i])} failed: {evaluation}")
+                continue
+            results.append({"params": candidates[i], "evaluation": evaluation, "seconds": seconds,
+                            "nodes": nodes, "path": tasks[i][3]})
+            print(f"Candidate {json.dumps(candidates[i])}: {metric} {evaluation[metric]}, f1 {evaluation['f1']}, "
+                  f"{nodes} nodes, fitted in {seconds:.1f}s.")
+    finally:
+        pool.terminate()  # stops fits still running past the budget
+        pool.join()
+    # ties go to the smaller forest, which scores faster in the engine
+    return sorted(results, key=lambda r: (-_score(r["evaluation"], metric), r["nodes"]))
+
+
+def train(history=HISTORY, candidates=CANDIDATES, n_jobs=None, budget=BUDGET_SECONDS, metric=METRIC,
+          feature_names=ALL_FEATURES, machine_id=None, force=False, publish=True, chunk_bytes=CHUNK_BYTES):
+    """Stream, fit, evaluate and (if it is at least as good as the saved model) publish; returns a summary."""
+    import joblib
+    start = time.perf_counter()
+    n_jobs = n_jobs or os.cpu_count() or 1
+    feature_names = list(feature_names)
+    workdir = tempfile.mkdtemp(prefix="twin-train-")
+    try:
+        counts = stream_split(history, workdir, feature_names, machine_id, chunk_bytes)
+        streamed = time.perf_counter() - start
+        print(f"Streamed {counts['train']} training and {counts['test']} held-out rows in {streamed:.1f}s.")
+        summary = {"rows": counts, "stream_seconds": streamed, "candidates": [], "published": None}
+        if counts["train"] < MIN_ROWS or not counts["test"]:
+            print("Not enough data to train.")
+            return summary
+
+        results = fit_candidates(workdir, counts, feature_names, candidates, n_jobs, budget, metric)
+        summary["candidates"] = [{k: v for k, v in r.items() if k != "path"} for r in results]
+        summary["fit_seconds"] = time.perf_counter() - start - streamed
+        if not results:
+            return summary
+
+        # the model in models/ now, scored on the same held-out rows
+        split = _load_split(workdir, counts, len(feature_names))
+        current = PredictiveMaintenance(machine_id)
+        current.load()
+        if current.is_fitted and current.feature_names == feature_names:
+            summary["current"] = evaluate(split["y_test"], current.predict_batch(split["X_test"]))
+        best = results[0]
+        if not publish:
+            return summary
+        if "current" in summary and _score(summary["current"], metric) > _score(best["evaluation"], metric) \
+                and not force:
+            print(f"Kept model v{current.version}: {metric} {summary['current'].get(metric)} beats the best "
+                  f"candidate's {best['evaluation'].get(metric)} (--force publishes anyway).")
+            return summary
+
+        winner = PredictiveMaintenance(machine_id, feature_names, best["params"])
+        winner.model = joblib.load(best["path"])
+        winner.export()
+        winner.is_fitted = True
+        winner.evaluation = best["evaluation"]
+        winner.version = current.version + 1
+        winner.save()
+        summary["published"] = {"version": winner.version, "path": winner.flat_path, "params": best["params"]}
+        print(f"Published model v{winner.version} {json.dumps(best['params'])} to {winner.flat_path} "
+              f"({metric} {best['evaluation'].get(metric)}).")
+        return summary
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--history", default=HISTORY, help="history CSV, or directory of columnar segments")
+    parser.add_argument("--machine-id", help="train models/<machine_id>/ on that machine's rows only")
+    parser.add_argument("--n-jobs", type=int, default=None, help="processes (default: all cores)")
+    parser.add_argument("--budget", type=float, default=BUDGET_SECONDS, help="seconds for fitting candidates")
+    parser.add_argument("--candidates", type=json.loads, default=CANDIDATES,
+                        help="JSON list of RandomForestClassifier settings")
+    parser.add_argument("--metric", default=METRIC,
+                        choices=["average_precision", "roc_auc", "f1", "precision", "recall", "accuracy", "log_loss"])
+    parser.add_argument("--features", choices=["all", "raw"], default="all",
+                        help="raw readings plus rolling stats (as the engine), or raw readings only")
+    parser.add_argument("--force", action="store_true", help="publish even if the saved model scores better")
+    parser.add_argument("--dry-run", action="store_true", help="evaluate without publishing")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+
+    summary = train(args.history, args.candidates, args.n_jobs, args.budget, args.metric,
+                    ALL_FEATURES if args.features == "all" else FEATURES, args.machine_id, args.force,
+                    not args.dry_run)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
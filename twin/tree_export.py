@@ -0,0 +1,255 @@
+import json
+import mmap
+import os
+
+import numpy as np
+
+
+def _average_path_length(n_samples_leaf):
+    # same formula as sklearn.ensemble._iforest._average_path_length
+    n = np.asarray(n_samples_leaf, dtype=np.float64)
+    out = np.zeros(n.shape)
+    mask_2 = n == 2
+    not_mask = n > 2
+    out[mask_2] = 1.0
+    out[not_mask] = (
+        2.0 * (np.log(n[not_mask] - 1.0) + np.euler_gamma)
+        - 2.0 * (n[not_mask] - 1.0) / n[not_mask]
+    )
+    return out
+
+
+def _flatten_trees(trees, leaf_values, feature_maps=None):
+    """Concatenate sklearn trees into one node table.
+
+    Leaves point to themselves on both sides so every row can be walked for
+    the same number of steps without branching on "is this a leaf".
+    """
+    features, thresholds, lefts, rights, missing_left, values, roots = [], [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for i, tree in enumerate(trees):
+        n = tree.node_count
+        idx = np.arange(n)
+        is_leaf = tree.children_left == -1
+
+        feature = tree.feature.astype(np.intp).copy()
+        feature[is_leaf] = 0
+        if feature_maps is not None:
+            feature = np.asarray(feature_maps[i], dtype=np.intp)[feature]
+
+        left = np.where(is_leaf, idx, tree.children_left) + offset
+        right = np.where(is_leaf, idx, tree.children_right) + offset
+        mgl = getattr(tree, "missing_go_to_left", None)
+        if mgl is None:
+            mgl = np.zeros(n, dtype=bool)
+
+        features.append(feature)
+        thresholds.append(tree.threshold)
+        lefts.append(left)
+        rights.append(right)
+        missing_left.append(np.asarray(mgl, dtype=bool))
+        values.append(leaf_values[i])
+        roots.append(offset)
+        offset += n
+        max_depth = max(max_depth, tree.max_depth)
+
+    return dict(
+        feature=np.ascontiguousarray(np.concatenate(features), dtype=np.intp),
+        threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+        left=np.ascontiguousarray(np.concatenate(lefts), dtype=np.intp),
+        right=np.ascontiguousarray(np.concatenate(rights), dtype=np.intp),
+        missing_left=np.ascontiguousarray(np.concatenate(missing_left)),
+        value=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+        roots=np.asarray(roots, dtype=np.intp),
+        max_depth=max_depth,
+    )
+
+
+class FlatTrees:
+    """Tree ensemble stored as contiguous node arrays, evaluated with NumPy."""
+
+    def __init__(self, feature, threshold, left, right, missing_left, value, roots, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def leaf_values(self, X):
+        """Per-tree leaf value for every row, shape (n_samples, n_trees)."""
+        # sklearn validates tree input as float32, so thresholds see the same values
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_samples, n_features = X.shape
+        n_trees = self.n_trees
+        flat_X = X.ravel()
+        row_base = np.repeat(np.arange(n_samples, dtype=np.intp) * n_features, n_trees)
+        nodes = np.tile(self.roots, n_samples)
+        check_nan = np.isnan(flat_X).any()
+
+        for _ in range(self.max_depth):
+            x = flat_X[row_base + self.feature[nodes]]
+            go_left = x <= self.threshold[nodes]
+            if check_nan:
+                go_left |= np.isnan(x) & self.missing_left[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        return self.value[nodes].reshape(n_samples, n_trees)
+
+    def _sum_trees(self, X):
+        leaves = self.leaf_values(X)
+        # cumsum adds tree by tree in the order sklearn does (np.sum would use
+        # pairwise summation), so the totals match bit for bit
+        return np.cumsum(leaves, axis=1)[:, -1]
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """Inverse of `to_arrays`; the arrays are used as-is (e.g. memory-mapped)."""
+        return cls(**arrays)
+
+    def save(self, path, meta=None):
+        save_arrays(path, self.to_arrays(), meta)
+
+    @classmethod
+    def load(cls, path):
+        """Returns (model, meta) for a file written by `save`."""
+        arrays, meta = load_arrays(path)
+        return cls.from_arrays(arrays), meta
+
+    def to_arrays(self):
+        return {
+            "feature": self.feature,
+            "threshold": self.threshold,
+            "left": self.left,
+            "right": self.right,
+            "missing_left": self.missing_left,
+            "value": self.value,
+            "roots": self.roots,
+            "max_depth": np.asarray(self.max_depth),
+        }
+
+
+class FlatForest(FlatTrees):
+    """Exported RandomForestClassifier; `predict_proba(X)` equals sklearn's `[:, positive_class]`."""
+
+    @classmethod
+    def from_sklearn(cls, model, positive_class=1):
+        classes = list(model.classes_)
+        trees = [est.tree_ for est in model.estimators_]
+        leaf_values = []
+        for tree in trees:
+            value = tree.value[:, 0, :].astype(np.float64)
+            normalizer = value.sum(axis=1)
+            normalizer[normalizer == 0.0] = 1.0
+            proba = value / normalizer[:, None]
+            if positive_class in classes:
+                leaf_values.append(proba[:, classes.index(positive_class)])
+            else:
+                leaf_values.append(np.zeros(tree.node_count))
+        return cls(**_flatten_trees(trees, leaf_values))
+
+    def predict_proba(self, X):
+        return self._sum_trees(X) / self.n_trees
+
+
+class FlatIsolationForest(FlatTrees):
+    """Exported IsolationForest; `predict(X)` equals sklearn's `predict(X) == -1`."""
+
+    def __init__(self, feature, threshold, left, right, missing_left, value, roots, max_depth,
+                 max_samples, offset):
+        super().__init__(feature, threshold, left, right, missing_left, value, roots, max_depth)
+        self.max_samples = int(max_samples)
+        self.offset = float(offset)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        trees = [est.tree_ for est in model.estimators_]
+        leaf_values = []
+        for tree in trees:
+            # depth of each node, root = 1, as in Tree.compute_node_depths
+            depth = np.zeros(tree.node_count, dtype=np.float64)
+            depth[0] = 1.0
+            for node in range(tree.node_count):
+                left, right = tree.children_left[node], tree.children_right[node]
+                if left != -1:
+                    depth[left] = depth[node] + 1.0
+                    depth[right] = depth[node] + 1.0
+            leaf_values.append(depth + _average_path_length(tree.n_node_samples) - 1.0)
+        arrays = _flatten_trees(trees, leaf_values, model.estimators_features_)
+        return cls(**arrays, max_samples=model.max_samples_, offset=model.offset_)
+
+    def score_samples(self, X):
+        depths = self._sum_trees(X)
+        denominator = self.n_trees * _average_path_length([self.max_samples])[0]
+        if denominator == 0:
+            scores = np.ones_like(depths)
+        else:
+            scores = 2 ** (-(depths / denominator))
+        return -scores
+
+    def predict(self, X):
+        return (self.score_samples(X) - self.offset) < 0
+
+    def to_arrays(self):
+        arrays = super().to_arrays()
+        arrays["max_samples"] = np.asarray(self.max_samples)
+        arrays["offset"] = np.asarray(self.offset)
+        return arrays
+
+
+_MAGIC = b"FLATTREE"
+_ALIGN = 64
+
+
+def save_arrays(path, arrays, meta=None):
+    """Write named arrays into one file that `load_arrays` can memory-map.
+
+    Layout: magic, header length, JSON header (dtype/shape/offset per array
+    plus `meta`), then each array's raw bytes at a 64-byte aligned offset.
+    Written to a temp file and renamed, so readers never see a partial file.
+    """
+    arrays = {name: np.asarray(a, order="C") for name, a in arrays.items()}
+    entries, offset = {}, 0
+    for name, a in arrays.items():
+        entries[name] = {"dtype": a.dtype.str, "shape": list(a.shape), "offset": offset}
+        offset += -(-a.nbytes // _ALIGN) * _ALIGN
+    header = json.dumps({"arrays": entries, "meta": meta or {}}).encode()
+    data_start = -(-(len(_MAGIC) + 8 + len(header)) // _ALIGN) * _ALIGN
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_MAGIC + len(header).to_bytes(8, "little") + header)
+        for name, a in arrays.items():
+            f.seek(data_start + entries[name]["offset"])
+            f.write(a.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp, path)
+
+
+def load_arrays(path):
+    """Map a file written by `save_arrays`; returns (arrays, meta).
+
+    Arrays are read-only views of one shared mapping, so processes loading
+    the same file share its pages instead of each holding a copy.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError(f"{path} is not a flat tree file")
+        header_len = int.from_bytes(f.read(8), "little")
+        header = json.loads(f.read(header_len))
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    data_start = -(-(len(_MAGIC) + 8 + header_len) // _ALIGN) * _ALIGN
+    arrays = {}
+    for name, entry in header["arrays"].items():
+        dtype = np.dtype(entry["dtype"])
+        count = int(np.prod(entry["shape"], dtype=np.int64))
+        a = np.frombuffer(buf, dtype=dtype, count=count, offset=data_start + entry["offset"])
+        arrays[name] = a.reshape(entry["shape"])
+    return arrays, header["meta"]
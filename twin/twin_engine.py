@@ -1,123 +1,358 @@
 # SmartFactory_DigitalTwin/twin/twin_engine.py
 import os
-import csv
 import time
+import atexit
+import asyncio
 import json
 import threading
 from datetime import datetime
 
+import numpy as np
 import paho.mqtt.client as mqtt
-import pandas as pd
 
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from anomaly_detector import AnomalyDetector
-from predictive_maintenance import PredictiveMaintenance
+from predictive_maintenance import FEATURES, PredictiveMaintenance
+from features import ALL_FEATURES, MachineFeatures
+from incremental_training import FleetTrainer, IncrementalTrainer
+from model_registry import ModelFileWatcher, ModelRegistry
+from fleet import DEFAULT_MACHINE_ID, MachineModels, ScorerPool, features_array, machine_id_from_topic, score_rows
+from storage import open_storage
+from pipeline import Pipeline
+from metrics import REGISTRY, RateLimitedLog, serve as serve_metrics
+from live_buffer import LiveRing
+from motor_state import MotorState
+from alerts import AlertManager
+from state_estimation import LEVELS, RESIDUALS
+from retention import Compactor
+import wire
 
 # CONFIG
 BROKER = "localhost"
-SENSOR_TOPIC = "factory/machine1/sensors"
+SENSOR_TOPIC = "factory/+/sensors"  # one topic per machine: factory/<machine_id>/sensors
+SENSOR_FORMATS = wire.FORMATS  # advertised to senders: JSON, and binary batches (wire.py) of any machines
 DATA_CSV = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "machine_live.csv")
 RETRAIN_INTERVAL_SECONDS = 60  # retrain predictor every 60s (adjustable)
+RETRAIN_MODE = "incremental"  # "incremental" (new rows + warm start), "full" (re-read whole history) or "offline"
+# ("offline": no training here, the model twin/train.py publishes to models/ is picked up every interval)
+RETRAIN_WINDOW_ROWS = 20000  # incremental mode: sliding training window kept in memory
+RETRAIN_TREES_PER_UPDATE = 10  # incremental mode: trees added per cycle (oldest dropped past 50)
+BATCH_MAX_ROWS = 64  # score at most this many readings per model call
+BATCH_MAX_WAIT_MS = 50  # latency bound: flush a partial batch after this long
+PIPELINE_QUEUE_SIZE = 10000  # per-stage queue bound; a full receive queue drops (and counts) messages
+PIPELINE_STATS_SECONDS = 60  # print per-stage counters this often
+STORAGE_BACKEND = "csv"  # "csv", or "parquet" / "arrow" hourly segments (needs pyarrow)
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "machine_live")  # columnar backends
+STORAGE_FLUSH_ROWS = 256  # write buffered rows once this many are pending ...
+STORAGE_FLUSH_SECONDS = 1.0  # ... or once the oldest has waited this long
+STORAGE_FSYNC = "never"  # "never", "flush" (fsync each batch write) or "always" (every row)
+FLEET_WORKERS = 0  # scorer processes (machines hashed to shards); 0 scores in the engine process
+PER_MACHINE_MODELS = False  # retrain one model per machine into models/<machine_id>/
+MODEL_RELOAD_SECONDS = 5.0  # how often scorers check model files for changes
+PREDICTOR_FEATURES = ALL_FEATURES  # raw readings plus rolling window stats (features.py); FEATURES for raw only
+ANOMALY_MODE = "iforest"  # "iforest" (fleet-wide batch model) or "online" (per-machine streaming Mahalanobis)
+ANOMALY_BOOTSTRAP = False  # online mode: fit each machine's detector on the stored history at startup
+STATE_ESTIMATION = True  # Kalman-filter every machine's readings (state_estimation.py): rows get filtered values,
+# residuals, the innovation NIS and `gated` (not absorbed by the filter); a NIS far past the gate is an anomaly
+STATE_NOISE_MODEL = "machine_sensor_sim"  # NOISE_MODELS entry of the sensors feeding the engine
+STATE_NOISE_BY_MACHINE = {}  # machine_id -> NOISE_MODELS entry, for machines fed by another source
+METRICS_PORT = 9108  # counters and histograms at http://127.0.0.1:<port>/metrics (and /latest); None disables both
+LIVE_RING_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "live.ring")  # read by the dashboard
+LIVE_RING_ROWS = 65536  # latest scored rows kept in the shared ring (112 bytes each)
+MOTOR_STATE_DB = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "motor_state.db")  # set by the dashboard
+LOG_INTERVAL_SECONDS = 1.0  # status lines: at most one per interval for normal readings, one for anomalies
+ALERT_ON_RISK = 0.6  # an alert episode opens on an anomaly or a risk above this ...
+ALERT_OFF_RISK = 0.4  # ... and closes after ALERT_CLEAR_READINGS readings in a row below this, with no anomaly
+ALERT_CLEAR_READINGS = 5
+ALERT_DEDUP_SECONDS = 60.0  # an open episode is re-announced ("updated") at most this often
+ALERT_SUMMARY_SECONDS = 5.0  # episode events are published together, one summary message per interval
+ALERT_STALE_SECONDS = 300.0  # an open episode of a machine silent this long is closed (checked every summary interval)
+RAW_RETENTION_SECONDS = 24 * 3600  # csv backend: raw rows kept this long, then folded into minute/hour rollups
+# (full retrains learn from the raw rows only, so this is also their training window)
+MINUTE_RETENTION_SECONDS = 30 * 86400  # minute rollups kept this long (hour rollups are kept); None keeps them
+COMPACT_INTERVAL_SECONDS = 600  # how often expired raw rows are compacted (retention.py); None disables it
 
-# ensure data folder exists and csv header present
-os.makedirs(os.path.dirname(DATA_CSV), exist_ok=True)
-if not os.path.exists(DATA_CSV):
-    with open(DATA_CSV, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["timestamp", "temperature", "vibration", "rpm", "current", "load", "anomaly", "risk_score"])
+# history storage (creates the data folder / csv header if missing)
+storage = open_storage(
+    STORAGE_BACKEND, DATA_CSV if STORAGE_BACKEND == "csv" else DATA_DIR,
+    flush_rows=STORAGE_FLUSH_ROWS, flush_seconds=STORAGE_FLUSH_SECONDS, fsync=STORAGE_FSYNC,
+)
+atexit.register(storage.close)
+live = LiveRing(LIVE_RING_FILE, LIVE_RING_ROWS, create=True)  # memory-mapped, so readers see rows as they land
+motor = MotorState(MOTOR_STATE_DB)  # the dashboard's motor controls, shared through SQLite
 
 # instantiate models
 anomaly_detector = AnomalyDetector()
-predictor = PredictiveMaintenance()
+anomaly_detector.load()  # saved models are memory-mapped; sklearn is only imported to retrain
+predictor = PredictiveMaintenance(feature_names=PREDICTOR_FEATURES)
+predictor.load()  # continue from the last saved model, if any
+registry = ModelRegistry(predictor)  # live predictor; retraining publishes new versions here
+state_settings = {"noise_model": STATE_NOISE_MODEL, "machine_noise": STATE_NOISE_BY_MACHINE} \
+    if STATE_ESTIMATION else None  # FleetKalman settings for the scorers
+machine_models = MachineModels(shared=lambda: (anomaly_detector, registry.current().model),
+                               reload_seconds=MODEL_RELOAD_SECONDS, online_anomaly=ANOMALY_MODE == "online",
+                               state_estimation=state_settings)
+atexit.register(machine_models.save_online)  # online detectors continue where they stopped
+pipeline = None
+scorer_pool = None
+retrain_stats = {}  # last retrain cycle: wall time, rows consumed, ...
 
-# helper: append row to csv
+# instrumentation (metrics.py); pipeline stages and queues are exported by the Pipeline itself
+score_seconds = {name: REGISTRY.histogram("twin_score_seconds", "Model time per scored batch", {"model": name})
+                 for name in ("anomaly", "risk", "state")}
+retrain_seconds = REGISTRY.histogram("twin_retrain_seconds", "Retrain cycle duration")
+alert_manager = AlertManager(ALERT_ON_RISK, ALERT_OFF_RISK, ALERT_CLEAR_READINGS, ALERT_DEDUP_SECONDS,
+                             ALERT_SUMMARY_SECONDS, ALERT_STALE_SECONDS,
+                             metrics=REGISTRY)  # counts emitted and suppressed alerts
+REGISTRY.gauge("twin_model_version", "Version of the live predictor", fn=lambda: registry.current().version)
+REGISTRY.gauge("twin_motor_running", "1 while the dashboard has the motor started", fn=lambda: int(motor.get()["running"]))
+REGISTRY.gauge("twin_motor_target_rpm", "Target RPM set on the dashboard", fn=lambda: motor.get()["target_rpm"])
+status_log = RateLimitedLog(LOG_INTERVAL_SECONDS)
+anomaly_log = RateLimitedLog(LOG_INTERVAL_SECONDS)
+
+# helper: append row to history (buffered, see storage.py)
 def append_row(row_dict):
-    with open(DATA_CSV, "a", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            row_dict.get("timestamp"),
-            row_dict.get("temperature"),
-            row_dict.get("vibration"),
-            row_dict.get("rpm"),
-            row_dict.get("current"),
-            row_dict.get("load"),
-            row_dict.get("anomaly"),
-            row_dict.get("risk_score"),
-        ])
+    storage.append(row_dict)
+
+# GET /latest?machine_id=<id> on the metrics port: the newest stored row, for the 3D view
+def latest_row(params):
+    if getattr(storage, "index", None) is None:
+        return None
+    df = storage.index.last(1, params.get("machine_id"))
+    if not len(df):
+        return None
+    return "application/json", df.to_json(orient="records")[1:-1].encode()
 
 # periodic retrain thread
+def retrain_full():
+    start = time.perf_counter()
+    # raw rows only: rolling windows and labels over minute/hour means would not match what is scored live
+    df = storage.read()
+    success = False
+    if len(df) >= 30:  # need at least 30 points to train
+        df = MachineFeatures().transform_frame(df, DEFAULT_MACHINE_ID)  # replay history through the rolling features
+        candidate = PredictiveMaintenance(feature_names=PREDICTOR_FEATURES)
+        success = candidate.train(df, save=False)
+        if success:
+            registry.publish(candidate)
+            candidate.save()
+    current = registry.current()
+    return {
+        "rows_consumed": len(df),
+        "rows_trained": len(df) if success else 0,
+        "window_rows": len(df),
+        "trees": len(getattr(current.model.model, "estimators_", [])),
+        "trained": success,
+        "version": current.version,
+        "seconds": time.perf_counter() - start,
+    }
+
+def bootstrap_online_anomaly():
+    # fit every machine's online detector on its stored history; scorers load the saved state
+    start = time.perf_counter()
+    df = storage.read()
+    if not len(df):
+        return
+    machine_ids = df["machine_id"].fillna(DEFAULT_MACHINE_ID).astype(str) if "machine_id" in df \
+        else [DEFAULT_MACHINE_ID] * len(df)
+    for machine_id, part in df.groupby(machine_ids, sort=False):
+        detector = AnomalyDetector(machine_id, mode="online")
+        detector.fit(part[FEATURES].astype(float).fillna(0).values)
+        detector.save()
+    print(f"[{datetime.now()}] Online anomaly detectors bootstrapped from {len(df)} rows "
+          f"in {time.perf_counter() - start:.2f}s.")
+
 def retrain_loop():
+    trainer = None
+    if RETRAIN_MODE == "incremental" and PER_MACHINE_MODELS:
+        trainer = FleetTrainer(lambda machine_id: PredictiveMaintenance(machine_id, PREDICTOR_FEATURES),
+                               storage.tail(), window_rows=RETRAIN_WINDOW_ROWS,
+                               trees_per_update=RETRAIN_TREES_PER_UPDATE)
+    elif RETRAIN_MODE == "offline":
+        trainer = ModelFileWatcher(registry, lambda: PredictiveMaintenance(feature_names=PREDICTOR_FEATURES))
+    elif RETRAIN_MODE == "incremental":
+        # start from the rows the window can hold (located through the history index), not the top of the file
+        trainer = IncrementalTrainer(registry, storage.tail(last_rows=RETRAIN_WINDOW_ROWS), RETRAIN_WINDOW_ROWS,
+                                     RETRAIN_TREES_PER_UPDATE)
     while True:
         try:
-            df = pd.read_csv(DATA_CSV)
-            success = False
-            if len(df) >= 30:  # need at least 30 points to train
-                success = predictor.train(df)
-            if success:
-                print(f"[{datetime.now()}] Predictor retrained on {len(df)} samples.")
-            else:
-                print(f"[{datetime.now()}] Not enough data to retrain (have {len(df)} rows).")
+            stats = trainer.step() if trainer is not None else retrain_full()
+            retrain_stats.update(stats)
+            retrain_seconds.observe(stats["seconds"])
+            if stats.get("loaded"):
+                evaluation = registry.current().model.evaluation or {}
+                print(f"[{datetime.now()}] Model v{stats['version']} trained offline is live ({stats['trees']} trees, "
+                      f"held-out f1 {evaluation.get('f1')}, average precision {evaluation.get('average_precision')}).")
+            elif stats["trained"]:
+                print(f"[{datetime.now()}] Predictor retrained on {stats['rows_trained']} samples "
+                      f"({stats['rows_consumed']} new rows, {stats['trees']} trees) in {stats['seconds']:.3f}s.")
+                if "version" in stats:
+                    retired = registry.history()[-2]
+                    print(f"[{datetime.now()}] Model v{stats['version']} live; v{retired['version']} retired after "
+                          f"{retired['served_seconds']:.1f}s and {retired['rows_scored']} rows.")
+            elif RETRAIN_MODE != "offline":
+                print(f"[{datetime.now()}] Not enough data to retrain (read {stats['rows_consumed']} rows "
+                      f"in {stats['seconds']:.3f}s, window {stats['window_rows']}).")
         except Exception as e:
             print("Retrain loop error:", e)
         time.sleep(RETRAIN_INTERVAL_SECONDS)
 
+# periodic compaction thread: raw rows past the retention window -> minute and hour rollups
+def compaction_loop():
+    compactor = Compactor(storage, RAW_RETENTION_SECONDS, MINUTE_RETENTION_SECONDS, DEFAULT_MACHINE_ID)
+    atexit.register(compactor.close)
+    while True:
+        try:
+            stats = compactor.run()
+            freed = (stats["raw_bytes_removed"] + stats["rollup_bytes_removed"]) / 2 ** 20
+            if stats["rows"] or freed:
+                print(f"[{datetime.now()}] Compacted {stats['rows']} raw rows into {stats['buckets_1m']} minute and "
+                      f"{stats['buckets_1h']} hour buckets, freed {freed:.1f} MB in {stats['seconds']:.1f}s.")
+        except Exception as e:
+            print("Compaction error:", e)
+        time.sleep(COMPACT_INTERVAL_SECONDS)
+
 # MQTT callbacks
 def on_connect(client, userdata, flags, rc):
     print("Connected to MQTT broker, subscribing to", SENSOR_TOPIC)
     client.subscribe(SENSOR_TOPIC)
+    wire.advertise(client, SENSOR_FORMATS)
 
 def on_message(client, userdata, msg):
-    try:
-        payload = msg.payload.decode()
-        data = json.loads(payload)
-        data_row = {
-            "timestamp": datetime.utcnow().isoformat(),
-            "temperature": float(data.get("temperature", None)),
-            "vibration": float(data.get("vibration", None)),
-            "rpm": int(data.get("rpm", 0)),
-            "current": float(data.get("current", None)),
-            "load": int(data.get("load", 0)),
-        }
-
-        # anomaly detection
-        is_anom = anomaly_detector.is_anomaly([[data_row["temperature"], data_row["vibration"], data_row["rpm"], data_row["current"], data_row["load"]]])
-        data_row["anomaly"] = bool(is_anom[0])
-
-        # risk prediction (0.0 - 1.0)
-        risk = predictor.predict_single(data_row)
+    # runs on the paho network thread: hand off and return immediately
+    pipeline.receive(msg.topic, msg.payload)
+
+# pipeline stage: decode one message into a reading (JSON) or many (binary batch)
+def parse_message(topic, payload, received_at):
+    if wire.is_batch(payload):
+        return wire.to_rows(wire.decode(payload), machine_id_from_topic(topic),
+                            timestamp=datetime.utcnow().isoformat(), received_at=received_at)
+    data = json.loads(payload.decode())
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "received_at": received_at,
+        "machine_id": machine_id_from_topic(topic),
+        "temperature": float(data.get("temperature", None)),
+        "vibration": float(data.get("vibration", None)),
+        "rpm": int(data.get("rpm", 0)),
+        "current": float(data.get("current", None)),
+        "load": int(data.get("load", 0)),
+    }
+
+# pipeline stage: score a micro-batch of readings, in the scorer pool or in this process
+def score_batch(rows):
+    X = features_array(rows)
+    times = np.array([r["received_at"] for r in rows])  # the state estimate's clock
+    if scorer_pool is not None:
+        scorer_pool.submit(rows, X, times)  # results come back through pipeline.push_scored
+        return None
+
+    # state estimation, anomaly detection and risk prediction (0.0 - 1.0), grouped by machine model
+    timings, estimates = {}, {}
+    is_anom, risks, versions = score_rows(machine_models, [r["machine_id"] for r in rows], X, timings, times,
+                                          estimates)
+    observe_timings(timings)
+    return apply_scores(rows, is_anom, risks, versions, estimates)
+
+def observe_timings(timings):
+    for name, seconds in timings.items():
+        score_seconds[name].observe(seconds)
+
+def apply_scores(rows, is_anom, risks, versions, estimates=None):
+    for data_row, anom, risk, version in zip(rows, is_anom, risks, versions):
+        data_row["anomaly"] = bool(anom)
         data_row["risk_score"] = float(risk)
+        data_row["model_version"] = version
+    if estimates:
+        # filtered levels, residuals, NIS and gate for the live ring; the history CSV keeps the raw readings
+        filtered, residual, nis, gated = (estimates[k].tolist() for k in ("filtered", "residual", "nis", "gated"))
+        for data_row, levels, residuals, row_nis, row_gated in zip(rows, filtered, residual, nis, gated):
+            data_row.update(zip(LEVELS, levels))
+            data_row.update(zip(RESIDUALS, residuals))
+            data_row["innovation"] = row_nis
+            data_row["gated"] = row_gated
+    if not PER_MACHINE_MODELS:
+        registry.record_scored(versions)
+    return rows
+
+# pipeline stage: persist the whole batch in one buffered write, and share it with the dashboard
+def persist_rows(rows):
+    storage.append_many(rows)
+    live.write(rows)
 
-        # append to CSV
-        append_row(data_row)
+def status_line(data_row):
+    return (f"Twin Updated [{data_row['machine_id']}]: T={data_row['temperature']}C V={data_row['vibration']}mm/s "
+            f"RPM={data_row['rpm']} Risk={data_row['risk_score']:.2f}")
 
-        # print status
-        status = f"Twin Updated: T={data_row['temperature']}C V={data_row['vibration']}mm/s RPM={data_row['rpm']} Risk={risk:.2f}"
+# pipeline stage: console status and alert episodes (alerts.py)
+def publish_alerts(client, rows):
+    for data_row in rows:
+        # print status, rate limited: formatting and printing every message costs more than scoring it
         if data_row["anomaly"]:
-            status += "  ⚠️ ANOMALY"
-        print(status)
+            anomaly_log.log(lambda: status_line(data_row) + "  ⚠️ ANOMALY")
+        else:
+            status_log.log(lambda: status_line(data_row))
 
-        # optional: publish alerts (example topic)
-        if data_row["anomaly"] or risk > 0.6:
-            alert = {"timestamp": data_row["timestamp"], "anomaly": data_row["anomaly"], "risk_score": data_row["risk_score"]}
-            client.publish("factory/machine1/alerts", json.dumps(alert))
+    # episodes open, update and close here; their events go out batched on factory/fleet/alerts
+    alert_manager.observe(rows)
+    alert_manager.flush(client.publish)
 
-    except Exception as e:
-        print("Error handling message:", e)
+async def flush_alerts(client):
+    # a summary still goes out, and stale episodes close, when readings stop arriving
+    while True:
+        await asyncio.sleep(ALERT_SUMMARY_SECONDS)
+        alert_manager.flush(client.publish)
 
-def main():
-    # start retrain thread
-    t = threading.Thread(target=retrain_loop, daemon=True)
-    t.start()
+async def report_pipeline_stats():
+    while True:
+        await asyncio.sleep(PIPELINE_STATS_SECONDS)
+        print(f"[{datetime.now()}] Pipeline stats: {json.dumps(pipeline.snapshot())}")
 
-    client = mqtt.Client()
+async def run_engine(client):
     client.on_connect = on_connect
     client.on_message = on_message
     client.connect(BROKER, 1883, 60)
+    client.loop_start()  # MQTT network I/O on its own thread, feeding pipeline.receive
     print("Digital Twin Engine running...")
-    client.loop_forever()
+    stats_task = asyncio.create_task(report_pipeline_stats())
+    alerts_task = asyncio.create_task(flush_alerts(client))
+    try:
+        await pipeline.run()
+    finally:
+        stats_task.cancel()
+        alerts_task.cancel()
+        client.loop_stop()
+
+def main():
+    global pipeline, scorer_pool
+    client = mqtt.Client()
+    pipeline = Pipeline(
+        parse_message, score_batch, persist_rows, lambda rows: publish_alerts(client, rows),
+        PIPELINE_QUEUE_SIZE, BATCH_MAX_ROWS, BATCH_MAX_WAIT_MS, metrics=REGISTRY,
+    )
+    if METRICS_PORT:
+        serve_metrics(METRICS_PORT, routes={"/latest": latest_row})
+        print(f"Metrics on http://127.0.0.1:{METRICS_PORT}/metrics, latest row on /latest")
+
+    if ANOMALY_MODE == "online" and ANOMALY_BOOTSTRAP:
+        bootstrap_online_anomaly()
+
+    # fork scorer workers before the retrain and MQTT threads start
+    if FLEET_WORKERS > 0:
+        scorer_pool = ScorerPool(FLEET_WORKERS, lambda rows, a, r, v, e: pipeline.push_scored(apply_scores(rows, a, r, v, e)),
+                                 MODEL_RELOAD_SECONDS, online_anomaly=ANOMALY_MODE == "online",
+                                 on_timings=observe_timings, state_estimation=state_settings)
+
+    # start retrain thread
+    t = threading.Thread(target=retrain_loop, daemon=True)
+    t.start()
+    if STORAGE_BACKEND == "csv" and COMPACT_INTERVAL_SECONDS:
+        threading.Thread(target=compaction_loop, daemon=True).start()
+
+    asyncio.run(run_engine(client))
 
 if __name__ == "__main__":
     main()
@@ -1,95 +1,131 @@
 import os
-import csv
 import time
+import atexit
 import json
 import threading
 from datetime import datetime
-import pandas as pd
 
 from anomaly_detector import AnomalyDetector
-from predictive_maintenance import PredictiveMaintenance
+from predictive_maintenance import FEATURES, PredictiveMaintenance
+from features import ALL_FEATURES, MachineFeatures
+from storage import open_storage
+from fleet import DEFAULT_MACHINE_ID
+from spool import DirectoryWatcher, SpoolReader
+from metrics import RateLimitedLog
+from live_buffer import LiveRing
 
 # CONFIG
 SENSOR_FILE = os.path.join("..", "data", "sensor_data.json")
+SPOOL_DIR = os.path.join("..", "data", "spool")
+INGEST_MODE = "spool"  # "spool": JSON-lines spool, woken by inotify (polling elsewhere); "poll": legacy SENSOR_FILE
 DATA_CSV = os.path.join("..", "data", "machine_live.csv")
+DATA_DIR = os.path.join("..", "data", "machine_live")  # "parquet" / "arrow" backends
+STORAGE_BACKEND = "csv"
+STORAGE_FLUSH_ROWS = 256
+STORAGE_FLUSH_SECONDS = 1.0
+STORAGE_FSYNC = "never"
+LIVE_RING_FILE = os.path.join("..", "data", "live.ring")  # latest rows for the dashboard
+LIVE_RING_ROWS = 65536
+LOG_INTERVAL_SECONDS = 1.0  # status lines: at most one per interval (anomalies counted separately)
 
-# Create directories
-os.makedirs(os.path.dirname(DATA_CSV), exist_ok=True)
-
-# Initialize CSV with headers
-if not os.path.exists(DATA_CSV):
-    with open(DATA_CSV, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["timestamp", "temperature", "vibration", "rpm", "current", "load", "anomaly", "risk_score"])
+# Open history storage (creates directories and CSV header)
+storage = open_storage(
+    STORAGE_BACKEND, DATA_CSV if STORAGE_BACKEND == "csv" else DATA_DIR,
+    flush_rows=STORAGE_FLUSH_ROWS, flush_seconds=STORAGE_FLUSH_SECONDS, fsync=STORAGE_FSYNC,
+)
+atexit.register(storage.close)
+live = LiveRing(LIVE_RING_FILE, LIVE_RING_ROWS, create=True)
 
 # Initialize models
 anomaly_detector = AnomalyDetector()
-predictor = PredictiveMaintenance()
+predictor = PredictiveMaintenance(feature_names=ALL_FEATURES)
+rolling = MachineFeatures()
+status_log = RateLimitedLog(LOG_INTERVAL_SECONDS)
+anomaly_log = RateLimitedLog(LOG_INTERVAL_SECONDS)
 
 def append_row(row_dict):
-    with open(DATA_CSV, "a", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            row_dict.get("timestamp"),
-            row_dict.get("temperature"),
-            row_dict.get("vibration"),
-            row_dict.get("rpm"),
-            row_dict.get("current"),
-            row_dict.get("load"),
-            row_dict.get("anomaly"),
-            row_dict.get("risk_score"),
-        ])
+    storage.append(row_dict)
+
+def process_reading(data):
+    data_row = {
+        "timestamp": data["timestamp"],
+        "machine_id": data.get("machine_id", DEFAULT_MACHINE_ID),
+        "temperature": float(data["temperature"]),
+        "vibration": float(data["vibration"]),
+        "rpm": int(data["rpm"]),
+        "current": float(data["current"]),
+        "load": int(data["load"]),
+    }
+
+    # Anomaly detection
+    features = [[data_row["temperature"], data_row["vibration"], data_row["rpm"], data_row["current"], data_row["load"]]]
+    is_anom = anomaly_detector.is_anomaly(features)
+    data_row["anomaly"] = bool(is_anom[0]) if is_anom else False
+
+    # Risk prediction (on the readings plus this machine's rolling features)
+    values = rolling.get(data_row["machine_id"]).update([data_row[f] for f in FEATURES])
+    risk = predictor.predict_single(dict(zip(ALL_FEATURES, values)))
+    data_row["risk_score"] = float(risk)
+
+    # Save to history
+    append_row(data_row)
+    live.write([data_row])
+
+    # Print status (rate limited, a spool backlog can hold thousands of readings)
+    status = lambda: f"Twin Updated: T={data_row['temperature']}°C V={data_row['vibration']}mm/s RPM={data_row['rpm']} Risk={risk:.2f}"
+    if data_row["anomaly"]:
+        anomaly_log.log(lambda: status() + "  ⚠️ ANOMALY")
+    else:
+        status_log.log(status)
 
 def process_sensor_data():
+    # legacy mode: poll a single JSON file that the simulator overwrites (readings between polls are lost)
     last_modified = 0
-    
+
     while True:
         try:
             if os.path.exists(SENSOR_FILE):
                 current_modified = os.path.getmtime(SENSOR_FILE)
-                
+
                 if current_modified > last_modified:
                     with open(SENSOR_FILE, 'r') as f:
                         data = json.load(f)
-                    
-                    # Process data
-                    data_row = {
-                        "timestamp": data["timestamp"],
-                        "temperature": float(data["temperature"]),
-                        "vibration": float(data["vibration"]),
-                        "rpm": int(data["rpm"]),
-                        "current": float(data["current"]),
-                        "load": int(data["load"]),
-                    }
-                    
-                    # Anomaly detection
-                    features = [[data_row["temperature"], data_row["vibration"], data_row["rpm"], data_row["current"], data_row["load"]]]
-                    is_anom = anomaly_detector.is_anomaly(features)
-                    data_row["anomaly"] = bool(is_anom[0]) if is_anom else False
-                    
-                    # Risk prediction
-                    risk = predictor.predict_single(data_row)
-                    data_row["risk_score"] = float(risk)
-                    
-                    # Save to CSV
-                    append_row(data_row)
-                    
-                    # Print status
-                    status = f"Twin Updated: T={data_row['temperature']}°C V={data_row['vibration']}mm/s RPM={data_row['rpm']} Risk={risk:.2f}"
-                    if data_row["anomaly"]:
-                        status += "  ⚠️ ANOMALY"
-                    print(status)
-                    
+                    process_reading(data)
                     last_modified = current_modified
-                    
+
         except Exception as e:
             print("Error processing data:", e)
-        
+
         time.sleep(1)
 
+def process_spool():
+    reader = SpoolReader(SPOOL_DIR)
+    watcher = DirectoryWatcher(SPOOL_DIR)
+    print(f"Consuming spool {SPOOL_DIR} ({watcher.mode})")
+
+    while True:
+        try:
+            readings = reader.read_new()
+            for data in readings:
+                try:
+                    process_reading(data)
+                except Exception as e:
+                    print("Error processing data:", e)
+            if readings:
+                # rows are in storage before the offset moves past them
+                storage.flush()
+                reader.commit()
+        except Exception as e:
+            print("Error reading spool:", e)
+
+        watcher.wait(timeout=1.0)
+
 def main():
     print("Digital Twin Engine (File-based) running...")
-    process_sensor_data()
+    if INGEST_MODE == "spool":
+        process_spool()
+    else:
+        process_sensor_data()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
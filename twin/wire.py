@@ -0,0 +1,103 @@
+import json
+import threading
+from itertools import repeat
+
+import numpy as np
+
+MAGIC = b"TWB1"  # JSON payloads start with "{", so the first bytes tell the formats apart
+HEADER = np.dtype([("magic", "S4"), ("count", "<u4")])
+READING = np.dtype([
+    ("time", "<f8"),  # sender's epoch seconds
+    ("machine_id", "S32"),  # empty: the machine in the topic
+    ("temperature", "<f4"), ("vibration", "<f4"), ("current", "<f4"),
+    ("rpm", "<u2"), ("load", "<u2"),
+])  # packed little-endian, 56 bytes per reading
+FIELDS = ("temperature", "vibration", "rpm", "current", "load")  # in the engine's row order
+INTS = ("rpm", "load")
+MIN_BINARY_BATCH = 2  # "auto" sends binary from this many readings per message; one parses no faster than JSON
+SMALL_BATCH = 16  # up to this many readings, converting record by record beats column-wise numpy calls
+DECIMALS = 3  # float32 keeps ~7 significant digits; rounding drops the noise it adds to 2-decimal readings
+FORMATS = ("json", "binary")
+FORMATS_TOPIC = "factory/engine/formats"  # retained by the engine: the payload formats it accepts
+BATCH_TOPIC = "factory/fleet/sensors"  # batches of many machines (matches factory/+/sensors)
+
+
+def records(n):
+    return np.zeros(n, READING)
+
+
+def encode(batch):
+    """One message carrying every reading in the READING array `batch`."""
+    header = np.array([(MAGIC, len(batch))], HEADER)
+    return header.tobytes() + np.ascontiguousarray(batch, READING).tobytes()
+
+
+def is_batch(payload):
+    return payload[:4] == MAGIC
+
+
+def decode(payload):
+    """READING array viewing the payload's bytes (read-only, no copy)."""
+    header = np.frombuffer(payload, HEADER, 1)[0]
+    if header["magic"] != MAGIC:
+        raise ValueError("not a binary sensor batch")
+    count = int(header["count"])
+    if len(payload) != HEADER.itemsize + count * READING.itemsize:
+        raise ValueError(f"binary batch of {count} readings has {len(payload)} bytes")
+    return np.frombuffer(payload, READING, count, HEADER.itemsize)
+
+
+def to_rows(batch, default_machine_id, **common):
+    """Reading dicts for the rest of the engine, built column by column."""
+    if len(batch) <= SMALL_BATCH:
+        return [_row(record, default_machine_id, common) for record in batch.tolist()]
+    ids = batch["machine_id"]
+    if (ids == b"").any():
+        ids = np.where(ids == b"", default_machine_id.encode(), ids)
+    columns = {name: repeat(value) for name, value in common.items()}
+    columns["machine_id"] = ids.astype("U32").tolist()
+    for name in FIELDS:
+        column = batch[name] if name in INTS else batch[name].astype(np.float64).round(DECIMALS)
+        columns[name] = column.tolist()
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+def _row(record, default_machine_id, common):
+    _, machine_id, temperature, vibration, current, rpm, load = record  # READING order
+    row = dict(common)
+    row.update(machine_id=machine_id.decode() or default_machine_id, temperature=round(temperature, DECIMALS),
+               vibration=round(vibration, DECIMALS), rpm=rpm, current=round(current, DECIMALS), load=load)
+    return row
+
+
+def advertise(client, formats=FORMATS):
+    """Publish (retained) the formats this engine accepts."""
+    client.publish(FORMATS_TOPIC, json.dumps({"formats": list(formats)}), retain=True)
+
+
+def negotiate(client, wanted="auto", timeout=2.0, batch_size=1):
+    """The format to send: `wanted`, or for "auto" binary if the engine advertises it and messages
+    carry at least MIN_BINARY_BATCH readings (`batch_size`), else JSON.
+
+    `client` must be connected with its network loop running."""
+    if wanted != "auto":
+        return wanted
+    if batch_size < MIN_BINARY_BATCH:
+        return "json"
+    received = threading.Event()
+    formats = []
+
+    def on_formats(client, userdata, msg):
+        try:
+            formats.extend(json.loads(msg.payload).get("formats", []))
+        except ValueError:
+            pass
+        received.set()
+
+    client.message_callback_add(FORMATS_TOPIC, on_formats)
+    client.subscribe(FORMATS_TOPIC)
+    received.wait(timeout)
+    client.unsubscribe(FORMATS_TOPIC)
+    client.message_callback_remove(FORMATS_TOPIC)
+    return "binary" if "binary" in formats else "json"